@@ -5,13 +5,23 @@ DBC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dbc')
 # -I include path for e.g. "#include <opendbc/safety/safety.h>"
 INCLUDE_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../"))
 
-_generated_dbc_cache: dict[str, str] | None = None
+_generated_dbc_cache: dict[str, str | None] = {}
+_generated_all_dbcs = False
+
+def get_generated_dbc(name: str) -> str | None:
+  """Lazily generate a single *_generated DBC in memory, memoized per name.
+  Returns None if name isn't a generated DBC."""
+  if name not in _generated_dbc_cache:
+    from opendbc.dbc.generator.generator import generate_dbc
+    _generated_dbc_cache[name] = generate_dbc(name)
+  return _generated_dbc_cache[name]
 
 def get_generated_dbcs() -> dict[str, str]:
-  """Lazily generate all *_generated DBC content in memory.
+  """Generate all *_generated DBC content in memory.
   Returns {name: content} where name has no .dbc extension."""
-  global _generated_dbc_cache
-  if _generated_dbc_cache is None:
+  global _generated_all_dbcs
+  if not _generated_all_dbcs:
     from opendbc.dbc.generator.generator import generate_all
-    _generated_dbc_cache = generate_all()
-  return _generated_dbc_cache
+    _generated_dbc_cache.update(generate_all())
+    _generated_all_dbcs = True
+  return {name: content for name, content in _generated_dbc_cache.items() if content is not None}
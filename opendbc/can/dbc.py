@@ -1,22 +1,29 @@
-import re
+import contextlib
+import hashlib
 import os
+import pickle
+import re
+import tempfile
 from collections.abc import Callable
 from dataclasses import dataclass
 from functools import cache
 
-from opendbc import DBC_PATH, get_generated_dbcs
+import numpy as np
+
+from opendbc import DBC_PATH, get_generated_dbc
+from opendbc.car.carlog import carlog
 
 # TODO: these should just be passed in along with the DBC file
-from opendbc.car.honda.hondacan import honda_checksum
-from opendbc.car.toyota.toyotacan import toyota_checksum
-from opendbc.car.subaru.subarucan import subaru_checksum
-from opendbc.car.chrysler.chryslercan import chrysler_checksum, fca_giorgio_checksum
-from opendbc.car.hyundai.hyundaicanfd import hkg_can_fd_checksum
-from opendbc.car.volkswagen.mlbcan import volkswagen_mlb_checksum
-from opendbc.car.volkswagen.mqbcan import volkswagen_mqb_meb_checksum, xor_checksum
-from opendbc.car.tesla.teslacan import tesla_checksum
-from opendbc.car.body.bodycan import body_checksum
-from opendbc.car.psa.psacan import psa_checksum
+from opendbc.car.honda.hondacan import honda_checksum, honda_checksum_batch
+from opendbc.car.toyota.toyotacan import toyota_checksum, toyota_checksum_batch
+from opendbc.car.subaru.subarucan import subaru_checksum, subaru_checksum_batch
+from opendbc.car.chrysler.chryslercan import chrysler_checksum, chrysler_checksum_batch, fca_giorgio_checksum, fca_giorgio_checksum_batch
+from opendbc.car.hyundai.hyundaicanfd import hkg_can_fd_checksum, hkg_can_fd_checksum_batch
+from opendbc.car.volkswagen.mlbcan import volkswagen_mlb_checksum, volkswagen_mlb_checksum_batch
+from opendbc.car.volkswagen.mqbcan import volkswagen_mqb_meb_checksum, volkswagen_mqb_meb_checksum_batch, xor_checksum, xor_checksum_batch
+from opendbc.car.tesla.teslacan import tesla_checksum, tesla_checksum_batch
+from opendbc.car.body.bodycan import body_checksum, body_checksum_batch
+from opendbc.car.psa.psacan import psa_checksum, psa_checksum_batch
 
 
 class SignalType:
@@ -48,7 +55,7 @@ class Signal:
   offset: float
   is_little_endian: bool
   type: int = SignalType.DEFAULT
-  calc_checksum: 'Callable[[int, Signal, bytearray], int] | None' = None
+  calc_checksum: 'Callable[[int, Signal, bytes | bytearray | memoryview], int] | None' = None
 
 
 @dataclass
@@ -74,33 +81,115 @@ VAL_RE = re.compile(r"^VAL_ (\w+) (\w+) (.*);")
 VAL_SPLIT_RE = re.compile(r'["]+')
 
 
+DBC_CACHE_VERSION = 1
+
+
+def get_dbc_cache_dir() -> str | None:
+  """Where parsed DBCs are cached, which is off unless OPENDBC_CACHE_DIR is set.
+  Entries are unpickled, so it must only be writable by trusted users."""
+  return os.environ.get("OPENDBC_CACHE_DIR") or None
+
+
+@cache
+def _parser_hash() -> bytes:
+  # the parsing code itself is part of the cache key
+  with open(__file__, "rb") as f:
+    return hashlib.sha256(f.read()).digest()
+
+
+def dbc_cache_key(name: str, source: bytes) -> str:
+  h = hashlib.sha256()
+  h.update(str(DBC_CACHE_VERSION).encode())
+  h.update(_parser_hash())
+  h.update(name.encode())
+  h.update(source)
+  return h.hexdigest()
+
+
 @cache
 class DBC:
   def __init__(self, name: str):
-    if os.path.exists(name):
-      self._parse_file(name)
+    # the cache key hashes every source of the DBC, which is skipped when caching is off
+    caching = get_dbc_cache_dir() is not None
+    path = name if os.path.exists(name) else os.path.join(DBC_PATH, name + ".dbc")
+    if os.path.exists(path):
+      self.name = os.path.basename(path).replace(".dbc", "")
+      with open(path, "rb") as f:
+        source = f.read()
+      key = dbc_cache_key(self.name, source) if caching else None
+      if not self._load_cache(key):
+        self._parse_lines(source.decode().splitlines(keepends=True))
+        self._save_cache(key)
     else:
-      dbc_path = os.path.join(DBC_PATH, name + ".dbc")
-      if os.path.exists(dbc_path):
-        self._parse_file(dbc_path)
-      else:
-        # try in-memory generated DBC
-        generated = get_generated_dbcs()
-        content = generated.get(name)
+      # try in-memory generated DBC, keyed on the generator inputs so we can skip generating
+      self.name = name
+      key = None
+      if caching:
+        from opendbc.dbc.generator.generator import generator_inputs_hash
+        key = dbc_cache_key(name, generator_inputs_hash().encode())
+      if not self._load_cache(key):
+        content = get_generated_dbc(name)
         if content is None:
           raise FileNotFoundError(f"DBC not found: {name}")
-        self._parse_content(name, content)
+        self._parse_lines(content.splitlines(keepends=True))
+        self._save_cache(key)
 
-  def _parse_file(self, path: str):
-    self.name = os.path.basename(path).replace(".dbc", "")
-    with open(path) as f:
-      lines = f.readlines()
-    self._parse_lines(lines)
+  def _cache_path(self, key: str | None) -> str | None:
+    cache_dir = get_dbc_cache_dir()
+    if cache_dir is None or key is None:
+      return None
+    return os.path.join(cache_dir, f"{self.name}-{key[:32]}.pkl")
 
-  def _parse_content(self, name: str, content: str):
-    self.name = name
-    lines = content.splitlines(keepends=True)
-    self._parse_lines(lines)
+  def _load_cache(self, key: str | None) -> bool:
+    path = self._cache_path(key)
+    if path is None or not os.path.exists(path):
+      return False
+    try:
+      with open(path, "rb") as f:
+        version, cache_key, msgs, vals = pickle.loads(f.read())
+    except Exception:
+      carlog.exception(f"failed to load DBC cache {path}")
+      return False
+    if version != DBC_CACHE_VERSION or cache_key != key:
+      return False
+
+    checksum_state = get_checksum_state(self.name)
+    self.msgs = {}
+    self.addr_to_msg = {}
+    self.name_to_msg = {}
+    for msg_name, address, size, sigs in msgs:
+      msg = Msg(msg_name, address, size, {})
+      for sig_args in sigs:
+        sig = Signal(*sig_args)
+        if checksum_state is not None and sig.type == checksum_state.checksum_type:
+          sig.calc_checksum = checksum_state.calc_checksum
+        msg.sigs[sig.name] = sig
+      self.msgs[address] = self.addr_to_msg[address] = self.name_to_msg[msg_name] = msg
+    self.vals = [Val(*val_args) for val_args in vals]
+    return True
+
+  def _save_cache(self, key: str | None) -> None:
+    path = self._cache_path(key)
+    if path is None:
+      return
+    msgs = [(msg.name, msg.address, msg.size, [(s.name, s.start_bit, s.msb, s.lsb, s.size, s.is_signed, s.factor, s.offset,
+                                                 s.is_little_endian, s.type) for s in msg.sigs.values()])
+            for msg in self.msgs.values()]
+    vals = [(val.name, val.address, val.def_val) for val in self.vals]
+    try:
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(path), delete=False) as f:
+        f.write(pickle.dumps((DBC_CACHE_VERSION, key, msgs, vals), protocol=pickle.HIGHEST_PROTOCOL))
+      os.replace(f.name, path)
+
+      # entries of this DBC under other keys are from an older DBC or parser, and are never read again
+      stale_re = re.compile(re.escape(self.name) + r"-[0-9a-f]{32}\.pkl")
+      for fn in os.listdir(os.path.dirname(path)):
+        if stale_re.fullmatch(fn) and fn != os.path.basename(path):
+          with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(os.path.dirname(path), fn))
+    except OSError:
+      carlog.exception(f"failed to write DBC cache {path}")
 
   def _parse_lines(self, lines: list[str]):
 
@@ -178,6 +267,10 @@ def tesla_setup_signal(sig: Signal, dbc_name: str, line_num: int) -> None:
     sig.calc_checksum = tesla_checksum
 
 
+ChecksumFn = Callable[[int, Signal, bytes | bytearray | memoryview], int]
+BatchChecksumFn = Callable[[int, Signal, np.ndarray], np.ndarray]
+
+
 @dataclass
 class ChecksumState:
   checksum_size: int
@@ -186,35 +279,47 @@ class ChecksumState:
   counter_start_bit: int
   little_endian: bool
   checksum_type: int
-  calc_checksum: Callable[[int, Signal, bytearray], int] | None
+  calc_checksum: ChecksumFn | None
   setup_signal: Callable[[Signal, str, int], None] | None = None
+  # validates many frames of one address at once, (address, sig, 2D uint8 array) -> checksum per row
+  calc_checksum_batch: BatchChecksumFn | None = None
+
+
+# (DBC name prefixes, checksum), first match wins
+CHECKSUM_REGISTRY: list[tuple[tuple[str, ...], ChecksumState]] = []
+
+
+def register_checksum(prefixes: str | tuple[str, ...], state: ChecksumState) -> None:
+  CHECKSUM_REGISTRY.append((prefixes if isinstance(prefixes, tuple) else (prefixes,), state))
+
+
+register_checksum(("honda_", "acura_"), ChecksumState(4, 2, 3, 5, False, SignalType.HONDA_CHECKSUM, honda_checksum,
+                                                      calc_checksum_batch=honda_checksum_batch))
+register_checksum(("toyota_", "lexus_"), ChecksumState(8, -1, 7, -1, False, SignalType.TOYOTA_CHECKSUM, toyota_checksum,
+                                                       calc_checksum_batch=toyota_checksum_batch))
+register_checksum("hyundai_canfd_generated", ChecksumState(16, -1, 0, -1, True, SignalType.HKG_CAN_FD_CHECKSUM, hkg_can_fd_checksum,
+                                                           calc_checksum_batch=hkg_can_fd_checksum_batch))
+register_checksum(("vw_mqb", "vw_mqbevo", "vw_meb"), ChecksumState(8, 4, 0, 0, True, SignalType.VOLKSWAGEN_MQB_MEB_CHECKSUM, volkswagen_mqb_meb_checksum,
+                                                                   calc_checksum_batch=volkswagen_mqb_meb_checksum_batch))
+register_checksum("vw_mlb", ChecksumState(8, 4, 0, 0, True, SignalType.VOLKSWAGEN_MLB_CHECKSUM, volkswagen_mlb_checksum,
+                                          calc_checksum_batch=volkswagen_mlb_checksum_batch))
+register_checksum("vw_pq", ChecksumState(8, 4, 0, -1, True, SignalType.XOR_CHECKSUM, xor_checksum, calc_checksum_batch=xor_checksum_batch))
+register_checksum("subaru_global_", ChecksumState(8, -1, 0, -1, True, SignalType.SUBARU_CHECKSUM, subaru_checksum,
+                                                  calc_checksum_batch=subaru_checksum_batch))
+register_checksum("chrysler_", ChecksumState(8, 4, 7, -1, False, SignalType.CHRYSLER_CHECKSUM, chrysler_checksum,
+                                             calc_checksum_batch=chrysler_checksum_batch))
+register_checksum("fca_giorgio", ChecksumState(8, -1, 7, -1, False, SignalType.FCA_GIORGIO_CHECKSUM, fca_giorgio_checksum,
+                                               calc_checksum_batch=fca_giorgio_checksum_batch))
+register_checksum("comma_body", ChecksumState(8, 4, 7, 3, False, SignalType.BODY_CHECKSUM, body_checksum, calc_checksum_batch=body_checksum_batch))
+register_checksum("tesla_model3_party", ChecksumState(8, -1, 0, -1, True, SignalType.TESLA_CHECKSUM, tesla_checksum, tesla_setup_signal,
+                                                      calc_checksum_batch=tesla_checksum_batch))
+register_checksum("psa_", ChecksumState(4, 4, 7, 3, False, SignalType.PSA_CHECKSUM, psa_checksum, calc_checksum_batch=psa_checksum_batch))
 
 
 def get_checksum_state(dbc_name: str) -> ChecksumState | None:
-  if dbc_name.startswith(("honda_", "acura_")):
-    return ChecksumState(4, 2, 3, 5, False, SignalType.HONDA_CHECKSUM, honda_checksum)
-  elif dbc_name.startswith(("toyota_", "lexus_")):
-    return ChecksumState(8, -1, 7, -1, False, SignalType.TOYOTA_CHECKSUM, toyota_checksum)
-  elif dbc_name.startswith("hyundai_canfd_generated"):
-    return ChecksumState(16, -1, 0, -1, True, SignalType.HKG_CAN_FD_CHECKSUM, hkg_can_fd_checksum)
-  elif dbc_name.startswith(("vw_mqb", "vw_mqbevo", "vw_meb")):
-    return ChecksumState(8, 4, 0, 0, True, SignalType.VOLKSWAGEN_MQB_MEB_CHECKSUM, volkswagen_mqb_meb_checksum)
-  elif dbc_name.startswith("vw_mlb"):
-    return ChecksumState(8, 4, 0, 0, True, SignalType.VOLKSWAGEN_MLB_CHECKSUM, volkswagen_mlb_checksum)
-  elif dbc_name.startswith("vw_pq"):
-    return ChecksumState(8, 4, 0, -1, True, SignalType.XOR_CHECKSUM, xor_checksum)
-  elif dbc_name.startswith("subaru_global_"):
-    return ChecksumState(8, -1, 0, -1, True, SignalType.SUBARU_CHECKSUM, subaru_checksum)
-  elif dbc_name.startswith("chrysler_"):
-    return ChecksumState(8, 4, 7, -1, False, SignalType.CHRYSLER_CHECKSUM, chrysler_checksum)
-  elif dbc_name.startswith("fca_giorgio"):
-    return ChecksumState(8, -1, 7, -1, False, SignalType.FCA_GIORGIO_CHECKSUM, fca_giorgio_checksum)
-  elif dbc_name.startswith("comma_body"):
-    return ChecksumState(8, 4, 7, 3, False, SignalType.BODY_CHECKSUM, body_checksum)
-  elif dbc_name.startswith("tesla_model3_party"):
-    return ChecksumState(8, -1, 0, -1, True, SignalType.TESLA_CHECKSUM, tesla_checksum, tesla_setup_signal)
-  elif dbc_name.startswith("psa_"):
-    return ChecksumState(4, 4, 7, 3, False, SignalType.PSA_CHECKSUM, psa_checksum)
+  for prefixes, state in CHECKSUM_REGISTRY:
+    if dbc_name.startswith(prefixes):
+      return state
   return None
 
 
@@ -1,58 +1,170 @@
 import math
+from collections.abc import Iterable
+from dataclasses import dataclass, field
 
+from opendbc.car.can_definitions import CanData
 from opendbc.car.carlog import carlog
-from opendbc.can.dbc import DBC, Signal, SignalType
+from opendbc.can.dbc import DBC, Msg, Signal, SignalType
+
+
+# (ival shift, mask, frame shift) pieces of a signal within the frame integer
+Segments = list[tuple[int, int, int]]
+
+
+@dataclass
+class SignalSetter:
+  factor: float
+  offset: float
+  segments: Segments
+  is_counter: bool
+
+
+@dataclass
+class MessageTemplate:
+  """Per-message packing layout, compiled once so pack() is a single pass over the values
+  that builds the frame as one integer."""
+  name: str
+  address: int
+  size: int
+  byteorder: str
+  setters: dict[str, SignalSetter]
+  counter: tuple[Signal, SignalSetter] | None
+  checksum: tuple[Signal, SignalSetter] | None
+  # reused by checksum functions, which take a bytearray
+  buf: bytearray = field(default_factory=bytearray)
+
+
+def signal_segments(sig: Signal, size: int, byteorder: str) -> Segments:
+  """Same walk as set_value, but records where each piece of the value lands in the frame integer."""
+  segments: Segments = []
+  i = sig.lsb // 8
+  bits = sig.size
+  src = 0
+  while 0 <= i < size and bits > 0:
+    shift = sig.lsb % 8 if (sig.lsb // 8) == i else 0
+    width = min(bits, 8 - shift)
+    dst = (i if byteorder == "little" else size - 1 - i) * 8 + shift
+    prev_width = segments[-1][1].bit_length() if segments else 0
+    if segments and segments[-1][0] + prev_width == src and segments[-1][2] + prev_width == dst:
+      # contiguous in the frame integer, merge with the previous piece
+      segments[-1] = (segments[-1][0], (1 << (prev_width + width)) - 1, segments[-1][2])
+    else:
+      segments.append((src, (1 << width) - 1, dst))
+    bits -= width
+    src += width
+    i = i + 1 if sig.is_little_endian else i - 1
+  return segments
+
+
+def compile_message_template(msg: Msg) -> MessageTemplate:
+  # build the frame in the byte order that makes the most signals contiguous
+  sigs = list(msg.sigs.values())
+  byteorder = "big" if sigs and not any(s.is_little_endian for s in sigs) else "little"
+
+  setters = {}
+  for sig in sigs:
+    is_counter = sig.type == SignalType.COUNTER or sig.name == "COUNTER"
+    setters[sig.name] = SignalSetter(sig.factor, sig.offset, signal_segments(sig, msg.size, byteorder), is_counter)
+
+  sig_counter = next((s for s in sigs if setters[s.name].is_counter), None)
+  sig_checksum = next((s for s in sigs if s.type > SignalType.COUNTER), None)
+  return MessageTemplate(
+    name=msg.name,
+    address=msg.address,
+    size=msg.size,
+    byteorder=byteorder,
+    setters=setters,
+    counter=(sig_counter, setters[sig_counter.name]) if sig_counter else None,
+    checksum=(sig_checksum, setters[sig_checksum.name]) if sig_checksum and sig_checksum.calc_checksum else None,
+    buf=bytearray(msg.size),
+  )
+
+
+def apply_segments(frame: int, segments: Segments, ival: int) -> int:
+  for src, mask, dst in segments:
+    frame = (frame & ~(mask << dst)) | (((ival >> src) & mask) << dst)
+  return frame
 
 
 class CANPacker:
   def __init__(self, dbc_name: str):
     self.dbc = DBC(dbc_name)
     self.counters: dict[int, int] = {}
+    # keyed by both address and name
+    self.templates: dict[int | str, MessageTemplate] = {}
 
-  def pack(self, address: int, values: dict[str, float]) -> bytearray:
-    msg = self.dbc.addr_to_msg.get(address)
-    if msg is None:
-      carlog.error(f"msg not found for {address=}")
-      return bytearray()
-    dat = bytearray(msg.size)
+  def get_template(self, name_or_addr: int | str) -> MessageTemplate | None:
+    tmpl = self.templates.get(name_or_addr)
+    if tmpl is None:
+      if isinstance(name_or_addr, int):
+        msg = self.dbc.addr_to_msg.get(name_or_addr)
+      else:
+        msg = self.dbc.name_to_msg.get(name_or_addr)
+      if msg is None:
+        return None
+      tmpl = self.templates.get(msg.address)
+      if tmpl is None:
+        tmpl = self.templates[msg.address] = compile_message_template(msg)
+      self.templates[name_or_addr] = tmpl
+    return tmpl
+
+  def _pack(self, tmpl: MessageTemplate, values: dict[str, float]) -> bytes:
+    address = tmpl.address
+    frame = 0
     counter_set = False
     for name, value in values.items():
-      sig = msg.sigs.get(name)
-      if sig is None:
-        carlog.error(f"unknown signal {name=} in {msg.name}")
+      setter = tmpl.setters.get(name)
+      if setter is None:
+        carlog.error(f"unknown signal {name=} in {tmpl.name}")
         continue
-      ival = int(math.floor((value - sig.offset) / sig.factor + 0.5))
-      if ival < 0:
-        ival = (1 << sig.size) + ival
-      set_value(dat, sig, ival)
-      if sig.type == SignalType.COUNTER or sig.name == "COUNTER":
+      ival = math.floor((value - setter.offset) / setter.factor + 0.5)
+      frame = apply_segments(frame, setter.segments, ival)
+      if setter.is_counter:
         self.counters[address] = int(value)
         counter_set = True
-    sig_counter = next((s for s in msg.sigs.values() if s.type == SignalType.COUNTER or s.name == "COUNTER"), None)
-    if sig_counter and not counter_set:
-      if address not in self.counters:
-        self.counters[address] = 0
-      set_value(dat, sig_counter, self.counters[address])
-      self.counters[address] = (self.counters[address] + 1) % (1 << sig_counter.size)
-    sig_checksum = next((s for s in msg.sigs.values() if s.type > SignalType.COUNTER), None)
-    if sig_checksum and sig_checksum.calc_checksum:
-      checksum = sig_checksum.calc_checksum(address, sig_checksum, dat)
-      set_value(dat, sig_checksum, checksum)
-    return dat
+
+    if tmpl.counter is not None and not counter_set:
+      sig_counter, setter = tmpl.counter
+      cnt = self.counters.get(address, 0)
+      frame = apply_segments(frame, setter.segments, cnt)
+      self.counters[address] = (cnt + 1) % (1 << sig_counter.size)
+
+    if tmpl.checksum is not None:
+      sig_checksum, setter = tmpl.checksum
+      tmpl.buf[:] = frame.to_bytes(tmpl.size, tmpl.byteorder)
+      checksum = sig_checksum.calc_checksum(address, sig_checksum, tmpl.buf)
+      frame = apply_segments(frame, setter.segments, checksum)
+    return frame.to_bytes(tmpl.size, tmpl.byteorder)
+
+  def pack(self, address: int, values: dict[str, float]) -> bytearray:
+    tmpl = self.get_template(address)
+    if tmpl is None:
+      carlog.error(f"msg not found for {address=}")
+      return bytearray()
+    return bytearray(self._pack(tmpl, values))
 
   def make_can_msg(self, name_or_addr, bus: int, values: dict[str, float]):
-    if isinstance(name_or_addr, int):
-      addr = name_or_addr
-    else:
-      msg = self.dbc.name_to_msg.get(name_or_addr)
-      if msg is None:
-        carlog.error(f"msg not found for {name_or_addr=}")
-        return 0, b'', bus
-      addr = msg.address
-    dat = self.pack(addr, values)
-    if len(dat) == 0:
+    tmpl = self.get_template(name_or_addr)
+    if tmpl is None:
+      carlog.error(f"msg not found for {name_or_addr=}")
+      return 0, b'', bus
+    if tmpl.size == 0:
       return 0, b'', bus
-    return addr, bytes(dat), bus
+    return tmpl.address, self._pack(tmpl, values), bus
+
+  def pack_many(self, msgs: Iterable[tuple[int | str, int, dict[str, float]]]) -> list[CanData]:
+    """Pack all messages of a control frame, e.g. [("STEERING_LKA", 0, {...}), ("ACC_CONTROL", 0, {...})]."""
+    ret = []
+    for name_or_addr, bus, values in msgs:
+      tmpl = self.get_template(name_or_addr)
+      if tmpl is None:
+        carlog.error(f"msg not found for {name_or_addr=}")
+        ret.append(CanData(0, b'', bus))
+      elif tmpl.size == 0:
+        ret.append(CanData(0, b'', bus))
+      else:
+        ret.append(CanData(tmpl.address, self._pack(tmpl, values), bus))
+    return ret
 
 
 def set_value(msg: bytearray, sig: Signal, ival: int) -> None:
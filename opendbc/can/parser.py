@@ -3,8 +3,10 @@ import numbers
 from collections import defaultdict, deque
 from dataclasses import dataclass, field
 
+import numpy as np
+
 from opendbc.car.carlog import carlog
-from opendbc.can.dbc import DBC, Signal
+from opendbc.can.dbc import DBC, Signal, get_checksum_state
 
 
 MAX_BAD_COUNTER = 5
@@ -26,6 +28,96 @@ def get_raw_value(dat: bytes | bytearray, sig: Signal) -> int:
   return ret
 
 
+def get_raw_values_batch(dat: np.ndarray, sig: Signal) -> np.ndarray:
+  """Vectorized get_raw_value over the rows of a 2D uint8 array, returns uint64."""
+  ret = np.zeros(dat.shape[0], dtype=np.uint64)
+  i = sig.msb // 8
+  bits = sig.size
+  while 0 <= i < dat.shape[1] and bits > 0:
+    lsb = sig.lsb if (sig.lsb // 8) == i else i * 8
+    msb = sig.msb if (sig.msb // 8) == i else (i + 1) * 8 - 1
+    size = msb - lsb + 1
+    d = (dat[:, i].astype(np.uint64) >> np.uint64(lsb - (i * 8))) & np.uint64((1 << size) - 1)
+    ret |= d << np.uint64(bits - size)
+    bits -= size
+    i = i - 1 if sig.is_little_endian else i + 1
+  return ret
+
+
+@dataclass
+class DecodedBatch:
+  """Decoded values for all rows of one message in a decode_batch call."""
+  timestamps: np.ndarray
+  vals: dict[str, np.ndarray]
+  checksum_valid: np.ndarray
+  counter_valid: np.ndarray
+
+  @property
+  def valid(self) -> np.ndarray:
+    # rows MessageState.parse would have accepted
+    return self.checksum_valid & self.counter_valid
+
+
+@dataclass
+class DecodePlan:
+  """Per-message signal layout, compiled once so parsing a frame is a whole-frame
+  int.from_bytes plus one shift and mask per signal."""
+  min_size: int
+  has_le: bool
+  has_be: bool
+  # (is_little_endian, shift, mask, sign_bit) per signal, in signal order.
+  # big endian shifts are relative to the end of the frame, so add len(dat) * 8
+  layout: list[tuple[bool, int, int, int]]
+  scaling: list[tuple[float, float]]
+  names: list[str]
+  checksum_idxs: list[int]
+  counter_idxs: list[int]
+
+
+def compile_decode_plan(signals: list[Signal]) -> DecodePlan:
+  min_size = 0
+  layout = []
+  checksum_idxs = []
+  counter_idxs = []
+  for i, sig in enumerate(signals):
+    min_size = max(min_size, sig.msb // 8 + 1, sig.lsb // 8 + 1)
+    if sig.is_little_endian:
+      shift = sig.lsb
+    else:
+      shift = sig.lsb % 8 - (sig.lsb // 8 + 1) * 8
+    sign_bit = (1 << (sig.size - 1)) if sig.is_signed else 0
+    layout.append((sig.is_little_endian, shift, (1 << sig.size) - 1, sign_bit))
+
+    if sig.calc_checksum is not None:
+      checksum_idxs.append(i)
+    if sig.type == 1:  # COUNTER
+      counter_idxs.append(i)
+
+  return DecodePlan(
+    min_size=min_size,
+    has_le=any(sig.is_little_endian for sig in signals),
+    has_be=any(not sig.is_little_endian for sig in signals),
+    layout=layout,
+    scaling=[(sig.factor, sig.offset) for sig in signals],
+    names=[sig.name for sig in signals],
+    checksum_idxs=checksum_idxs,
+    counter_idxs=counter_idxs,
+  )
+
+
+def decode_raw_values(plan: DecodePlan, dat: bytes | bytearray) -> list[int]:
+  le = int.from_bytes(dat, "little") if plan.has_le else 0
+  be = int.from_bytes(dat, "big") if plan.has_be else 0
+  be_bits = len(dat) * 8
+  ret = []
+  for is_le, shift, mask, sign_bit in plan.layout:
+    tmp = ((le >> shift) if is_le else (be >> (be_bits + shift))) & mask
+    if tmp & sign_bit:
+      tmp -= mask + 1
+    ret.append(tmp)
+  return ret
+
+
 @dataclass
 class MessageState:
   address: int
@@ -44,6 +136,10 @@ class MessageState:
   counter_fail: int = 0
   first_seen_nanos: int = 0
   last_warning_log_nanos: int = 0
+  plan: DecodePlan = field(init=False)
+
+  def __post_init__(self):
+    self.plan = compile_decode_plan(self.signals)
 
   def rate_limited_log(self, last_update_nanos: int, msg: str) -> None:
     if (last_update_nanos - self.last_warning_log_nanos) >= 1_000_000_000:
@@ -51,30 +147,37 @@ class MessageState:
       self.last_warning_log_nanos = last_update_nanos
 
   def parse(self, nanos: int, dat: bytes) -> bool:
-    tmp_vals: list[float] = [0.0] * len(self.signals)
+    plan = self.plan
     checksum_failed = False
     counter_failed = False
 
     if self.first_seen_nanos == 0:
       self.first_seen_nanos = nanos
 
-    for i, sig in enumerate(self.signals):
-      tmp = get_raw_value(dat, sig)
-      if sig.is_signed:
-        tmp -= ((tmp >> (sig.size - 1)) & 0x1) * (1 << sig.size)
-
-      if not self.ignore_checksum and sig.calc_checksum is not None:
-        expected_checksum = sig.calc_checksum(self.address, sig, bytearray(dat))
-        if tmp != expected_checksum:
+    if len(dat) >= plan.min_size:
+      raw_vals = decode_raw_values(plan, dat)
+    else:
+      # truncated frame, fall back to the bit-by-bit decode
+      raw_vals = []
+      for sig in self.signals:
+        tmp = get_raw_value(dat, sig)
+        if sig.is_signed:
+          tmp -= ((tmp >> (sig.size - 1)) & 0x1) * (1 << sig.size)
+        raw_vals.append(tmp)
+
+    if not self.ignore_checksum:
+      for i in plan.checksum_idxs:
+        sig = self.signals[i]
+        expected_checksum = sig.calc_checksum(self.address, sig, memoryview(dat))
+        if raw_vals[i] != expected_checksum:
           checksum_failed = True
-          self.rate_limited_log(nanos, f"checksum failed: received {hex(tmp)}, calculated {hex(expected_checksum)}")
+          self.rate_limited_log(nanos, f"checksum failed: received {hex(raw_vals[i])}, calculated {hex(expected_checksum)}")
 
-      if not self.ignore_counter and sig.type == 1:  # COUNTER
-        if not self.update_counter(tmp, sig.size):
+    if not self.ignore_counter:
+      for i in plan.counter_idxs:
+        if not self.update_counter(raw_vals[i], self.signals[i].size):
           counter_failed = True
 
-      tmp_vals[i] = tmp * sig.factor + sig.offset
-
     # must have good counter and checksum to update data
     if checksum_failed or counter_failed:
       return False
@@ -83,7 +186,8 @@ class MessageState:
       self.vals = [0.0] * len(self.signals)
       self.all_vals = [[] for _ in self.signals]
 
-    for i, v in enumerate(tmp_vals):
+    for i, (tmp, (factor, offset)) in enumerate(zip(raw_vals, plan.scaling, strict=True)):
+      v = tmp * factor + offset
       self.vals[i] = v
       self.all_vals[i].append(v)
 
@@ -114,6 +218,27 @@ class MessageState:
     return True
 
 
+def batch_counter_valid(counters: np.ndarray, cnt_size: int) -> np.ndarray:
+  """MessageState.update_counter over a sequence of counters, starting from a fresh state."""
+  prev = np.empty_like(counters)
+  prev[:1] = 0
+  prev[1:] = counters[:-1]
+  ok = ((prev + 1) & ((1 << cnt_size) - 1)) == counters
+  if ok.all():
+    return ok
+
+  # only walk the bad counter hysteresis if there was a skip
+  ret = np.ones(len(counters), dtype=bool)
+  counter_fail = 0
+  for i, good in enumerate(ok.tolist()):
+    if not good:
+      counter_fail = min(counter_fail + 1, MAX_BAD_COUNTER)
+    elif counter_fail > 0:
+      counter_fail -= 1
+    ret[i] = counter_fail < MAX_BAD_COUNTER
+  return ret
+
+
 class VLDict(dict):
   def __init__(self, parser):
     super().__init__()
@@ -187,6 +312,54 @@ class CANParser:
 
     self.message_states[msg.address] = state
 
+  def decode_batch(self, timestamps: np.ndarray, addresses: np.ndarray, data: np.ndarray,
+                   buses: np.ndarray) -> dict[int | str, DecodedBatch]:
+    """
+    Decode a column batch of frames, e.g. a whole log segment, without touching parser state.
+    data is a 2D uint8 array with one zero padded frame per row. Rows are grouped by address and
+    every signal is decoded for all rows of a message at once. Checksum and counter validity is
+    reported per row as a fresh MessageState.parse would see it.
+    Returns {address: DecodedBatch} with the same objects also keyed by message name.
+    """
+    timestamps = np.asarray(timestamps)
+    addresses = np.asarray(addresses)
+    data = np.asarray(data, dtype=np.uint8)
+    on_bus = np.asarray(buses) == self.bus
+    checksum_state = get_checksum_state(self.dbc.name)
+
+    ret: dict[int | str, DecodedBatch] = {}
+    for address, state in self.message_states.items():
+      rows = np.flatnonzero(on_bus & (addresses == address))
+      dat = data[rows]
+
+      vals = {}
+      checksum_valid = np.ones(len(rows), dtype=bool)
+      counter_valid = np.ones(len(rows), dtype=bool)
+      for sig in state.signals:
+        raw = get_raw_values_batch(dat, sig)
+        if sig.is_signed:
+          if sig.size == 64:
+            tmp = raw.view(np.int64)
+          else:
+            tmp = raw.astype(np.int64) - (((raw >> np.uint64(sig.size - 1)) & np.uint64(1)).astype(np.int64) << sig.size)
+        else:
+          tmp = raw
+
+        if not state.ignore_checksum and sig.calc_checksum is not None:
+          if checksum_state is not None and sig.calc_checksum is checksum_state.calc_checksum and checksum_state.calc_checksum_batch is not None:
+            expected = checksum_state.calc_checksum_batch(address, sig, dat[:, :state.size])
+          else:
+            expected = np.array([sig.calc_checksum(address, sig, row[:state.size].tobytes()) for row in dat], dtype=np.int64)
+          checksum_valid &= tmp == expected
+
+        if not state.ignore_counter and sig.type == 1:  # COUNTER
+          counter_valid &= batch_counter_valid(tmp.astype(np.int64), sig.size)
+
+        vals[sig.name] = tmp * sig.factor + sig.offset
+
+      ret[address] = ret[state.name] = DecodedBatch(timestamps[rows], vals, checksum_valid, counter_valid)
+    return ret
+
   @property
   def bus_timeout(self) -> bool:
     ignore_alive = all(s.ignore_alive for s in self.message_states.values())
@@ -240,10 +413,11 @@ class CANParser:
           vl_all_addr = self.vl_all[address]
           ts_addr = self.ts_nanos[address]
 
-          for i, sig in enumerate(state.signals):
-            vl_addr[sig.name] = state.vals[i]
-            vl_all_addr[sig.name] = state.all_vals[i]
-            ts_addr[sig.name] = state.timestamps[-1]
+          ts = state.timestamps[-1]
+          for name, v, all_v in zip(state.plan.names, state.vals, state.all_vals, strict=True):
+            vl_addr[name] = v
+            vl_all_addr[name] = all_v
+            ts_addr[name] = ts
 
       if not bus_empty:
         self.last_nonempty_nanos = t
@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
+import os
+import tempfile
 import time
+from unittest import mock
+
+import opendbc
 from opendbc.can import CANPacker, CANParser
+from opendbc.can.dbc import DBC
+from opendbc.dbc.generator.generator import generator_inputs_hash
 
 
 def _benchmark(checks, n):
@@ -39,8 +46,52 @@ def _benchmark(checks, n):
   print('[%d] %.1fms to pack, %.1fms to parse %s messages, avg: %dns' % (n, pack_dt/1e6, et/1e6, len(can_msgs), avg_nanos))
 
 
+def _benchmark_pack(n_frames=10000):
+  # roughly a Toyota carcontroller frame worth of commands
+  packer = CANPacker('toyota_nodsu_pt_generated')
+  frame_msgs = [
+    ("STEERING_LKA", 0, {"STEER_REQUEST": 1, "STEER_TORQUE_CMD": 120, "SET_ME_1": 1}),
+    ("STEERING_LTA", 0, {"SETME_X1": 1, "SETME_X3": 3, "PERCENTAGE": 100, "STEER_ANGLE_CMD": 1.5, "STEER_REQUEST": 0}),
+    ("ACC_CONTROL", 0, {"ACCEL_CMD": -0.5, "ACC_TYPE": 1, "DISTANCE": 0, "PERMIT_BRAKING": 1, "ALLOW_LONG_PRESS": 1}),
+    ("PRE_COLLISION", 0, {"FORCE": 0, "STATE": 0, "PRECOLLISION_ACTIVE": 0}),
+    ("LKAS_HUD", 0, {"TWO_BEEPS": 0, "LDA_ALERT": 0, "LEFT_LINE": 1, "RIGHT_LINE": 1, "SET_ME_X01": 1}),
+  ]
+
+  t1 = time.process_time_ns()
+  for _ in range(n_frames):
+    [packer.make_can_msg(*m) for m in frame_msgs]
+  t2 = time.process_time_ns()
+  for _ in range(n_frames):
+    packer.pack_many(frame_msgs)
+  t3 = time.process_time_ns()
+  print('[pack] %d msgs/frame: %dns/frame with make_can_msg, %dns/frame with pack_many' %
+        (len(frame_msgs), (t2 - t1) / n_frames, (t3 - t2) / n_frames))
+
+
+def _benchmark_dbc(dbc_names):
+  def construct():
+    # simulate a fresh process: no parsed DBCs or generated DBC content in memory
+    opendbc._generated_dbc_cache.clear()
+    generator_inputs_hash.cache_clear()
+    t1 = time.perf_counter_ns()
+    for name in dbc_names:
+      DBC.__wrapped__(name)
+    return time.perf_counter_ns() - t1
+
+  with tempfile.TemporaryDirectory() as cache_dir, mock.patch.dict(os.environ, {"OPENDBC_CACHE_DIR": cache_dir}):
+    cold = construct()
+    warm = min(construct() for _ in range(10))
+  with mock.patch.dict(os.environ, {"OPENDBC_CACHE_DIR": ""}):
+    uncached = min(construct() for _ in range(3))
+  print('[DBC] %d DBCs: %.1fms cold, %.1fms warm, %.1fms without cache' % (len(dbc_names), cold/1e6, warm/1e6, uncached/1e6))
+
+
 if __name__ == "__main__":
   # python -m cProfile -s cumulative  benchmark.py
   _benchmark([('ACC_CONTROL', 10)], 1)
   _benchmark([('ACC_CONTROL', 10)], 5)
   _benchmark([('ACC_CONTROL', 10)], 10)
+  _benchmark_pack()
+
+  _benchmark_dbc(['toyota_new_mc_pt_generated'])
+  _benchmark_dbc(['toyota_new_mc_pt_generated', 'toyota_adas', 'hyundai_canfd_generated', 'vw_mqb'])
@@ -1,6 +1,12 @@
 import copy
+import random
 import unittest
+
+import numpy as np
+
 from opendbc.can import CANPacker, CANParser
+from opendbc.can.dbc import DBC, get_checksum_state
+from opendbc.can.tests import ALL_DBCS
 
 
 class TestCanChecksums(unittest.TestCase):
@@ -28,6 +34,23 @@ class TestCanChecksums(unittest.TestCase):
       with self.subTest(counter=expected[counter_field]):
         assert tested[checksum_field] == expected[checksum_field]
 
+  def test_batch_checksums(self):
+    """Batch checksum kernels must match the per-frame ones"""
+    random.seed(0)
+    for dbc_name in ALL_DBCS:
+      checksum_state = get_checksum_state(dbc_name)
+      if checksum_state is None:
+        continue
+      assert checksum_state.calc_checksum_batch is not None
+      for msg in DBC(dbc_name).msgs.values():
+        for sig in msg.sigs.values():
+          if sig.calc_checksum is None:
+            continue
+          with self.subTest(dbc=dbc_name, msg=msg.name):
+            dat = np.array([[random.getrandbits(8) for _ in range(msg.size)] for _ in range(50)], dtype=np.uint8)
+            expected = [sig.calc_checksum(msg.address, sig, memoryview(row.tobytes())) for row in dat]
+            assert checksum_state.calc_checksum_batch(msg.address, sig, dat).tolist() == expected
+
   def verify_fca_giorgio_crc(self, msg_name: str, msg_addr: int, test_messages: list[bytes]):
     """Test modified SAE J1850 CRCs, with special final XOR cases for EPS messages"""
     assert len(test_messages) == 3
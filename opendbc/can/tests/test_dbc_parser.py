@@ -1,6 +1,13 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
+
+from opendbc import get_generated_dbcs
 from opendbc.can import CANParser
-from opendbc.can.tests import ALL_DBCS
+from opendbc.can.dbc import DBC
+from opendbc.can.tests import ALL_DBCS, TEST_DBC
+from opendbc.dbc.generator.generator import generate_dbc
 
 
 class TestDBCParser(unittest.TestCase):
@@ -20,3 +27,49 @@ class TestDBCParser(unittest.TestCase):
     for dbc in ALL_DBCS:
       with self.subTest(dbc=dbc):
         CANParser(dbc, [], 0)
+
+  def test_generate_dbc(self):
+    # generating a single DBC must match generating all of them
+    for name, content in get_generated_dbcs().items():
+      with self.subTest(dbc=name):
+        assert generate_dbc(name) == content
+
+    for name in ("toyota_new_mc_pt", "nonexistent_generated", "_toyota_2017_generated"):
+      assert generate_dbc(name) is None
+
+  def test_dbc_cache(self):
+    with tempfile.TemporaryDirectory() as cache_dir, mock.patch.dict(os.environ, {"OPENDBC_CACHE_DIR": cache_dir}):
+      for dbc in ALL_DBCS:
+        with self.subTest(dbc=dbc):
+          # bypass the in-process cache, first parses and writes the disk cache, second loads it
+          cold = DBC.__wrapped__(dbc)
+          assert len(os.listdir(cache_dir)) > 0
+          with mock.patch.object(DBC.__wrapped__, "_parse_lines", side_effect=AssertionError("DBC was not loaded from cache")):
+            warm = DBC.__wrapped__(dbc)
+          assert warm.name == cold.name
+          assert warm.msgs == cold.msgs
+          assert warm.name_to_msg == cold.name_to_msg
+          assert warm.vals == cold.vals
+
+  def test_dbc_cache_pruned(self):
+    dbc = ALL_DBCS[0]
+    with tempfile.TemporaryDirectory() as cache_dir, mock.patch.dict(os.environ, {"OPENDBC_CACHE_DIR": cache_dir}):
+      DBC.__wrapped__(dbc)
+      entries = os.listdir(cache_dir)
+      assert len(entries) == 1
+
+      # an entry of an older parser is replaced, other files are left alone
+      stale = entries[0].rsplit("-", 1)[0] + "-" + "0" * 32 + ".pkl"
+      os.rename(os.path.join(cache_dir, entries[0]), os.path.join(cache_dir, stale))
+      open(os.path.join(cache_dir, "other.txt"), "w").close()
+      DBC.__wrapped__(dbc)
+      assert sorted(os.listdir(cache_dir)) == sorted([entries[0], "other.txt"])
+
+  def test_dbc_cache_disabled(self):
+    with tempfile.TemporaryDirectory() as cache_dir, mock.patch.dict(os.environ, {"HOME": cache_dir}):
+      os.environ.pop("OPENDBC_CACHE_DIR", None)
+      # nor are the DBC's sources hashed for a key
+      with mock.patch("opendbc.can.dbc.dbc_cache_key", side_effect=AssertionError("cache key computed")):
+        for dbc in (TEST_DBC, next(iter(get_generated_dbcs()))):
+          DBC.__wrapped__(dbc)
+      assert os.listdir(cache_dir) == []
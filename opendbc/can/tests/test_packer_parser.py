@@ -1,8 +1,14 @@
+import math
 import unittest
 import random
 
+import numpy as np
+
 from opendbc.can import CANPacker, CANParser
-from opendbc.can.tests import TEST_DBC
+from opendbc.can.dbc import DBC
+from opendbc.can.packer import set_value
+from opendbc.can.parser import compile_decode_plan, decode_raw_values, get_raw_value
+from opendbc.can.tests import ALL_DBCS, TEST_DBC
 
 MAX_BAD_COUNTER = 5
 
@@ -175,6 +181,91 @@ class TestCanParserPacker(unittest.TestCase):
         for sig in ("STEER_TORQUE", "STEER_TORQUE_REQUEST", "COUNTER", "CHECKSUM"):
           assert parser.vl["STEERING_CONTROL"][sig] == parser.vl[228][sig]
 
+  def test_decode_plan(self):
+    """The compiled decode plan must match the reference bit-by-bit decode for every signal"""
+    random.seed(0)
+    for dbc_name in ALL_DBCS:
+      dbc = DBC(dbc_name)
+      for msg in dbc.msgs.values():
+        signals = list(msg.sigs.values())
+        plan = compile_decode_plan(signals)
+        for size in {msg.size, 64}:
+          if size < plan.min_size:
+            continue
+          dat = bytes(random.getrandbits(8) for _ in range(size))
+          expected = []
+          for sig in signals:
+            tmp = get_raw_value(dat, sig)
+            if sig.is_signed:
+              tmp -= ((tmp >> (sig.size - 1)) & 0x1) * (1 << sig.size)
+            expected.append(tmp)
+          assert decode_raw_values(plan, dat) == expected, (dbc_name, msg.name)
+
+  def test_packer_templates(self):
+    """The compiled message templates must match packing each signal with set_value"""
+    random.seed(0)
+    for dbc_name in ALL_DBCS:
+      packer = CANPacker(dbc_name)
+      for msg in packer.dbc.msgs.values():
+        values = {}
+        expected = bytearray(msg.size)
+        for sig in msg.sigs.values():
+          if sig.calc_checksum is None:
+            ival = random.getrandbits(sig.size)
+            values[sig.name] = ival * sig.factor + sig.offset
+            set_value(expected, sig, int(math.floor((values[sig.name] - sig.offset) / sig.factor + 0.5)))
+        for sig in msg.sigs.values():
+          if sig.calc_checksum is not None:
+            set_value(expected, sig, sig.calc_checksum(msg.address, sig, expected))
+        assert packer.pack(msg.address, values) == expected, (dbc_name, msg.name)
+
+  def test_pack_many(self):
+    packer = CANPacker(TEST_DBC)
+    ref_packer = CANPacker(TEST_DBC)
+    for steer in range(-256, 255):
+      msgs = [
+        ("STEERING_CONTROL", 0, {"STEER_TORQUE": steer}),
+        (245, 1, {"SIGNED": steer}),
+        ("UNKNOWN_MESSAGE", 2, {}),
+      ]
+      assert packer.pack_many(msgs) == [ref_packer.make_can_msg(*m) for m in msgs]
+
+  def test_decode_batch(self):
+    dbc_file = "honda_civic_touring_2016_can_generated"
+    msgs = [("STEERING_CONTROL", 0), ("VSA_STATUS", 0)]
+    packer = CANPacker(dbc_file)
+    parser = CANParser(dbc_file, msgs, 0)
+
+    frames = []
+    for i in range(200):
+      frames.append(packer.make_can_msg("STEERING_CONTROL", random.randint(0, 1), {"STEER_TORQUE": random.randint(-3000, 3000)}))
+      frames.append(packer.make_can_msg("VSA_STATUS", 0, {"USER_BRAKE": random.randint(0, 100), "COUNTER": random.choice((i % 4, 0))}))
+      if i % 50 == 0:
+        addr, dat, bus = frames[-2]
+        frames[-2] = (addr, bytes([dat[0] ^ 0xFF]) + dat[1:], bus)
+
+    timestamps = np.arange(len(frames), dtype=np.int64)
+    data = np.zeros((len(frames), 64), dtype=np.uint8)
+    for i, (_, dat, _) in enumerate(frames):
+      data[i, :len(dat)] = np.frombuffer(dat, dtype=np.uint8)
+    decoded = parser.decode_batch(timestamps, np.array([f[0] for f in frames]), data, np.array([f[2] for f in frames]))
+    assert decoded["VSA_STATUS"] is decoded[0x1a4]
+
+    # must match what a CANParser sees frame by frame
+    for name, _ in msgs:
+      ref_parser = CANParser(dbc_file, msgs, 0)
+      rows = decoded[name]
+      expected_ts = []
+      expected_vals = []
+      for t, frame in zip(timestamps, frames, strict=True):
+        if ref_parser.update([int(t), [frame]]) and frame[0] == ref_parser.dbc.name_to_msg[name].address:
+          expected_ts.append(t)
+          expected_vals.append(dict(ref_parser.vl[name]))
+      assert not rows.valid.all()
+      assert list(rows.timestamps[rows.valid]) == expected_ts
+      for sig_name, vals in rows.vals.items():
+        np.testing.assert_allclose(vals[rows.valid], [v[sig_name] for v in expected_vals])
+
   def test_scale_offset(self):
     """Test that both scale and offset are correctly preserved"""
     dbc_file = "honda_civic_touring_2016_can_generated"
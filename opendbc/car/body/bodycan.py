@@ -1,4 +1,6 @@
-from opendbc.car.crc import CRC8BODY
+import numpy as np
+
+from opendbc.car.crc import CRC8BODY, crc8_batch
 
 
 def create_control(packer, torque_l, torque_r):
@@ -10,8 +12,13 @@ def create_control(packer, torque_l, torque_r):
   return packer.make_can_msg("TORQUE_CMD", 0, values)
 
 
-def body_checksum(address: int, sig, d: bytearray) -> int:
+def body_checksum(address: int, sig, d: bytes | bytearray | memoryview) -> int:
+  # CRC over all but the last byte, in reverse
   crc = 0xFF
-  for i in range(len(d) - 2, -1, -1):
-    crc = CRC8BODY[crc ^ d[i]]
+  for b in reversed(d[:-1]):
+    crc = CRC8BODY[crc ^ b]
   return crc
+
+
+def body_checksum_batch(address: int, sig, dat: np.ndarray) -> np.ndarray:
+  return crc8_batch(CRC8BODY, dat[:, -2::-1], 0xFF)
@@ -5,7 +5,8 @@ from opendbc.car import gen_empty_fingerprint
 from opendbc.car.can_definitions import CanRecvCallable, CanSendCallable
 from opendbc.car.carlog import carlog
 from opendbc.car.structs import CarParams, CarParamsT
-from opendbc.car.fingerprints import eliminate_incompatible_cars, all_legacy_fingerprint_cars
+from opendbc.car.fingerprints import all_legacy_fingerprint_cars_mask, eliminate_incompatible_cars_mask, mask_to_cars
+from opendbc.car.fw_cache import cache_fw_versions, get_cached_fw_versions
 from opendbc.car.fw_versions import ObdCallback, get_fw_versions_ordered, get_present_ecus, match_fw_to_car
 from opendbc.car.mock.values import CAR as MOCK
 from opendbc.car.values import BRANDS
@@ -41,7 +42,8 @@ interfaces = load_interfaces(interface_names)
 
 def can_fingerprint(can_recv: CanRecvCallable) -> tuple[str | None, dict[int, dict]]:
   finger = gen_empty_fingerprint()
-  candidate_cars = {i: all_legacy_fingerprint_cars() for i in [0, 1]}  # attempt fingerprint on both bus 0 and 1
+  # candidate cars as bitmasks, each frame narrows them down with one lookup and an AND
+  candidate_cars = {i: all_legacy_fingerprint_cars_mask() for i in [0, 1]}  # attempt fingerprint on both bus 0 and 1
   frame = 0
   car_fingerprint = None
   done = False
@@ -61,17 +63,18 @@ def can_fingerprint(can_recv: CanRecvCallable) -> tuple[str | None, dict[int, di
         for b in candidate_cars:
           # Ignore extended messages and VIN query response.
           if can.src == b and can.address < 0x800 and can.address not in (0x7df, 0x7e0, 0x7e8):
-            candidate_cars[b] = eliminate_incompatible_cars(can, candidate_cars[b])
+            candidate_cars[b] = eliminate_incompatible_cars_mask(can, candidate_cars[b])
 
       # if we only have one car choice and the time since we got our first
       # message has elapsed, exit
       for b in candidate_cars:
-        if len(candidate_cars[b]) == 1 and frame > FRAME_FINGERPRINT:
+        cc = candidate_cars[b]
+        if cc and not cc & (cc - 1) and frame > FRAME_FINGERPRINT:
           # fingerprint done
-          car_fingerprint = candidate_cars[b][0]
+          car_fingerprint = mask_to_cars(cc)[0]
 
       # bail if no cars left or we've been waiting for more than 2s
-      failed = (all(len(cc) == 0 for cc in candidate_cars.values()) and frame > FRAME_FINGERPRINT) or frame > 200
+      failed = (all(cc == 0 for cc in candidate_cars.values()) and frame > FRAME_FINGERPRINT) or frame > 200
       succeeded = car_fingerprint is not None
       done = failed or succeeded
 
@@ -85,6 +88,7 @@ def fingerprint(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_mu
                 cached_params: CarParamsT | None) -> tuple[str | None, dict, str, list[CarParams.CarFw], CarParams.FingerprintSource, bool]:
   fixed_fingerprint = os.environ.get('FINGERPRINT', "")
   skip_fw_query = os.environ.get('SKIP_FW_QUERY', False)
+  # ignores the cached CarParams, and the FW versions cached per VIN in OPENDBC_FW_CACHE_DIR, which is off unless set
   disable_fw_cache = os.environ.get('DISABLE_FW_CACHE', False)
   ecu_rx_addrs = set()
 
@@ -103,9 +107,17 @@ def fingerprint(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_mu
       set_obd_multiplexing(True)
       # VIN query only reliably works through OBDII
       vin_rx_addr, vin_rx_bus, vin = get_vin(can_recv, can_send, (0, 1))
-      ecu_rx_addrs = get_present_ecus(can_recv, can_send, set_obd_multiplexing)
-      car_fw = get_fw_versions_ordered(can_recv, can_send, set_obd_multiplexing, vin, ecu_rx_addrs)
-      cached = False
+
+      # skip the full FW query if this VIN's essential ECUs still match the last one
+      car_fw = None if disable_fw_cache else get_cached_fw_versions(can_recv, can_send, set_obd_multiplexing, vin)
+      cached = car_fw is not None
+      if car_fw is None:
+        ecu_rx_addrs = get_present_ecus(can_recv, can_send, set_obd_multiplexing)
+        car_fw = get_fw_versions_ordered(can_recv, can_send, set_obd_multiplexing, vin, ecu_rx_addrs)
+        if not disable_fw_cache:
+          cache_fw_versions(vin, car_fw)
+      else:
+        carlog.warning("Using cached FW versions")
 
     exact_fw_match, fw_candidates = match_fw_to_car(car_fw, vin)
   else:
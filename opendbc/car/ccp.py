@@ -4,6 +4,8 @@ import struct
 from enum import IntEnum, Enum
 from dataclasses import dataclass
 
+from opendbc.car.daq import DaqList, DaqVariable, poll_dtos
+
 
 @dataclass
 class ExchangeStationIdsReturn:
@@ -90,6 +92,19 @@ COMMAND_RETURN_CODES = {
 }
 
 
+class START_STOP_MODE(IntEnum):
+  STOP = 0x00
+  START = 0x01
+  PREPARE = 0x02
+
+
+# CRM and event PIDs, the rest are DAQ DTOs
+CRM_PID = 0xFF
+EVENT_PID = 0xFE
+# DAQ element sizes supported by WRITE_DAQ
+DAQ_ELEMENT_SIZES = (1, 2, 4)
+
+
 class BYTE_ORDER(Enum):
   LITTLE_ENDIAN = '<'
   BIG_ENDIAN = '>'
@@ -122,6 +137,7 @@ class CcpClient:
     self.debug = debug
     self._panda = panda
     self._command_counter = -1
+    self._daq: DaqList | None = None
 
   def _send_cro(self, cmd: int, dat: bytes = b"") -> None:
     self._command_counter = (self._command_counter + 1) & 0xFF
@@ -147,6 +163,9 @@ class CcpClient:
           assert len(rx_data) == 8, f"message length not 8: {len(rx_data)}"
 
           pid = rx_data[0]
+          if pid not in (CRM_PID, EVENT_PID) and self._daq is not None:
+            self._daq.decode(pid, rx_data[1:], time.monotonic())
+            continue
           if pid == 0xFF or pid == 0xFE:
             err = rx_data[1]
             err_desc = COMMAND_RETURN_CODES.get(err, "unknown error")
@@ -383,3 +402,43 @@ class CcpClient:
     self._send_cro(COMMAND_CODE.GET_CCP_VERSION, bytes([major, minor]))
     resp = self._recv_dto(0.025)
     return float(f"{resp[0]}.{resp[1]}")
+
+  # DAQ acquisition
+  def configure_daq(self, variables: list[DaqVariable] | list[tuple[int, int]], list_num: int = 0, event_channel: int = 0,
+                    prescaler: int = 1, capacity: int = 1024) -> DaqList:
+    """Sets up a DAQ list sampling (address, size) variables of 1, 2 or 4 bytes on an event channel. Variables are packed
+    into as few ODTs as fit, which the ECU sends each event cycle without being polled once started."""
+    # 7 data bytes after the PID of each DTO
+    daq = DaqList(variables, 7, self.byte_order.value, capacity, entry_sizes=DAQ_ELEMENT_SIZES)
+
+    self._daq = None
+    # also clears the list
+    size = self.get_daq_list_size(list_num, self.rx_addr)
+    if len(daq.odts) > size.list_size:
+      raise ValueError(f"DAQ list {list_num} has {size.list_size} ODTs, {len(daq.odts)} needed")
+    daq.first_pid = size.first_pid
+
+    for odt_num, odt in enumerate(daq.odts):
+      for element_num, entry in enumerate(odt):
+        self.set_daq_list_pointer(list_num, odt_num, element_num)
+        self.write_daq_list_entry(entry.size, entry.addr_ext, entry.address)
+
+    self.start_stop_transmission(START_STOP_MODE.PREPARE, list_num, len(daq.odts) - 1, event_channel, prescaler)
+    self._daq = daq
+    return daq
+
+  def start_daq(self) -> None:
+    """Starts synchronized transmission of the prepared DAQ lists"""
+    if self._daq is None:
+      raise ValueError("DAQ is not configured")
+    self.start_stop_synchronised_transmission(START_STOP_MODE.START)
+
+  def stop_daq(self) -> None:
+    self.start_stop_synchronised_transmission(START_STOP_MODE.STOP)
+
+  def poll_daq(self, timeout: float = 0.) -> int:
+    """Decodes the DTOs received so far into the DAQ list's ring buffer, waiting up to timeout for more.
+    Returns the number of new samples."""
+    if self._daq is None:
+      raise ValueError("DAQ is not configured")
+    return poll_dtos(self._panda, self.can_bus, self.rx_addr, self._daq, lambda pid: pid not in (CRM_PID, EVENT_PID), timeout)
@@ -1,3 +1,5 @@
+import numpy as np
+
 
 def _gen_crc8_table(poly: int) -> list[int]:
   table = []
@@ -30,6 +32,28 @@ CRC8J1850 = _gen_crc8_table(0x1D)
 CRC8BODY = _gen_crc8_table(0xD5)
 CRC16_XMODEM = _gen_crc16_table(0x1021)
 
+# sum of both nibbles of a byte
+NIBBLE_SUM = [(b >> 4) + (b & 0xF) for b in range(256)]
+NIBBLE_SUM_NP = np.array(NIBBLE_SUM, dtype=np.int64)
+
+
+def crc8_batch(table: list[int], dat: np.ndarray, crc: int | np.ndarray = 0x00) -> np.ndarray:
+  """Table driven CRC8 over the columns of a 2D uint8 array, one CRC per row."""
+  table_np = np.asarray(table, dtype=np.uint8)
+  ret = np.full(dat.shape[0], crc, dtype=np.uint8)
+  for i in range(dat.shape[1]):
+    ret = table_np[ret ^ dat[:, i]]
+  return ret
+
+
+def crc16_batch(table: list[int], dat: np.ndarray, crc: int | np.ndarray = 0x0000) -> np.ndarray:
+  """Table driven MSB-first CRC16 over the columns of a 2D uint8 array, one CRC per row."""
+  table_np = np.asarray(table, dtype=np.uint16)
+  ret = np.full(dat.shape[0], crc, dtype=np.uint16)
+  for i in range(dat.shape[1]):
+    ret = (ret << np.uint16(8)) ^ table_np[(ret >> np.uint16(8)) ^ dat[:, i]]
+  return ret
+
 
 def mk_crc8_fun(table: list[int], init_crc: int = 0x00, xor_out: int = 0x00):
   init_reg = init_crc ^ xor_out
@@ -0,0 +1,166 @@
+import sys
+import time
+from collections.abc import Callable
+from typing import NamedTuple
+
+import numpy as np
+
+
+class DaqVariable(NamedTuple):
+  address: int
+  size: int
+  addr_ext: int = 0
+  name: str | None = None
+
+  @property
+  def field_name(self) -> str:
+    return self.name if self.name is not None else f"0x{self.address:x}"
+
+
+class OdtEntry(NamedTuple):
+  address: int
+  size: int
+  addr_ext: int
+
+
+def allocate_odts(variables: list[DaqVariable], odt_size: int, first_odt_size: int | None = None,
+                  entry_sizes: tuple[int, ...] | None = None) -> list[list[OdtEntry]]:
+  """Packs variables in order into ODTs carrying odt_size bytes each, first_odt_size for the first.
+  A variable never spans two ODTs, so each ODT fills a contiguous part of a sample."""
+  first_odt_size = odt_size if first_odt_size is None else first_odt_size
+  odts: list[list[OdtEntry]] = [[]]
+  free = first_odt_size
+  for v in variables:
+    if v.size > odt_size or (entry_sizes is not None and v.size not in entry_sizes):
+      raise ValueError(f"unsupported variable size at 0x{v.address:x}: {v.size}")
+    if v.size > free:
+      odts.append([])
+      free = odt_size
+    odts[-1].append(OdtEntry(v.address, v.size, v.addr_ext))
+    free -= v.size
+  return odts
+
+
+def sample_dtype(variables: list[DaqVariable], byte_order: str) -> np.dtype:
+  """One packed record per sample. Variables of 1, 2, 4 or 8 bytes are unsigned integers in the ECU's byte order,
+  others are raw bytes. View a field as another type of the same size to reinterpret it, e.g. as a float."""
+  formats = [f"{byte_order}u{v.size}" if v.size in (1, 2, 4, 8) else f"V{v.size}" for v in variables]
+  return np.dtype({"names": [v.field_name for v in variables], "formats": formats})
+
+
+class DaqRingBuffer:
+  """Fixed capacity buffer of timestamped samples, the oldest are overwritten once full"""
+  def __init__(self, dtype: np.dtype, capacity: int):
+    self.capacity = capacity
+    self.timestamps = np.zeros(capacity, dtype=np.float64)
+    self.samples = np.zeros(capacity, dtype=dtype)
+    # each sample as bytes, which DTO payloads are copied into
+    self.raw = self.samples.view(np.uint8).reshape(capacity, dtype.itemsize)
+    # samples committed since creation, and samples lost to missing or out of order DTOs
+    self.count = 0
+    self.dropped = 0
+
+  @property
+  def head(self) -> int:
+    """Index of the sample being filled"""
+    return self.count % self.capacity
+
+  def commit(self, timestamp: float) -> None:
+    self.timestamps[self.head] = timestamp
+    self.count += 1
+
+  def __len__(self) -> int:
+    return min(self.count, self.capacity)
+
+  def get(self, n: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Copies of the timestamps and samples of the last n samples, oldest first"""
+    n = len(self) if n is None else min(n, len(self))
+    idxs = np.arange(self.count - n, self.count) % self.capacity
+    return self.timestamps[idxs], self.samples[idxs]
+
+
+class DaqList:
+  """Layout of a DAQ list, and decoding of its DTOs into a ring buffer.
+
+  A sample is committed once all its ODTs arrived in order, and is dropped if one is missed.
+  With timestamp_size, the first ODT starts with the ECU's timestamp counter counting in timestamp_resolution
+  seconds, otherwise samples are timestamped on reception."""
+  def __init__(self, variables: list[DaqVariable], odt_size: int, byte_order: str, capacity: int = 1024,
+               entry_sizes: tuple[int, ...] | None = None, timestamp_size: int = 0, timestamp_resolution: float = 0.):
+    self.variables = [DaqVariable(*v) for v in variables]
+    if not len(self.variables):
+      raise ValueError("no variables to acquire")
+    self.odts = allocate_odts(self.variables, odt_size, odt_size - timestamp_size, entry_sizes)
+    self.buffer = DaqRingBuffer(sample_dtype(self.variables, byte_order), capacity)
+    self.byte_order = byte_order
+    self.timestamp_size = timestamp_size
+    self.timestamp_resolution = timestamp_resolution
+    self.first_pid = 0
+
+    # part of a sample each ODT fills
+    self._odt_slices: list[tuple[int, int]] = []
+    start = 0
+    for odt in self.odts:
+      size = sum(e.size for e in odt)
+      self._odt_slices.append((start, size))
+      start += size
+
+    self._next_odt = -1
+    self._timestamp = 0.
+    # ECU timestamp counter, extended past its wrap around
+    self._last_ticks: int | None = None
+    self._ticks_offset = 0
+
+  def _ecu_timestamp(self, dat: bytes) -> float:
+    ticks = int.from_bytes(dat[:self.timestamp_size], "big" if self.byte_order == ">" else "little")
+    if self._last_ticks is not None and ticks < self._last_ticks:
+      self._ticks_offset += 1 << (8 * self.timestamp_size)
+    self._last_ticks = ticks
+    return (ticks + self._ticks_offset) * self.timestamp_resolution
+
+  def decode(self, pid: int, dat: bytes, timestamp: float) -> bool:
+    """Decodes the payload of a DTO after its PID, returns if the PID belongs to this list"""
+    odt = pid - self.first_pid
+    if not 0 <= odt < len(self.odts):
+      return False
+
+    if odt == 0:
+      if self._next_odt > 0:
+        self.buffer.dropped += 1
+      self._next_odt = 0
+      self._timestamp = timestamp
+      if self.timestamp_size:
+        self._timestamp = self._ecu_timestamp(dat)
+        dat = dat[self.timestamp_size:]
+    elif odt != self._next_odt:
+      if self._next_odt > 0:
+        self.buffer.dropped += 1
+      self._next_odt = -1
+      return True
+
+    start, size = self._odt_slices[odt]
+    self.buffer.raw[self.buffer.head, start:start + size] = np.frombuffer(dat, dtype=np.uint8, count=size)
+    self._next_odt += 1
+    if self._next_odt == len(self.odts):
+      self.buffer.commit(self._timestamp)
+      self._next_odt = -1
+    return True
+
+
+def poll_dtos(panda, bus: int, rx_addr: int, daq: DaqList, is_dto: Callable[[int], bool], timeout: float = 0.) -> int:
+  """Decodes the DTOs received so far into the DAQ list's ring buffer, waiting up to timeout for more.
+  is_dto tells DTO PIDs apart from the protocol's command responses and events. Returns the number of new samples."""
+  count = daq.buffer.count
+  start_time = time.monotonic()
+  while True:
+    msgs = panda.can_recv() or []
+    if len(msgs) >= 256:
+      print("CAN RX buffer overflow!!!", file=sys.stderr)
+    now = time.monotonic()
+    for addr, dat, src in msgs:
+      if src == bus and addr == rx_addr and is_dto(dat[0]):
+        daq.decode(dat[0], bytes(dat[1:]), now)
+    if now - start_time >= timeout:
+      break
+    time.sleep(0.001)
+  return daq.buffer.count - count
@@ -1,3 +1,5 @@
+from functools import cache
+
 from opendbc.car.interfaces import get_interface_attr
 from opendbc.car.body.values import CAR as BODY
 from opendbc.car.chrysler.values import CAR as CHRYSLER
@@ -53,6 +55,35 @@ def all_legacy_fingerprint_cars():
   return list(_FINGERPRINTS.keys())
 
 
+@cache
+def get_fingerprint_masks() -> dict[tuple[int, int], int]:
+  """Maps (address, length) to the cars that could have sent it, as a bitmask where
+     bit i is all_legacy_fingerprint_cars()[i]."""
+  masks: dict[tuple[int, int], int] = {}
+  for i, car_name in enumerate(_FINGERPRINTS):
+    for fingerprint in _FINGERPRINTS[car_name]:
+      # add alien debug address
+      for address_length in (fingerprint | _DEBUG_ADDRESS).items():
+        masks[address_length] = masks.get(address_length, 0) | (1 << i)
+  return masks
+
+
+def all_legacy_fingerprint_cars_mask() -> int:
+  return (1 << len(_FINGERPRINTS)) - 1
+
+
+def eliminate_incompatible_cars_mask(msg, candidate_mask: int) -> int:
+  """Same as eliminate_incompatible_cars, but the candidate cars are a bitmask."""
+  # ignore addresses that are more than 11 bits
+  if msg.address >= 0x800:
+    return candidate_mask
+  return candidate_mask & get_fingerprint_masks().get((msg.address, len(msg.dat)), 0)
+
+
+def mask_to_cars(candidate_mask: int) -> list[str]:
+  return [car_name for i, car_name in enumerate(_FINGERPRINTS) if candidate_mask >> i & 1]
+
+
 # A dict that maps old platform strings to their latest representations
 MIGRATION = {
   "ACURA ILX 2016 ACURAWATCH PLUS": HONDA.ACURA_ILX,
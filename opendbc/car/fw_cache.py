@@ -0,0 +1,161 @@
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+
+from opendbc.car.can_definitions import CanRecvCallable, CanSendCallable
+from opendbc.car.carlog import carlog
+from opendbc.car.structs import CarParams
+from opendbc.car.fw_query_definitions import ESSENTIAL_ECUS
+from opendbc.car.fw_versions import FW_QUERY_CONFIGS, ObdCallback
+from opendbc.car.isotp_parallel_query import IsoTpParallelQuery
+from opendbc.car.vin import VIN_UNKNOWN, is_valid_vin
+
+FW_CACHE_VERSION = 1
+# a full FW query is forced once any cached response is this old, in seconds
+FW_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+
+def get_fw_cache_dir() -> str | None:
+  """Where FW versions are cached per VIN, which is off unless OPENDBC_FW_CACHE_DIR is set."""
+  return os.environ.get("OPENDBC_FW_CACHE_DIR") or None
+
+
+@dataclass
+class CachedFw:
+  car_fw: CarParams.CarFw
+  # last time the ECU was seen responding with this version
+  timestamp: float
+
+  @property
+  def sub_addr(self) -> int | None:
+    return self.car_fw.subAddress if self.car_fw.subAddress != 0 else None
+
+  def to_dict(self) -> dict:
+    fw = self.car_fw.to_dict()
+    fw["fwVersion"] = self.car_fw.fwVersion.hex()
+    fw["request"] = [r.hex() for r in self.car_fw.request]
+    return {"carFw": fw, "timestamp": self.timestamp}
+
+  @classmethod
+  def from_dict(cls, dct: dict) -> 'CachedFw':
+    fw = dict(dct["carFw"])
+    fw["fwVersion"] = bytes.fromhex(fw["fwVersion"])
+    fw["request"] = [bytes.fromhex(r) for r in fw["request"]]
+    return cls(CarParams.CarFw(**fw), dct["timestamp"])
+
+
+def _cache_path(vin: str) -> str | None:
+  cache_dir = get_fw_cache_dir()
+  # an unknown VIN would share one cache file between every car missing its VIN
+  if cache_dir is None or vin == VIN_UNKNOWN or not is_valid_vin(vin):
+    return None
+  return os.path.join(cache_dir, f"{vin}.json")
+
+
+def load_fw_cache(vin: str) -> list[CachedFw] | None:
+  path = _cache_path(vin)
+  if path is None or not os.path.exists(path):
+    return None
+  try:
+    with open(path) as f:
+      dat = json.load(f)
+    if dat["version"] != FW_CACHE_VERSION:
+      return None
+    return [CachedFw.from_dict(d) for d in dat["fw"]] or None
+  except Exception:
+    carlog.exception("Failed to load FW cache")
+    return None
+
+
+def save_fw_cache(vin: str, cached_fw: list[CachedFw]) -> None:
+  path = _cache_path(vin)
+  if path is None or not len(cached_fw):
+    return
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), suffix=".json", delete=False) as f:
+      json.dump({"version": FW_CACHE_VERSION, "fw": [c.to_dict() for c in cached_fw]}, f)
+    os.replace(f.name, path)
+  except OSError:
+    carlog.exception("Failed to save FW cache")
+
+
+def cache_fw_versions(vin: str, car_fw: list[CarParams.CarFw]) -> None:
+  """Caches the result of a full FW query"""
+  now = time.time()
+  save_fw_cache(vin, [CachedFw(fw, now) for fw in car_fw])
+
+
+def _find_request(fw: CarParams.CarFw) -> int | None:
+  """Index of the brand request a cached response was queried with, if it still exists"""
+  config = FW_QUERY_CONFIGS.get(fw.brand)
+  if config is None:
+    return None
+  for i, r in enumerate(config.requests):
+    if r.request == list(fw.request) and r.bus == fw.bus and r.obd_multiplexing == fw.obdMultiplexing:
+      return i
+  return None
+
+
+def revalidate_fw_cache(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_multiplexing: ObdCallback,
+                        cached_fw: list[CachedFw], timeout: float = 0.1) -> bool:
+  """Re-queries the essential ECUs of a cached FW query, returns if they all still respond with the cached versions.
+  Their timestamps are updated if so."""
+  # one response of each essential ECU used for fingerprinting, grouped by query. ECUs using a subaddress are queried one by one
+  queries: dict[tuple[str, int, int | None], list[CachedFw]] = {}
+  ecus = set()
+  for c in cached_fw:
+    ecu = (c.car_fw.ecu, c.car_fw.address, c.sub_addr)
+    if c.car_fw.ecu in ESSENTIAL_ECUS and not c.car_fw.logging and ecu not in ecus:
+      ecus.add(ecu)
+      request_idx = _find_request(c.car_fw)
+      if request_idx is None:
+        return False
+      queries.setdefault((c.car_fw.brand, request_idx, c.sub_addr), []).append(c)
+
+  if not len(queries):
+    return False
+
+  for (brand, request_idx, _), cached in queries.items():
+    r = FW_QUERY_CONFIGS[brand].requests[request_idx]
+    if r.bus % 4 == 1:
+      set_obd_multiplexing(r.obd_multiplexing)
+
+    addrs = [(c.car_fw.address, c.sub_addr) for c in cached]
+    try:
+      query = IsoTpParallelQuery(can_send, can_recv, r.bus, addrs, r.request, r.response, r.rx_offset)
+      results = query.get_data(timeout)
+    except Exception:
+      carlog.exception("FW cache revalidation exception")
+      return False
+
+    for c, addr in zip(cached, addrs, strict=True):
+      if results.get(addr) != c.car_fw.fwVersion:
+        carlog.warning(f"FW cache invalidated by {c.car_fw.ecu} at {addr}")
+        return False
+
+  now = time.time()
+  for cached in queries.values():
+    for c in cached:
+      c.timestamp = now
+  return True
+
+
+def get_cached_fw_versions(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_multiplexing: ObdCallback, vin: str,
+                           timeout: float = 0.1) -> list[CarParams.CarFw] | None:
+  """Returns the cached FW versions of a VIN if its essential ECUs still match, otherwise None and a full query is needed"""
+  cached_fw = load_fw_cache(vin)
+  if cached_fw is None:
+    return None
+
+  if time.time() - min(c.timestamp for c in cached_fw) > FW_CACHE_MAX_AGE:
+    carlog.warning("FW cache expired")
+    return None
+
+  if not revalidate_fw_cache(can_recv, can_send, set_obd_multiplexing, cached_fw, timeout):
+    return None
+
+  save_fw_cache(vin, cached_fw)
+  return [c.car_fw for c in cached_fw]
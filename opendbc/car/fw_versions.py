@@ -1,5 +1,11 @@
+import asyncio
+import contextlib
+import time
 from collections import defaultdict
-from collections.abc import Callable, Iterator
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import cache
 from typing import Protocol, TypeVar
 
 from tqdm import tqdm
@@ -10,9 +16,10 @@ from opendbc.car.carlog import carlog
 from opendbc.car.structs import CarParams
 from opendbc.car.ecu_addrs import get_ecu_addrs
 from opendbc.car.fingerprints import FW_VERSIONS
-from opendbc.car.fw_query_definitions import ESSENTIAL_ECUS, AddrType, EcuAddrBusType, FwQueryConfig, LiveFwVersions, OfflineFwVersions
+from opendbc.car.fw_query_definitions import ESSENTIAL_ECUS, AddrType, EcuAddrBusType, EcuAddrSubAddr, FwQueryConfig, LiveFwVersions, \
+                                             OfflineFwVersions, Request
 from opendbc.car.interfaces import get_interface_attr
-from opendbc.car.isotp_parallel_query import IsoTpParallelQuery
+from opendbc.car.isotp_parallel_query import AsyncIsoTpParallelQuery, CanDemux, IsoTpParallelQuery
 
 Ecu = CarParams.Ecu
 FUZZY_EXCLUDE_ECUS = [Ecu.fwdCamera, Ecu.fwdRadar, Ecu.eps, Ecu.debug]
@@ -25,6 +32,7 @@ REQUESTS = [(brand, config, r) for brand, config in FW_QUERY_CONFIGS.items() for
 
 T = TypeVar('T')
 ObdCallback = Callable[[bool], None]
+BrandAddrType = tuple[str, int, int | None]
 
 
 def chunks(l: list[T], n: int = 128) -> Iterator[list[T]]:
@@ -46,6 +54,135 @@ def build_fw_dict(fw_versions: list[CarParams.CarFw], filter_brand: str | None =
   return dict(fw_versions_dict)
 
 
+@dataclass(frozen=True)
+class EcuFwIndex:
+  has: int  # candidates with this ECU in their FW versions
+  required: int  # candidates that can't match if this ECU is missing
+  fw_versions: dict[bytes, int]  # candidates per FW version
+
+
+@dataclass(frozen=True)
+class FwIndex:
+  """Lookup tables over FW_VERSIONS for the candidates of a brand, or of all brands. Sets of
+  candidates are bitmasks, where bit i is candidates[i]."""
+  candidates: tuple[str, ...]
+  bits: dict[str, int]
+  ecus: dict[EcuAddrSubAddr, EcuFwIndex]
+  # (addr, sub_addr, fw) to candidates, without FUZZY_EXCLUDE_ECUS
+  fuzzy_fw_versions: dict[tuple[int, int | None, bytes], int]
+
+  def to_candidates(self, mask: int) -> set[str]:
+    ret = set()
+    while mask:
+      low = mask & -mask
+      ret.add(self.candidates[low.bit_length() - 1])
+      mask ^= low
+    return ret
+
+  @property
+  def all_candidates(self) -> int:
+    return (1 << len(self.candidates)) - 1
+
+  def match_exact(self, live_fw_versions: LiveFwVersions, extra_fw_versions: dict | None = None) -> int:
+    mismatched, missing = self.exact_mismatches(live_fw_versions, extra_fw_versions)
+    return self.all_candidates & ~(mismatched | missing)
+
+  def exact_mismatches(self, live_fw_versions: LiveFwVersions, extra_fw_versions: dict | None = None) -> tuple[int, int]:
+    """Returns candidates with a present ECU not matching the database, and candidates missing a required ECU."""
+    # extra versions count as matches only for their own candidate
+    extra_matches: defaultdict[EcuAddrSubAddr, int] = defaultdict(int)
+    for candidate, ecus in (extra_fw_versions or {}).items():
+      for ecu, versions in ecus.items():
+        if candidate in self.bits and not live_fw_versions.get(ecu[1:], set()).isdisjoint(versions):
+          extra_matches[ecu] |= self.bits[candidate]
+
+    mismatched, missing = 0, 0
+    for ecu, ecu_index in self.ecus.items():
+      found_versions = live_fw_versions.get(ecu[1:])
+      if not found_versions:
+        missing |= ecu_index.required
+        continue
+
+      matches = extra_matches[ecu]
+      for found_version in found_versions:
+        matches |= ecu_index.fw_versions.get(found_version, 0)
+      mismatched |= ecu_index.has & ~matches
+
+    return mismatched, missing
+
+  def missing_essential_ecus(self, live_fw_versions: LiveFwVersions, candidates: int) -> dict[str, set[EcuAddrSubAddr]]:
+    """Missing essential ECUs of the candidates that have at least one ECU present."""
+    present = 0
+    for ecu, ecu_index in self.ecus.items():
+      if live_fw_versions.get(ecu[1:]):
+        present |= ecu_index.has
+
+    ret: dict[str, set[EcuAddrSubAddr]] = {c: set() for c in self.to_candidates(candidates & present)}
+    for ecu, ecu_index in self.ecus.items():
+      if not live_fw_versions.get(ecu[1:]):
+        # required leaves out candidates that list this ECU as non-essential
+        for candidate in self.to_candidates(ecu_index.required & candidates & present):
+          ret[candidate].add(ecu)
+    return ret
+
+  def match_fuzzy(self, live_fw_versions: LiveFwVersions, exclude: str | None = None) -> tuple[str | None, set[AddrType]]:
+    """Returns the candidate that some ECUs uniquely match, and those ECUs. No candidate if ECUs uniquely match different cars."""
+    exclude_mask = self.bits.get(exclude, 0) if exclude is not None else 0
+    matched_ecus = set()
+    match: str | None = None
+    for addr, versions in live_fw_versions.items():
+      for version in versions:
+        candidates = self.fuzzy_fw_versions.get((*addr, version), 0) & ~exclude_mask
+
+        # only one car has this FW response on the specified address
+        if candidates and not candidates & (candidates - 1):
+          matched_ecus.add(addr)
+          candidate = self.candidates[candidates.bit_length() - 1]
+          if match is None:
+            match = candidate
+          elif match != candidate:
+            return None, matched_ecus
+
+    return match, matched_ecus
+
+
+@cache
+def get_fw_index(brand: str | None = None) -> FwIndex:
+  candidates = tuple(c for c in FW_VERSIONS if is_brand(MODEL_TO_BRAND[c], brand))
+  bits = {c: 1 << i for i, c in enumerate(candidates)}
+
+  has: defaultdict[EcuAddrSubAddr, int] = defaultdict(int)
+  required: defaultdict[EcuAddrSubAddr, int] = defaultdict(int)
+  fw_versions: defaultdict[EcuAddrSubAddr, defaultdict[bytes, int]] = defaultdict(lambda: defaultdict(int))
+  fuzzy_fw_versions: defaultdict[tuple[int, int | None, bytes], int] = defaultdict(int)
+  for candidate in candidates:
+    config = FW_QUERY_CONFIGS[MODEL_TO_BRAND[candidate]]
+    bit = bits[candidate]
+    for ecu, versions in FW_VERSIONS[candidate].items():
+      ecu_type = ecu[0]
+      # Some models can sometimes miss an ecu, or show on two different addresses
+      # FIXME: this logic can be improved to be more specific, should require one of the two addresses
+      if ecu_type in ESSENTIAL_ECUS and candidate not in config.non_essential_ecus.get(ecu_type, []):
+        required[ecu] |= bit
+
+      # Virtual debug ecu doesn't need to match the database
+      if ecu_type != Ecu.debug:
+        has[ecu] |= bit
+        for f in versions:
+          fw_versions[ecu][f] |= bit
+
+      # These ECUs are known to be shared between models (EPS only between hybrid/ICE version)
+      # Getting this exactly right isn't crucial, but excluding camera and radar makes it almost
+      # impossible to get 3 matching versions, even if two models with shared parts are released at the same
+      # time and only one is in our database.
+      if ecu_type not in FUZZY_EXCLUDE_ECUS:
+        for f in versions:
+          fuzzy_fw_versions[(ecu[1], ecu[2], f)] |= bit
+
+  ecus = {ecu: EcuFwIndex(has[ecu], required[ecu], dict(fw_versions[ecu])) for ecu in has.keys() | required.keys()}
+  return FwIndex(candidates, bits, ecus, dict(fuzzy_fw_versions))
+
+
 class MatchFwToCar(Protocol):
   def __call__(self, live_fw_versions: LiveFwVersions, match_brand: str | None = None, log: bool = True) -> set[str]:
     ...
@@ -56,40 +193,7 @@ def match_fw_to_car_fuzzy(live_fw_versions: LiveFwVersions, match_brand: str | N
   that were matched uniquely to that specific car. If multiple ECUs uniquely match to different cars
   the match is rejected."""
 
-  # Build lookup table from (addr, sub_addr, fw) to list of candidate cars
-  all_fw_versions = defaultdict(list)
-  for candidate, fw_by_addr in FW_VERSIONS.items():
-    if not is_brand(MODEL_TO_BRAND[candidate], match_brand):
-      continue
-
-    if candidate == exclude:
-      continue
-
-    for addr, fws in fw_by_addr.items():
-      # These ECUs are known to be shared between models (EPS only between hybrid/ICE version)
-      # Getting this exactly right isn't crucial, but excluding camera and radar makes it almost
-      # impossible to get 3 matching versions, even if two models with shared parts are released at the same
-      # time and only one is in our database.
-      if addr[0] in FUZZY_EXCLUDE_ECUS:
-        continue
-      for f in fws:
-        all_fw_versions[(addr[1], addr[2], f)].append(candidate)
-
-  matched_ecus = set()
-  match: str | None = None
-  for addr, versions in live_fw_versions.items():
-    ecu_key = (addr[0], addr[1])
-    for version in versions:
-      # All cars that have this FW response on the specified address
-      candidates = all_fw_versions[(*ecu_key, version)]
-
-      if len(candidates) == 1:
-        matched_ecus.add(ecu_key)
-        if match is None:
-          match = candidates[0]
-        # We uniquely matched two different cars. No fuzzy match possible
-        elif match != candidates[0]:
-          return set()
+  match, matched_ecus = get_fw_index(match_brand).match_fuzzy(live_fw_versions, exclude)
 
   # Note that it is possible to match to a candidate without all its ECUs being present
   # if there are enough matches. FIXME: parameterize this or require all ECUs to exist like exact matching
@@ -107,40 +211,8 @@ def match_fw_to_car_exact(live_fw_versions: LiveFwVersions, match_brand: str | N
   FW versions for a list of "essential" ECUs. If an ECU is not considered
   essential the FW version can be missing to get a fingerprint, but if it's present it
   needs to match the database."""
-  if extra_fw_versions is None:
-    extra_fw_versions = {}
-
-  invalid = set()
-  candidates = {c: f for c, f in FW_VERSIONS.items() if
-                is_brand(MODEL_TO_BRAND[c], match_brand)}
-
-  for candidate, fws in candidates.items():
-    config = FW_QUERY_CONFIGS[MODEL_TO_BRAND[candidate]]
-    for ecu, expected_versions in fws.items():
-      expected_versions = expected_versions + extra_fw_versions.get(candidate, {}).get(ecu, [])
-      ecu_type = ecu[0]
-      addr = ecu[1:]
-
-      found_versions = live_fw_versions.get(addr, set())
-      if not len(found_versions):
-        # Some models can sometimes miss an ecu, or show on two different addresses
-        # FIXME: this logic can be improved to be more specific, should require one of the two addresses
-        if candidate in config.non_essential_ecus.get(ecu_type, []):
-          continue
-
-        # Ignore non essential ecus
-        if ecu_type not in ESSENTIAL_ECUS:
-          continue
-
-      # Virtual debug ecu doesn't need to match the database
-      if ecu_type == Ecu.debug:
-        continue
-
-      if not any(found_version in expected_versions for found_version in found_versions):
-        invalid.add(candidate)
-        break
-
-  return set(candidates.keys()) - invalid
+  index = get_fw_index(match_brand)
+  return index.to_candidates(index.match_exact(live_fw_versions, extra_fw_versions))
 
 
 def match_fw_to_car(fw_versions: list[CarParams.CarFw], vin: str, allow_exact: bool = True,
@@ -152,11 +224,11 @@ def match_fw_to_car(fw_versions: list[CarParams.CarFw], vin: str, allow_exact: b
   if allow_fuzzy:
     exact_matches.append((False, match_fw_to_car_fuzzy))
 
+  fw_versions_dicts = {brand: build_fw_dict(fw_versions, filter_brand=brand) for brand in VERSIONS.keys()}
   for exact_match, match_func in exact_matches:
     # For each brand, attempt to fingerprint using all FW returned from its queries
     matches: set[str] = set()
-    for brand in VERSIONS.keys():
-      fw_versions_dict = build_fw_dict(fw_versions, filter_brand=brand)
+    for brand, fw_versions_dict in fw_versions_dicts.items():
       matches |= match_func(fw_versions_dict, match_brand=brand, log=log)
 
       # If specified and no matches so far, fall back to brand's fuzzy fingerprinting function
@@ -170,6 +242,76 @@ def match_fw_to_car(fw_versions: list[CarParams.CarFw], vin: str, allow_exact: b
   return True, set()
 
 
+@dataclass
+class FwMatchResult:
+  vin: str
+  exact: bool
+  candidates: set[str]
+  # ECUs with a FW version only one car has, by that car
+  unique_ecus: dict[str, set[AddrType]]
+  # for cars with ECUs present and all matching the database, the essential ECUs that are missing
+  missing_essential_ecus: dict[str, set[EcuAddrSubAddr]]
+
+
+def match_fw_to_car_detailed(fw_versions: list[CarParams.CarFw], vin: str, allow_exact: bool = True,
+                             allow_fuzzy: bool = True) -> FwMatchResult:
+  """Same match as match_fw_to_car, along with which ECUs led to it."""
+  unique_ecus: dict[str, set[AddrType]] = {}
+  missing_essential_ecus: dict[str, set[EcuAddrSubAddr]] = {}
+  exact_matches: set[str] = set()
+  fuzzy_matches: set[str] = set()
+
+  fw_versions_dicts = {brand: build_fw_dict(fw_versions, filter_brand=brand) for brand in VERSIONS.keys()}
+  for brand, fw_versions_dict in fw_versions_dicts.items():
+    index = get_fw_index(brand)
+    mismatched, missing = index.exact_mismatches(fw_versions_dict)
+    exact_matches |= index.to_candidates(index.all_candidates & ~(mismatched | missing))
+    missing_essential_ecus.update(index.missing_essential_ecus(fw_versions_dict, index.all_candidates & ~mismatched))
+
+    match, matched_ecus = index.match_fuzzy(fw_versions_dict)
+    if match is not None:
+      unique_ecus[match] = matched_ecus
+      if len(matched_ecus) >= 2:
+        fuzzy_matches.add(match)
+
+  if allow_exact and len(exact_matches):
+    return FwMatchResult(vin, True, exact_matches, unique_ecus, missing_essential_ecus)
+
+  if allow_fuzzy:
+    # brand fuzzy functions only run if no brand before them matched, like in match_fw_to_car
+    matches: set[str] = set()
+    for brand, fw_versions_dict in fw_versions_dicts.items():
+      matches |= fuzzy_matches & VERSIONS[brand].keys()
+      config = FW_QUERY_CONFIGS[brand]
+      if not len(matches) and config.match_fw_to_car_fuzzy is not None:
+        matches |= config.match_fw_to_car_fuzzy(fw_versions_dict, vin, VERSIONS[brand])
+
+    if len(matches):
+      return FwMatchResult(vin, False, matches, unique_ecus, missing_essential_ecus)
+
+  return FwMatchResult(vin, True, set(), unique_ecus, missing_essential_ecus)
+
+
+def _match_fw_to_car_detailed(args: tuple[list[CarParams.CarFw], str, bool, bool]) -> FwMatchResult:
+  return match_fw_to_car_detailed(*args)
+
+
+def match_fw_to_cars(cars: Iterable[tuple[list[CarParams.CarFw], str]], allow_exact: bool = True, allow_fuzzy: bool = True,
+                     workers: int = 1, progress: bool = False) -> list[FwMatchResult]:
+  """Offline fingerprinting of many cars from their (carFw, VIN), optionally across a process pool."""
+  # build every index up front so forked workers share them
+  for brand in VERSIONS.keys():
+    get_fw_index(brand)
+
+  work = [(car_fw, vin, allow_exact, allow_fuzzy) for car_fw, vin in cars]
+  if workers <= 1:
+    return [_match_fw_to_car_detailed(w) for w in tqdm(work, disable=not progress)]
+
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    chunksize = max(1, len(work) // (workers * 16))
+    return list(tqdm(pool.map(_match_fw_to_car_detailed, work, chunksize=chunksize), total=len(work), disable=not progress))
+
+
 def get_present_ecus(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_multiplexing: ObdCallback) -> set[EcuAddrBusType]:
   # queries are split by OBD multiplexing mode
   queries: dict[bool, list[list[EcuAddrBusType]]] = {True: [], False: []}
@@ -225,8 +367,10 @@ def get_brand_ecu_matches(ecu_rx_addrs: set[EcuAddrBusType]) -> dict[str, list[b
 
 
 def get_fw_versions_ordered(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_multiplexing: ObdCallback, vin: str,
-                            ecu_rx_addrs: set[EcuAddrBusType], timeout: float = 0.1, progress: bool = False) -> list[CarParams.CarFw]:
-  """Queries for FW versions ordering brands by likelihood, breaks when exact match is found"""
+                            ecu_rx_addrs: set[EcuAddrBusType], timeout: float = 0.1, progress: bool = False,
+                            concurrent: bool = False) -> list[CarParams.CarFw]:
+  """Queries for FW versions ordering brands by likelihood, breaks when exact match is found.
+  With concurrent, each brand is queried with get_fw_versions_concurrent."""
 
   all_car_fw = []
   brand_matches = get_brand_ecu_matches(ecu_rx_addrs)
@@ -238,7 +382,10 @@ def get_fw_versions_ordered(can_recv: CanRecvCallable, can_send: CanSendCallable
     if True not in brand_matches[brand]:
       continue
 
-    car_fw = get_fw_versions(can_recv, can_send, set_obd_multiplexing, query_brand=brand, timeout=timeout, progress=progress)
+    if concurrent:
+      car_fw, _ = get_fw_versions_concurrent(can_recv, can_send, set_obd_multiplexing, query_brand=brand, timeout=timeout)
+    else:
+      car_fw = get_fw_versions(can_recv, can_send, set_obd_multiplexing, query_brand=brand, timeout=timeout, progress=progress)
     all_car_fw.extend(car_fw)
 
     # If there is a match using this brand's FW alone, finish querying early
@@ -249,8 +396,9 @@ def get_fw_versions_ordered(can_recv: CanRecvCallable, can_send: CanSendCallable
   return all_car_fw
 
 
-def get_fw_versions(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_multiplexing: ObdCallback, query_brand: str | None = None,
-                    extra: OfflineFwVersions | None = None, timeout: float = 0.1, progress: bool = False) -> list[CarParams.CarFw]:
+def get_fw_query_addrs(query_brand: str | None = None,
+                       extra: OfflineFwVersions | None = None) -> tuple[list[list[BrandAddrType]], dict[BrandAddrType, Ecu]]:
+  """ECU addresses to query as (brand, address, sub-address) groups, along with the ECU type of each"""
   versions = VERSIONS.copy()
 
   if query_brand is not None:
@@ -281,6 +429,38 @@ def get_fw_versions(can_recv: CanRecvCallable, can_send: CanSendCallable, set_ob
 
   addrs.insert(0, parallel_addrs)
 
+  return addrs, ecu_types
+
+
+def get_query_addrs(addr_chunk: list[BrandAddrType], brand: str, r: Request, ecu_types: dict[BrandAddrType, Ecu]) -> list[AddrType]:
+  return [(a, s) for (b, a, s) in addr_chunk if b in (brand, 'any') and
+          (len(r.whitelist_ecus) == 0 or ecu_types[(b, a, s)] in r.whitelist_ecus)]
+
+
+def build_car_fw(brand: str, config: FwQueryConfig, r: Request, ecu_types: dict[BrandAddrType, Ecu],
+                 tx_addr: int, sub_addr: int | None, version: bytes) -> CarParams.CarFw:
+  f = CarParams.CarFw()
+
+  f.ecu = ecu_types.get((brand, tx_addr, sub_addr), Ecu.unknown)
+  f.fwVersion = version
+  f.address = tx_addr
+  f.responseAddress = uds.get_rx_addr_for_tx_addr(tx_addr, r.rx_offset)
+  f.request = r.request
+  f.brand = brand
+  f.bus = r.bus
+  f.logging = r.logging or (f.ecu, tx_addr, sub_addr) in config.extra_ecus
+  f.obdMultiplexing = r.obd_multiplexing
+
+  if sub_addr is not None:
+    f.subAddress = sub_addr
+
+  return f
+
+
+def get_fw_versions(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_multiplexing: ObdCallback, query_brand: str | None = None,
+                    extra: OfflineFwVersions | None = None, timeout: float = 0.1, progress: bool = False) -> list[CarParams.CarFw]:
+  addrs, ecu_types = get_fw_query_addrs(query_brand, extra)
+
   # Get versions and build capnp list to put into CarParams
   car_fw = []
   requests = [(brand, config, r) for brand, config, r in REQUESTS if is_brand(brand, query_brand)]
@@ -292,29 +472,124 @@ def get_fw_versions(can_recv: CanRecvCallable, can_send: CanSendCallable, set_ob
           set_obd_multiplexing(r.obd_multiplexing)
 
         try:
-          query_addrs = [(a, s) for (b, a, s) in addr_chunk if b in (brand, 'any') and
-                         (len(r.whitelist_ecus) == 0 or ecu_types[(b, a, s)] in r.whitelist_ecus)]
+          query_addrs = get_query_addrs(addr_chunk, brand, r, ecu_types)
 
           if query_addrs:
             query = IsoTpParallelQuery(can_send, can_recv, r.bus, query_addrs, r.request, r.response, r.rx_offset)
             for (tx_addr, sub_addr), version in query.get_data(timeout).items():
-              f = CarParams.CarFw()
-
-              f.ecu = ecu_types.get((brand, tx_addr, sub_addr), Ecu.unknown)
-              f.fwVersion = version
-              f.address = tx_addr
-              f.responseAddress = uds.get_rx_addr_for_tx_addr(tx_addr, r.rx_offset)
-              f.request = r.request
-              f.brand = brand
-              f.bus = r.bus
-              f.logging = r.logging or (f.ecu, tx_addr, sub_addr) in config.extra_ecus
-              f.obdMultiplexing = r.obd_multiplexing
-
-              if sub_addr is not None:
-                f.subAddress = sub_addr
-
-              car_fw.append(f)
+              car_fw.append(build_car_fw(brand, config, r, ecu_types, tx_addr, sub_addr, version))
         except Exception:
           carlog.exception("FW query exception")
 
   return car_fw
+
+
+@dataclass
+class FwQueryPhase:
+  """Queries run while OBD multiplexing stays in one state (None if no query depends on it), with
+  the time spent switching multiplexing and the wall-clock time of the queries."""
+  obd_multiplexing: bool | None
+  queries: int
+  obd_multiplexing_time: float = 0.
+  query_time: float = 0.
+
+
+@dataclass
+class FwQuery:
+  brand: str
+  config: FwQueryConfig
+  request: Request
+  addrs: list[AddrType]
+
+  @property
+  def obd_multiplexing(self) -> bool | None:
+    # pandad only multiplexes the OBD port's bus
+    return self.request.obd_multiplexing if self.request.bus % 4 == 1 else None
+
+  @property
+  def ecu_keys(self) -> list[tuple[int, int]]:
+    """(bus, address) of every request and response address, sorted so locks are always taken in the same order"""
+    keys = set()
+    for tx_addr, _ in self.addrs:
+      keys.add((self.request.bus, tx_addr))
+      keys.add((self.request.bus, uds.get_rx_addr_for_tx_addr(tx_addr, self.request.rx_offset)))
+    return sorted(keys)
+
+
+def schedule_fw_queries(queries: list[FwQuery]) -> list[tuple[bool | None, list[FwQuery]]]:
+  """Groups queries into at most two phases, one per OBD multiplexing state, starting with the state the
+  first query needs. Queries that don't depend on multiplexing join the first phase."""
+  states = list(dict.fromkeys(q.obd_multiplexing for q in queries if q.obd_multiplexing is not None))
+  if not states:
+    return [(None, queries)] if queries else []
+
+  phases = [(state, [q for q in queries if q.obd_multiplexing == state]) for state in states]
+  phases[0][1].extend(q for q in queries if q.obd_multiplexing is None)
+  return phases
+
+
+async def _run_fw_query(can_send: CanSendCallable, demux: CanDemux, locks: defaultdict[tuple[int, int], asyncio.Lock],
+                        ecu_types: dict[BrandAddrType, Ecu], query: FwQuery, timeout: float) -> list[CarParams.CarFw]:
+  r = query.request
+  async with contextlib.AsyncExitStack() as stack:
+    # an ECU is only ever part of one query at a time
+    for key in query.ecu_keys:
+      await stack.enter_async_context(locks[key])
+
+    try:
+      isotp_query = AsyncIsoTpParallelQuery(can_send, demux, r.bus, query.addrs, r.request, r.response, r.rx_offset)
+      data = await isotp_query.get_data(timeout)
+    except Exception:
+      carlog.exception("FW query exception")
+      return []
+
+  return [build_car_fw(query.brand, query.config, r, ecu_types, tx_addr, sub_addr, version)
+          for (tx_addr, sub_addr), version in data.items()]
+
+
+async def _run_fw_query_phases(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_multiplexing: ObdCallback,
+                               phases: list[tuple[bool | None, list[FwQuery]]], ecu_types: dict[BrandAddrType, Ecu],
+                               timeout: float) -> tuple[list[CarParams.CarFw], list[FwQueryPhase]]:
+  car_fw = []
+  timings = []
+  locks: defaultdict[tuple[int, int], asyncio.Lock] = defaultdict(asyncio.Lock)
+  async with CanDemux(can_recv) as demux:
+    for obd_multiplexing, queries in phases:
+      timing = FwQueryPhase(obd_multiplexing, len(queries))
+      if obd_multiplexing is not None:
+        t = time.monotonic()
+        set_obd_multiplexing(obd_multiplexing)
+        timing.obd_multiplexing_time = time.monotonic() - t
+
+      t = time.monotonic()
+      # results are kept in scheduling order, not completion order
+      for fw in await asyncio.gather(*(_run_fw_query(can_send, demux, locks, ecu_types, q, timeout) for q in queries)):
+        car_fw.extend(fw)
+      timing.query_time = time.monotonic() - t
+      timings.append(timing)
+
+  return car_fw, timings
+
+
+def get_fw_versions_concurrent(can_recv: CanRecvCallable, can_send: CanSendCallable, set_obd_multiplexing: ObdCallback,
+                               query_brand: str | None = None, extra: OfflineFwVersions | None = None,
+                               timeout: float = 0.1) -> tuple[list[CarParams.CarFw], list[FwQueryPhase]]:
+  """Sends the same queries as get_fw_versions, but switches OBD multiplexing at most once and runs queries
+  concurrently whenever they don't share an ECU, so queries on different buses overlap.
+  Returns the FW versions and the timing of each phase."""
+  addrs, ecu_types = get_fw_query_addrs(query_brand, extra)
+
+  queries = []
+  requests = [(brand, config, r) for brand, config, r in REQUESTS if is_brand(brand, query_brand)]
+  for addr_group in addrs:
+    for addr_chunk in chunks(addr_group):
+      for brand, config, r in requests:
+        query_addrs = get_query_addrs(addr_chunk, brand, r, ecu_types)
+        if query_addrs:
+          queries.append(FwQuery(brand, config, r, query_addrs))
+
+  car_fw, timings = asyncio.run(_run_fw_query_phases(can_recv, can_send, set_obd_multiplexing, schedule_fw_queries(queries),
+                                                     ecu_types, timeout))
+  for timing in timings:
+    carlog.debug(f"FW query phase: {timing}")
+  return car_fw, timings
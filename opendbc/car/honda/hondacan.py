@@ -1,4 +1,7 @@
+import numpy as np
+
 from opendbc.car import CanBusBase
+from opendbc.car.crc import NIBBLE_SUM, NIBBLE_SUM_NP
 from opendbc.car.common.conversions import Conversions as CV
 from opendbc.car.honda.values import (HondaFlags, HONDA_BOSCH, HONDA_BOSCH_ALT_RADAR, HONDA_BOSCH_RADARLESS,
                                       HONDA_BOSCH_CANFD, CarControllerParams)
@@ -227,19 +230,29 @@ def spam_buttons_command(packer, CAN, button_val, car_fingerprint):
   return packer.make_can_msg("SCM_BUTTONS", bus, values)
 
 
-def honda_checksum(address: int, sig, d: bytearray) -> int:
+def _honda_address_sum(address: int) -> int:
   s = 0
-  extended = address > 0x7FF
   addr = address
   while addr:
     s += addr & 0xF
     addr >>= 4
-  for i in range(len(d)):
-    x = d[i]
-    if i == len(d) - 1:
-      x >>= 4
-    s += (x & 0xF) + (x >> 4)
+  return s
+
+
+def honda_checksum(address: int, sig, d: bytes | bytearray | memoryview) -> int:
+  s = _honda_address_sum(address)
+  if len(d):
+    # the checksum is the last nibble
+    s += sum(map(NIBBLE_SUM.__getitem__, d[:-1])) + (d[-1] >> 4)
+  s = 8 - s
+  if address > 0x7FF:
+    s += 3
+  return s & 0xF
+
+
+def honda_checksum_batch(address: int, sig, dat: np.ndarray) -> np.ndarray:
+  s = _honda_address_sum(address) + NIBBLE_SUM_NP[dat[:, :-1]].sum(axis=1) + (dat[:, -1] >> 4)
   s = 8 - s
-  if extended:
+  if address > 0x7FF:
     s += 3
   return s & 0xF
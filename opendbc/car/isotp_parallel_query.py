@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import time
 from collections import defaultdict
 from functools import partial
@@ -168,3 +170,189 @@ class IsoTpParallelQuery:
         break
 
     return results
+
+
+class CanDemux:
+  """Receives CAN frames in one task and routes them to the ECU conversations waiting on them,
+  keyed on bus, rx address and sub-address. Lets queries on several buses overlap."""
+  def __init__(self, can_recv: CanRecvCallable, poll_interval: float = 0.001, max_poll_interval: float = 0.01) -> None:
+    self.can_recv = can_recv
+    # while nothing comes in, the wait between polls doubles from poll_interval up to max_poll_interval,
+    # which is how often pandad delivers CAN anyway. A new subscription or any frame resets it
+    self.poll_interval = poll_interval
+    self.max_poll_interval = max_poll_interval
+    self.queues: dict[tuple[int, int, int | None], asyncio.Queue[CanData]] = {}
+    self._task: asyncio.Task | None = None
+    self._interval = poll_interval
+
+  def subscribe(self, bus: int, rx_addr: int, sub_addr: int | None = None) -> asyncio.Queue[CanData]:
+    key = (bus, rx_addr, sub_addr)
+    assert key not in self.queues, f"already receiving on {key}"
+    self.queues[key] = asyncio.Queue()
+    self._interval = self.poll_interval
+    return self.queues[key]
+
+  def unsubscribe(self, bus: int, rx_addr: int, sub_addr: int | None = None) -> None:
+    self.queues.pop((bus, rx_addr, sub_addr), None)
+
+  def _route(self, msg: CanData) -> None:
+    queue = None
+    if len(msg.dat):
+      queue = self.queues.get((msg.src, msg.address, msg.dat[0]))
+    if queue is None:
+      queue = self.queues.get((msg.src, msg.address, None))
+    if queue is not None:
+      queue.put_nowait(CanData(msg.address, msg.dat, msg.src))
+
+  def poll(self) -> bool:
+    """Routes the frames received so far, returns if there were any"""
+    can_packets = self.can_recv()
+    for packet in can_packets:
+      for msg in packet:
+        self._route(msg)
+    return len(can_packets) > 0
+
+  async def run(self) -> None:
+    while True:
+      # give the conversations a chance to run, wait a bit if nothing came in
+      if self.poll():
+        self._interval = self.poll_interval
+        await asyncio.sleep(0)
+      else:
+        await asyncio.sleep(self._interval)
+        self._interval = min(self._interval * 2, self.max_poll_interval)
+
+  async def __aenter__(self) -> 'CanDemux':
+    self.can_recv()  # drain
+    self._task = asyncio.create_task(self.run())
+    return self
+
+  async def __aexit__(self, *args) -> None:
+    if self._task is not None:
+      self._task.cancel()
+      with contextlib.suppress(asyncio.CancelledError):
+        await self._task
+      self._task = None
+
+
+class AsyncIsoTpParallelQuery:
+  """IsoTpParallelQuery where each ECU conversation is a coroutine fed by a CanDemux,
+  and timeouts are left to the event loop."""
+  def __init__(self, can_send: CanSendCallable, demux: CanDemux, bus: int, addrs: list[int] | list[AddrType],
+               request: list[bytes], response: list[bytes], response_offset: int = 0x8,
+               functional_addrs: list[int] | None = None, response_pending_timeout: float = 10) -> None:
+    self.can_send = can_send
+    self.demux = demux
+    self.bus = bus
+    self.request = request
+    self.response = response
+    self.functional_addrs = functional_addrs or []
+    self.response_pending_timeout = response_pending_timeout
+
+    real_addrs = [a if isinstance(a, tuple) else (a, None) for a in addrs]
+    for tx_addr, _ in real_addrs:
+      assert tx_addr not in uds.FUNCTIONAL_ADDRS, f"Functional address should be defined in functional_addrs: {hex(tx_addr)}"
+
+    self.msg_addrs = {tx_addr: uds.get_rx_addr_for_tx_addr(tx_addr[0], rx_offset=response_offset) for tx_addr in real_addrs}
+
+  def _can_tx(self, tx_addr: int, dat: bytes, bus: int):
+    """Helper function to send single message"""
+    self.can_send([CanData(tx_addr, dat, bus)])
+
+  def _create_isotp_msg(self, tx_addr: int, sub_addr: int | None, rx_addr: int, rx_buffer: list[CanData]):
+    def can_rx():
+      msgs = rx_buffer.copy()
+      rx_buffer.clear()
+      return msgs
+
+    can_client = uds.CanClient(self._can_tx, can_rx, tx_addr, rx_addr, self.bus, sub_addr=sub_addr)
+    return uds.IsoTpMessage(can_client, timeout=0, separation_time=0.01)
+
+  async def _query(self, tx_addr: AddrType, rx_addr: int, queue: asyncio.Queue[CanData], timeout: float) -> bytes | None:
+    loop = asyncio.get_running_loop()
+    rx_buffer: list[CanData] = []
+    msg = self._create_isotp_msg(*tx_addr, rx_addr, rx_buffer)
+    responded = False  # sent a valid iso-tp frame, for timeout logging
+
+    for counter, (request, expected_response) in enumerate(zip(self.request, self.response, strict=True)):
+      if counter > 0:
+        # drop frames left over from the previous request, the first request starts with a fresh queue
+        while not queue.empty():
+          queue.get_nowait()
+        rx_buffer.clear()
+
+      # If querying functional addrs, the first request was already sent and only consecutive frames are sent here
+      msg.send(request, setup_only=counter == 0 and len(self.functional_addrs) > 0)
+      deadline = loop.time() + timeout
+      while True:
+        try:
+          rx_buffer.append(await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0)))
+        except TimeoutError:
+          # Like IsoTpParallelQuery, receive before timing out, frames may not have been routed while the loop was busy
+          self.demux.poll()
+          if queue.empty():
+            if counter > 0:
+              carlog.error(f"iso-tp query timeout after receiving partial response: {tx_addr}")
+            elif responded:
+              carlog.error(f"iso-tp query timeout while receiving response: {tx_addr}")
+            return None
+        while not queue.empty():
+          rx_buffer.append(queue.get_nowait())
+
+        try:
+          dat, rx_in_progress = msg.recv()
+        except Exception:
+          carlog.exception(f"Error processing UDS response: {tx_addr}")
+          return None
+
+        # Extend timeout for each consecutive ISO-TP frame to avoid timing out on long responses
+        if rx_in_progress:
+          responded = True
+          deadline = loop.time() + timeout
+
+        if dat is None:
+          continue
+
+        # Log unexpected empty responses
+        if len(dat) == 0:
+          carlog.error(f"iso-tp query empty response: {tx_addr}")
+          return None
+
+        if dat.startswith(expected_response):
+          break
+
+        error_code = dat[2] if len(dat) > 2 else -1
+        if error_code == 0x78:
+          deadline = loop.time() + self.response_pending_timeout
+          carlog.error(f"iso-tp query response pending: {tx_addr}")
+        else:
+          carlog.error(f"iso-tp query bad response: {tx_addr} - 0x{dat.hex()}")
+          return None
+
+    return dat[len(expected_response):]
+
+  async def get_data(self, timeout: float, total_timeout: float = 60.) -> dict[AddrType, bytes]:
+    # Like _drain_rx, route what was received so far before subscribing, so frames left over from
+    # earlier queries to these ECUs aren't taken as responses to this one
+    self.demux.poll()
+    queues = {tx_addr: self.demux.subscribe(self.bus, rx_addr, tx_addr[1]) for tx_addr, rx_addr in self.msg_addrs.items()}
+    try:
+      tasks = {tx_addr: asyncio.create_task(self._query(tx_addr, rx_addr, queues[tx_addr], timeout))
+               for tx_addr, rx_addr in self.msg_addrs.items()}
+
+      # Send first request to functional addrs, subsequent responses are handled on physical addrs
+      for addr in self.functional_addrs:
+        self._create_isotp_msg(addr, None, -1, []).send(self.request[0])
+
+      _, pending = await asyncio.wait(tasks.values(), timeout=total_timeout)
+      if pending:
+        carlog.error("iso-tp query timeout while receiving data")
+        for task in pending:
+          task.cancel()
+        await asyncio.wait(pending)
+
+      return {tx_addr: task.result() for tx_addr, task in tasks.items()
+              if not task.cancelled() and task.result() is not None}
+    finally:
+      for tx_addr, rx_addr in self.msg_addrs.items():
+        self.demux.unsubscribe(self.bus, rx_addr, tx_addr[1])
@@ -1,15 +1,37 @@
 #!/usr/bin/env python3
+import heapq
+import mmap
 import os
 import capnp
+import numpy as np
+import tempfile
+import struct
 import urllib.parse
 import warnings
+import zipfile
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
 from urllib.request import urlopen
 import zstandard as zstd
 
+from opendbc.car.can_definitions import CanData
 from opendbc.car.common.basedir import BASEDIR
 
 capnp_log = capnp.load(os.path.join(BASEDIR, "rlog.capnp"))
 
+# https://github.com/facebook/zstd/blob/dev/doc/zstd_compression_format.md#zstandard-frames
+ZSTD_MAGIC = b'\x28\xB5\x2F\xFD'
+# decompressed bytes read per step when streaming
+CHUNK_SIZE = 1 << 20
+# events held back to fix up out-of-order logMonoTimes when streaming with sort_by_time
+DEFAULT_REORDER_WINDOW = 1000
+
+# one record per event of an uncompressed log, which is the index into Event's union fields or -1 if unknown
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("size", "<u4"), ("which", "<i2"), ("mono_time", "<u8")])
+INDEX_SUFFIX = ".idx.npz"
+UNION_FIELDS = capnp_log.Event.schema.union_fields
+
 
 def decompress_stream(data: bytes):
   dctx = zstd.ZstdDecompressor()
@@ -21,36 +43,236 @@ def decompress_stream(data: bytes):
   return decompressed_data
 
 
+def message_size(buf: bytes, pos: int = 0) -> int:
+  """Size in bytes of the stream-framed capnp message starting at pos, or -1 if its header is incomplete."""
+  if len(buf) - pos < 4:
+    return -1
+  n_segments = struct.unpack_from("<I", buf, pos)[0] + 1
+  # segment count and sizes, padded to a whole word
+  header_size = (4 * (n_segments + 1) + 7) & ~7
+  if len(buf) - pos < header_size:
+    return -1
+  return header_size + 8 * sum(struct.unpack_from(f"<{n_segments}I", buf, pos + 4))
+
+
+def read_events(f, chunk_size: int = CHUNK_SIZE) -> Iterator[capnp._DynamicStructReader]:
+  """Lazily decodes events from a file-like object of uncompressed capnp messages. Only the
+  complete messages of one chunk are held in memory at a time, plus whatever the caller keeps."""
+  buf = b""
+  while True:
+    dat = f.read(chunk_size)
+    buf += dat
+
+    end = 0
+    while (size := message_size(buf, end)) >= 0 and end + size <= len(buf):
+      end += size
+
+    if end > 0:
+      try:
+        yield from capnp_log.Event.read_multiple_bytes(buf[:end])
+      except capnp.KjException:
+        warnings.warn("Corrupted events detected", RuntimeWarning, stacklevel=1)
+        return
+      buf = buf[end:]
+
+    if not dat:
+      break
+
+  if buf:
+    warnings.warn("Corrupted events detected", RuntimeWarning, stacklevel=1)
+
+
+def reorder_by_time(ents: Iterable, window: int) -> Iterator:
+  """Sorts events by logMonoTime, assuming none is more than window events out of place."""
+  heap: list = []
+  for i, ent in enumerate(ents):
+    # index breaks ties, keeping the order stable like a full sort
+    heapq.heappush(heap, (ent.logMonoTime, i, ent))
+    if len(heap) > window:
+      yield heapq.heappop(heap)[2]
+  while heap:
+    yield heapq.heappop(heap)[2]
+
+
+def union_index(msg_type: str) -> int:
+  # -2 matches nothing in the index, not even unknown types
+  return UNION_FIELDS.index(msg_type) if msg_type in UNION_FIELDS else -2
+
+
+def build_index(dat) -> np.ndarray:
+  """Records where each event of an uncompressed log starts, along with its logMonoTime and union type."""
+  index = []
+  pos = 0
+  try:
+    for ent in capnp_log.Event.read_multiple_bytes(dat):
+      size = message_size(dat, pos)
+      try:
+        which = UNION_FIELDS.index(ent.which())
+      except capnp.KjException:
+        which = -1
+      index.append((pos, size, which, ent.logMonoTime))
+      pos += size
+  except capnp.KjException:
+    warnings.warn("Corrupted events detected", RuntimeWarning, stacklevel=1)
+  return np.array(index, dtype=INDEX_DTYPE)
+
+
+def load_index(fn: str, dat) -> np.ndarray:
+  """Loads the sidecar index of a log, (re)building and saving it if it's missing or stale."""
+  path = fn + INDEX_SUFFIX
+  try:
+    if os.path.getmtime(path) >= os.path.getmtime(fn):
+      with np.load(path) as f:
+        # checked against the log size it was built for rather than its last event, so a corrupted log's index is kept too
+        if f["index"].dtype == INDEX_DTYPE and int(f["log_size"]) == len(dat):
+          return f["index"]
+  except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+    pass
+
+  index = build_index(dat)
+  try:
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".", suffix=INDEX_SUFFIX, delete=False) as f:
+      np.savez(f, index=index, log_size=len(dat))
+    os.replace(f.name, path)
+  except OSError:
+    pass
+  return index
+
+
+@dataclass
+class CanFrames:
+  """Columnar copy of a log's can events. mono_times and event_offsets have a row per event, addresses,
+  buses and data_offsets a row per frame, and data holds every frame's payload back to back."""
+  mono_times: np.ndarray
+  event_offsets: np.ndarray
+  addresses: np.ndarray
+  buses: np.ndarray
+  data_offsets: np.ndarray
+  data: np.ndarray
+
+  @classmethod
+  def from_events(cls, events: Iterable) -> "CanFrames":
+    mono_times, event_offsets, addresses, buses, data_offsets = [], [0], [], [], [0]
+    data = bytearray()
+    for evt in events:
+      mono_times.append(evt.logMonoTime)
+      for c in evt.can:
+        addresses.append(c.address)
+        buses.append(c.src)
+        data += c.dat
+        data_offsets.append(len(data))
+      event_offsets.append(len(addresses))
+    return cls(
+      mono_times=np.array(mono_times, dtype=np.uint64),
+      event_offsets=np.array(event_offsets, dtype=np.uint32),
+      addresses=np.array(addresses, dtype=np.uint32),
+      buses=np.array(buses, dtype=np.uint8),
+      data_offsets=np.array(data_offsets, dtype=np.uint64),
+      data=np.frombuffer(data, dtype=np.uint8),
+    )
+
+  @classmethod
+  def load(cls, path: str) -> "CanFrames":
+    with np.load(path) as f:
+      return cls(**{fld.name: f[fld.name] for fld in fields(cls)})
+
+  def save(self, path: str) -> None:
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".", suffix=".npz", delete=False) as f:
+      np.savez(f, **{fld.name: getattr(self, fld.name) for fld in fields(self)})
+    os.replace(f.name, path)
+
+  def __len__(self) -> int:
+    return len(self.mono_times)
+
+  def __iter__(self) -> Iterator[tuple[int, list[CanData]]]:
+    """Yields (logMonoTime, frames) per event, the frame payloads are memoryview slices of data."""
+    data = memoryview(self.data)
+    event_offsets = self.event_offsets.tolist()
+    addresses = self.addresses.tolist()
+    buses = self.buses.tolist()
+    data_offsets = self.data_offsets.tolist()
+    for i, t in enumerate(self.mono_times.tolist()):
+      yield t, [CanData(addresses[j], data[data_offsets[j]:data_offsets[j + 1]], buses[j])
+                for j in range(event_offsets[i], event_offsets[i + 1])]
+
+
+@contextmanager
+def open_log(fn: str):
+  """Opens a local or remote log, decompressing it on the fly if needed."""
+  _, ext = os.path.splitext(urllib.parse.urlparse(fn).path)
+  with (urlopen(fn) if fn.startswith("http") else open(fn, "rb")) as f:
+    if ext == ".zst" or f.peek(4)[:4] == ZSTD_MAGIC:
+      with zstd.ZstdDecompressor().stream_reader(f, read_across_frames=True) as reader:
+        yield reader
+    else:
+      yield f
+
+
 class LogReader:
-  def __init__(self, fn, only_union_types=False, sort_by_time=False):
+  def __init__(self, fn, only_union_types=False, sort_by_time=False, streaming=False, reorder_window=DEFAULT_REORDER_WINDOW,
+               indexed=False):
+    """With streaming, the log is re-read lazily on each iteration instead of being kept in memory,
+    and sort_by_time only reorders events within a window of reorder_window events.
+
+    With indexed, an uncompressed local log is memory-mapped and events are only decoded when
+    reached, using a sidecar index to seek straight to a time range or message type. The map is held
+    until close, or the end of a with block."""
+    self._fn = fn
     self._only_union_types = only_union_types
-    _, ext = os.path.splitext(urllib.parse.urlparse(fn).path)
+    self._sort_by_time = sort_by_time
+    self._streaming = streaming
+    self._reorder_window = reorder_window
+    self._chunk_size = CHUNK_SIZE
 
-    if fn.startswith("http"):
-      with urlopen(fn) as f:
-        dat = f.read()
-    else:
+    self._ents = []
+    self._index: np.ndarray | None = None
+    self._mm: mmap.mmap | bytes = b""
+    if indexed:
       with open(fn, "rb") as f:
-        dat = f.read()
+        self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+      if self._mm[:4] == ZSTD_MAGIC:
+        self.close()
+        raise ValueError(f"indexed logs must be uncompressed: {fn}")
+      self._index = load_index(fn, self._mm)
+      # index rows in iteration order
+      self._order = np.argsort(self._index["mono_time"], kind="stable") if sort_by_time else np.arange(len(self._index))
+      self._times = self._index["mono_time"][self._order]
+    elif not streaming:
+      with open_log(fn) as f:
+        self._ents = list(read_events(f))
 
-    if ext == ".zst" or dat.startswith(b'\x28\xB5\x2F\xFD'):
-      # https://github.com/facebook/zstd/blob/dev/doc/zstd_compression_format.md#zstandard-frames
-      dat = decompress_stream(dat)
+      if sort_by_time:
+        self._ents.sort(key=lambda x: x.logMonoTime)
 
-    ents = capnp_log.Event.read_multiple_bytes(dat)
+  def close(self) -> None:
+    """Unmaps an indexed log, events already read from it stay valid"""
+    if isinstance(self._mm, mmap.mmap):
+      self._mm.close()
 
-    self._ents = []
-    try:
-      for e in ents:
-        self._ents.append(e)
-    except capnp.KjException:
-      warnings.warn("Corrupted events detected", RuntimeWarning, stacklevel=1)
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc) -> None:
+    self.close()
+
+  def _stream(self):
+    with open_log(self._fn) as f:
+      ents = read_events(f, self._chunk_size)
+      if self._sort_by_time:
+        ents = reorder_by_time(ents, self._reorder_window)
+      yield from ents
 
-    if sort_by_time:
-      self._ents.sort(key=lambda x: x.logMonoTime)
+  def _read(self, rows: np.ndarray):
+    for offset, size in zip(self._index["offset"][rows].tolist(), self._index["size"][rows].tolist(), strict=True):
+      yield next(iter(capnp_log.Event.read_multiple_bytes(self._mm[offset:offset + size])))
+
+  def _events(self):
+    if self._index is not None:
+      return self._read(self._order)
+    return self._stream() if self._streaming else self._ents
 
   def __iter__(self):
-    for ent in self._ents:
+    for ent in self._events():
       if self._only_union_types:
         try:
           ent.which()
@@ -60,8 +282,33 @@ class LogReader:
       else:
         yield ent
 
+  def between(self, start: int, end: int, msg_type: str | None = None):
+    """Events with start <= logMonoTime < end, optionally of one type. Indexed logs seek straight to them,
+    sorted by time only if sort_by_time was set."""
+    if self._index is None:
+      return (m for m in self if start <= m.logMonoTime < end and (msg_type is None or m.which() == msg_type))
+
+    if self._sort_by_time:
+      rows = self._order[np.searchsorted(self._times, start):np.searchsorted(self._times, end)]
+    else:
+      times = self._index["mono_time"]
+      rows = np.flatnonzero((times >= start) & (times < end))
+    if msg_type is not None:
+      rows = rows[self._index["which"][rows] == union_index(msg_type)]
+    elif self._only_union_types:
+      rows = rows[self._index["which"][rows] >= 0]
+    return self._read(rows)
+
   def filter(self, msg_type: str):
+    if self._index is not None:
+      rows = self._order[self._index["which"][self._order] == union_index(msg_type)]
+      return (getattr(m, msg_type) for m in self._read(rows))
     return (getattr(m, m.which()) for m in filter(lambda m: m.which() == msg_type, self))
 
   def first(self, msg_type: str):
-    return next(self.filter(msg_type), None)
+    # closing stops a streaming read right away
+    ents = self.filter(msg_type)
+    try:
+      return next(ents, None)
+    finally:
+      ents.close()
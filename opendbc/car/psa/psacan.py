@@ -1,8 +1,25 @@
-def psa_checksum(address: int, sig, d: bytearray) -> int:
-  chk_ini = {0x452: 0x4, 0x38D: 0x7, 0x42D: 0xC}.get(address, 0xB)
+import numpy as np
+
+from opendbc.car.crc import NIBBLE_SUM, NIBBLE_SUM_NP
+
+
+PSA_CHECKSUM_INIT = {0x452: 0x4, 0x38D: 0x7, 0x42D: 0xC}
+
+
+def psa_checksum(address: int, sig, d: bytes | bytearray | memoryview) -> int:
+  chk_ini = PSA_CHECKSUM_INIT.get(address, 0xB)
+  byte = sig.start_bit // 8
+  # the checksum nibble itself is excluded
+  checksum_nibble = d[byte] >> 4 if sig.start_bit % 8 >= 4 else d[byte] & 0xF
+  checksum = sum(map(NIBBLE_SUM.__getitem__, d)) - checksum_nibble
+  return (chk_ini - checksum) & 0xF
+
+
+def psa_checksum_batch(address: int, sig, dat: np.ndarray) -> np.ndarray:
+  chk_ini = PSA_CHECKSUM_INIT.get(address, 0xB)
   byte = sig.start_bit // 8
-  d[byte] &= 0x0F if sig.start_bit % 8 >= 4 else 0xF0
-  checksum = sum((b >> 4) + (b & 0xF) for b in d)
+  checksum_nibble = dat[:, byte] >> 4 if sig.start_bit % 8 >= 4 else dat[:, byte] & 0xF
+  checksum = NIBBLE_SUM_NP[dat].sum(axis=1) - checksum_nibble
   return (chk_ini - checksum) & 0xF
 
 
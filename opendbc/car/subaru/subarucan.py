@@ -1,3 +1,5 @@
+import numpy as np
+
 from opendbc.car import structs
 from opendbc.car.subaru.values import CanBus
 
@@ -326,12 +328,18 @@ def create_preglobal_es_distance(packer, cruise_button, es_distance_msg):
   return packer.make_can_msg("ES_Distance", CanBus.main, values)
 
 
-def subaru_checksum(address: int, sig, d: bytearray) -> int:
+def _subaru_address_sum(address: int) -> int:
   s = 0
   addr = address
   while addr:
     s += addr & 0xFF
     addr >>= 8
-  for i in range(1, len(d)):
-    s += d[i]
-  return s & 0xFF
+  return s
+
+
+def subaru_checksum(address: int, sig, d: bytes | bytearray | memoryview) -> int:
+  return (_subaru_address_sum(address) + sum(d[1:])) & 0xFF
+
+
+def subaru_checksum_batch(address: int, sig, dat: np.ndarray) -> np.ndarray:
+  return (_subaru_address_sum(address) + dat[:, 1:].sum(axis=1, dtype=np.int64)) & 0xFF
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import argparse
+import time
+from dataclasses import dataclass
+
+from opendbc.car.fw_versions import VERSIONS, get_fw_versions_ordered, get_present_ecus, match_fw_to_car
+from opendbc.car.tests.simulated_ecus import SimulatedCanBus, ecus_for_platform
+from opendbc.car.vin import get_vin
+
+# the 10Hz blocking params loop adds on average 50ms for each OBD multiplexing change
+OBD_MULTIPLEXING_DELAY = 0.05
+DEFAULT_VIN = "1HGBH41JXMN109186"
+
+
+@dataclass
+class QueryStats:
+  name: str
+  time: float
+  frames_sent: int
+  frames_received: int
+
+
+def benchmark_platform(brand: str, platform: str, vin: str = DEFAULT_VIN, concurrent: bool = False,
+                       **ecu_kwargs) -> tuple[list[QueryStats], str, set[str]]:
+  """Runs the fingerprinting queries against a simulated platform, returning the time and CAN traffic
+  of each along with the VIN and FW match candidates it found"""
+  can = SimulatedCanBus(ecus_for_platform(brand, platform, vin=vin, **ecu_kwargs))
+  obd_multiplexing = True
+
+  def set_obd_multiplexing(enabled: bool):
+    nonlocal obd_multiplexing
+    if enabled != obd_multiplexing:
+      obd_multiplexing = enabled
+      time.sleep(OBD_MULTIPLEXING_DELAY)
+
+  stats = []
+
+  def run(name, fn):
+    can.reset_traffic()
+    t = time.monotonic()
+    ret = fn()
+    stats.append(QueryStats(name, time.monotonic() - t, len(can.sent), len(can.received)))
+    return ret
+
+  _, _, found_vin = run("get_vin", lambda: get_vin(can.can_recv, can.can_send, (0, 1)))
+  ecu_rx_addrs = run("get_present_ecus", lambda: get_present_ecus(can.can_recv, can.can_send, set_obd_multiplexing))
+  car_fw = run("get_fw_versions_ordered", lambda: get_fw_versions_ordered(can.can_recv, can.can_send, set_obd_multiplexing, found_vin,
+                                                                          ecu_rx_addrs, concurrent=concurrent))
+  _, matches = match_fw_to_car(car_fw, found_vin, log=False)
+  return stats, found_vin, matches
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmarks the VIN, present ECU and FW queries against simulated ECUs")
+  parser.add_argument("--brand", help="only benchmark platforms of this brand")
+  parser.add_argument("--platform", help="only benchmark this platform")
+  parser.add_argument("--all", action="store_true", help="benchmark every platform, not just the first of each brand")
+  parser.add_argument("--concurrent", action="store_true", help="query FW versions with the concurrent scheduler")
+  parser.add_argument("--latency", type=float, default=0., help="seconds each ECU takes to answer a frame")
+  parser.add_argument("--response-pending", type=float, default=0., help="seconds each ECU sends response pending for")
+  args = parser.parse_args()
+
+  totals: dict[str, QueryStats] = {}
+  for brand, platforms in VERSIONS.items():
+    if args.brand is not None and brand != args.brand:
+      continue
+    for i, platform in enumerate(platforms):
+      if args.platform is not None and platform != args.platform:
+        continue
+      if args.platform is None and not args.all and i > 0:
+        break
+
+      stats, vin, matches = benchmark_platform(brand, platform, concurrent=args.concurrent, latency=args.latency,
+                                               response_pending=args.response_pending)
+      print(f"{platform}: {vin=}, matches={sorted(matches)}")
+      for s in stats:
+        print(f"  {s.name:<24} {s.time:6.3f}s, {s.frames_sent:5} frames sent, {s.frames_received:5} received")
+        total = totals.setdefault(s.name, QueryStats(s.name, 0., 0, 0))
+        total.time += s.time
+        total.frames_sent += s.frames_sent
+        total.frames_received += s.frames_received
+
+  print("total:")
+  for s in totals.values():
+    print(f"  {s.name:<24} {s.time:6.3f}s, {s.frames_sent:5} frames sent, {s.frames_received:5} received")
@@ -7,6 +7,7 @@ import subprocess
 import sys
 import tempfile
 import traceback
+import zipfile
 import zstandard as zstd
 from tqdm import tqdm
 from tqdm.contrib.concurrent import process_map
@@ -19,13 +20,16 @@ from typing import Any
 from opendbc.car import structs
 from opendbc.car.can_definitions import CanData
 from opendbc.car.car_helpers import can_fingerprint, interfaces
-from opendbc.car.logreader import LogReader, decompress_stream
+from opendbc.car.logreader import CanFrames, LogReader, decompress_stream
 
 
 TOLERANCE = 1e-4
 DIFF_BUCKET = "car_diff"
 IGNORE_FIELDS = ["cumLagMs", "canErrorCounter"]
 PADDING = 5
+# columnar can frames of each segment, so reruns skip downloading and decoding the logs until the OS clears temp
+CAN_CACHE_DIR = Path(os.environ.get("CAR_DIFF_CACHE_DIR", Path(tempfile.gettempdir()) / f"opendbc_{DIFF_BUCKET}"))
+CAN_CACHE_VERSION = 1
 
 Diff = tuple[str, int, tuple[Any, Any], int]
 Ref = tuple[int, structs.CarState]
@@ -50,16 +54,39 @@ def dict_diff(d1: dict[str, Any], d2: dict[str, Any], path: str = "", ignore: li
   return diffs
 
 
-def load_can_messages(seg: str) -> list[Any]:
+def get_can_cache_path(seg: str) -> Path:
+  return CAN_CACHE_DIR / f"v{CAN_CACHE_VERSION}_{seg.replace('/', '_')}.npz"
+
+
+def load_can_messages(seg: str) -> CanFrames:
+  path = get_can_cache_path(seg)
+  if path.exists():
+    try:
+      return CanFrames.load(str(path))
+    except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile) as e:
+      # truncated or from an older layout, rebuilt below
+      print(f"Rebuilding corrupt CAN cache {path}: {e!r}", file=sys.stderr)
+      path.unlink(missing_ok=True)
+
   from comma_car_segments import get_url
   parts = seg.split("/")
   url = get_url(f"{parts[0]}/{parts[1]}", parts[2])
-  msgs = LogReader(url, only_union_types=True, sort_by_time=True)
-  return [m for m in msgs if m.which() == 'can']
-
-
-def replay_segment(platform: str, can_msgs: list[Any]) -> tuple[structs.CarParams, list[structs.CarState], list[int]]:
-  _can_msgs = ([CanData(can.address, can.dat, can.src) for can in m.can] for m in can_msgs)
+  # only the can events are kept in memory, sorting them alone gives the same order as sorting the whole log
+  msgs = LogReader(url, only_union_types=True, streaming=True)
+  can = CanFrames.from_events(sorted((m for m in msgs if m.which() == 'can'), key=lambda m: m.logMonoTime))
+  path.parent.mkdir(parents=True, exist_ok=True)
+  can.save(str(path))
+  # the segment's frames cached by other versions
+  stale = re.compile(rf"v\d+_{re.escape(path.name.split('_', 1)[1])}")
+  for p in CAN_CACHE_DIR.iterdir():
+    if p != path and stale.fullmatch(p.name):
+      p.unlink(missing_ok=True)
+  return can
+
+
+def replay_segment(platform: str, can: CanFrames) -> tuple[structs.CarParams, list[structs.CarState], list[int]]:
+  can_msgs = list(can)
+  _can_msgs = (frames for _, frames in can_msgs)
 
   def can_recv(wait_for_one: bool = False) -> list[list[CanData]]:
     return [next(_can_msgs, [])]
@@ -72,11 +99,10 @@ def replay_segment(platform: str, can_msgs: list[Any]) -> tuple[structs.CarParam
   CC = structs.CarControl().as_reader()
 
   states, timestamps = [], []
-  for msg in can_msgs:
-    frames = [CanData(c.address, c.dat, c.src) for c in msg.can]
-    states.append(CI.update([(msg.logMonoTime, frames)]))
-    CI.apply(CC, msg.logMonoTime)
-    timestamps.append(msg.logMonoTime)
+  for t, frames in can_msgs:
+    states.append(CI.update([(t, frames)]))
+    CI.apply(CC, t)
+    timestamps.append(t)
   return CP, states, timestamps
 
 
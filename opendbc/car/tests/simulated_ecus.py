@@ -0,0 +1,307 @@
+import asyncio
+import contextlib
+import heapq
+import struct
+import time
+from dataclasses import dataclass, field
+from unittest.mock import patch
+
+from opendbc.car import uds
+from opendbc.car.can_definitions import CanData
+from opendbc.car.fw_query_definitions import StdQueries
+from opendbc.car.fw_versions import FW_QUERY_CONFIGS, VERSIONS
+
+# pandad delivers CAN at 100Hz, so a blocking receive never waits longer than this
+MAX_RECV_WAIT = 0.01
+
+
+def separation_time(st_min: int) -> float:
+  """Seconds between consecutive frames for an ISO-TP STmin byte"""
+  if 0xF1 <= st_min <= 0xF9:
+    return (st_min - 0xF0) * 1e-4
+  return min(st_min, 0x7F) * 1e-3
+
+
+@dataclass
+class SimulatedEcu:
+  """An ECU answering diagnostic requests over ISO-TP, looked up by exact request payload.
+
+  Every frame it sends is delayed by latency. With response_pending, it first answers with a
+  response pending (0x78) negative response, then sends the real response that many seconds later.
+  block_size and st_min are what it asks for in flow control of multi-frame requests."""
+  tx_addr: int  # address the ECU listens on
+  bus: int
+  responses: dict[bytes, bytes]
+  rx_offset: int = 0x8
+  sub_addr: int | None = None
+  latency: float = 0.
+  response_pending: float = 0.
+  block_size: int = 0
+  st_min: int = 0
+
+  rx_addr: int = field(init=False)
+  max_len: int = field(init=False)
+  # multi-frame request being received, multi-frame response waiting on flow control
+  _rx_dat: bytes = field(init=False, default=b"")
+  _rx_len: int = field(init=False, default=0)
+  _rx_block: int = field(init=False, default=0)
+  _tx_dat: bytes = field(init=False, default=b"")
+  _tx_idx: int = field(init=False, default=0)
+
+  def __post_init__(self):
+    self.rx_addr = uds.get_rx_addr_for_tx_addr(self.tx_addr, self.rx_offset)
+    self.max_len = 8 if self.sub_addr is None else 7
+
+  def listens_to(self, msg: CanData) -> bool:
+    if msg.src != self.bus or len(msg.dat) == 0:
+      return False
+    if msg.address in uds.FUNCTIONAL_ADDRS:
+      # functional requests reach every 11 or 29-bit ECU without a sub-address
+      return self.sub_addr is None and (msg.address > 0x7FF) == (self.tx_addr > 0x7FF)
+    return msg.address == self.tx_addr and (self.sub_addr is None or msg.dat[0] == self.sub_addr)
+
+  def _frame(self, dat: bytes) -> CanData:
+    if self.sub_addr is not None:
+      dat = bytes([self.sub_addr]) + dat
+    return CanData(self.rx_addr, dat.ljust(8, b"\x00"), self.bus)
+
+  def respond(self, request: bytes) -> bytes | None:
+    response = self.responses.get(request)
+    if response is None and request == StdQueries.TESTER_PRESENT_REQUEST:
+      # every ECU stays in its session when asked to
+      response = StdQueries.TESTER_PRESENT_RESPONSE
+    return response
+
+  def _flow_control(self) -> CanData:
+    return self._frame(bytes([0x30, self.block_size, self.st_min]))
+
+  def _start_response(self, response: bytes, delay: float) -> list[tuple[float, CanData]]:
+    if len(response) < self.max_len:
+      return [(delay, self._frame(bytes([len(response)]) + response))]
+    self._tx_dat = response
+    self._tx_idx = 0
+    return [(delay, self._frame(struct.pack("!H", 0x1000 | len(response)) + response[:self.max_len - 2]))]
+
+  def _consecutive_frames(self, block_size: int, st_min: int) -> list[tuple[float, CanData]]:
+    num_bytes = self.max_len - 1
+    frames = []
+    while True:
+      start = self.max_len - 2 + self._tx_idx * num_bytes
+      if start >= len(self._tx_dat) or (block_size and len(frames) == block_size):
+        break
+      self._tx_idx += 1
+      dat = bytes([0x20 | (self._tx_idx & 0xF)]) + self._tx_dat[start:start + num_bytes]
+      frames.append((self.latency + len(frames) * separation_time(st_min), self._frame(dat)))
+    if self.max_len - 2 + self._tx_idx * num_bytes >= len(self._tx_dat):
+      self._tx_dat = b""
+    return frames
+
+  def receive(self, msg: CanData) -> list[tuple[float, CanData]]:
+    """Handles a frame addressed to this ECU, returns the frames it sends back along with their delay in seconds."""
+    dat = bytes(msg.dat[1:] if self.sub_addr is not None else msg.dat)
+    frame_type = dat[0] >> 4
+    request = None
+    if frame_type == uds.ISOTP_FRAME_TYPE.SINGLE:
+      request = dat[1:1 + (dat[0] & 0xF)]
+    elif frame_type == uds.ISOTP_FRAME_TYPE.FIRST:
+      self._rx_len = ((dat[0] & 0xF) << 8) + dat[1]
+      self._rx_dat = dat[2:self.max_len]
+      self._rx_block = 0
+      return [(self.latency, self._flow_control())]
+    elif frame_type == uds.ISOTP_FRAME_TYPE.CONSECUTIVE and self._rx_len:
+      self._rx_dat += dat[1:1 + self._rx_len - len(self._rx_dat)]
+      self._rx_block += 1
+      if len(self._rx_dat) == self._rx_len:
+        request = self._rx_dat
+        self._rx_len = 0
+      elif self._rx_block == self.block_size:
+        # ready for the next block
+        self._rx_block = 0
+        return [(self.latency, self._flow_control())]
+    elif frame_type == uds.ISOTP_FRAME_TYPE.FLOW and self._tx_dat and dat[0] == 0x30:
+      return self._consecutive_frames(dat[1], dat[2])
+
+    if request is None:
+      return []
+    response = self.respond(request)
+    if response is None:
+      return []
+    if self.response_pending:
+      pending = self._frame(bytes([0x03, 0x7F, request[0], 0x78]))
+      return [(self.latency, pending)] + self._start_response(response, self.latency + self.response_pending)
+    return self._start_response(response, self.latency)
+
+
+@dataclass
+class SimulatedMemoryEcu(SimulatedEcu):
+  """An ECU that also serves UDS uploads and downloads of its memory, in blocks of up to max_block_length bytes
+  including the service id and block sequence counter."""
+  memory: bytearray = field(default_factory=bytearray)
+  max_block_length: int = 0x402
+
+  # direction, next memory address and end of the active transfer, and the expected block sequence counter
+  _transfer: tuple[int, int, int] | None = field(init=False, default=None)
+  _block_sequence_count: int = field(init=False, default=0)
+
+  def _negative_response(self, request: bytes, error_code: int) -> bytes:
+    return bytes([0x7F, request[0], error_code])
+
+  def respond(self, request: bytes) -> bytes | None:
+    service = request[0]
+    if service in (uds.SERVICE_TYPE.REQUEST_UPLOAD, uds.SERVICE_TYPE.REQUEST_DOWNLOAD):
+      size_len, addr_len = request[2] >> 4, request[2] & 0xF
+      address = int.from_bytes(request[3:3 + addr_len], "big")
+      size = int.from_bytes(request[3 + addr_len:3 + addr_len + size_len], "big")
+      if address + size > len(self.memory):
+        return self._negative_response(request, 0x31)  # request out of range
+      self._transfer = (service, address, address + size)
+      self._block_sequence_count = 1
+      return bytes([service + 0x40, 0x20]) + self.max_block_length.to_bytes(2, "big")
+
+    if service == uds.SERVICE_TYPE.TRANSFER_DATA:
+      if self._transfer is None:
+        return self._negative_response(request, 0x24)  # request sequence error
+      if request[1] != self._block_sequence_count:
+        return self._negative_response(request, 0x73)  # wrong block sequence counter
+      direction, address, end = self._transfer
+      if direction == uds.SERVICE_TYPE.REQUEST_UPLOAD:
+        block = bytes(self.memory[address:min(address + self.max_block_length - 2, end)])
+      else:
+        block = request[2:]
+        if len(block) > self.max_block_length - 2 or address + len(block) > end:
+          return self._negative_response(request, 0x71)  # transfer data suspended
+        self.memory[address:address + len(block)] = block
+      self._transfer = (direction, address + len(block), end)
+      self._block_sequence_count = (self._block_sequence_count + 1) & 0xFF
+      return bytes([service + 0x40, request[1]]) + (block if direction == uds.SERVICE_TYPE.REQUEST_UPLOAD else b"")
+
+    if service == uds.SERVICE_TYPE.REQUEST_TRANSFER_EXIT:
+      if self._transfer is None:
+        return self._negative_response(request, 0x24)
+      self._transfer = None
+      return bytes([service + 0x40])
+
+    return super().respond(request)
+
+
+class SimulatedCanBus:
+  """In-process stand-in for can_send/can_recv, with ECUs answering frames as they're sent.
+  Frames are received once their ECU's delay has passed, and all traffic is recorded."""
+  def __init__(self, ecus: list[SimulatedEcu]):
+    self.ecus = ecus
+    # (receive time, order queued, frame)
+    self.rx_queue: list[tuple[float, int, CanData]] = []
+    self.queued = 0
+    self.sent: list[CanData] = []
+    self.received: list[CanData] = []
+
+  def can_send(self, msgs: list[CanData]) -> None:
+    now = time.monotonic()
+    for msg in msgs:
+      self.sent.append(msg)
+      for ecu in self.ecus:
+        if ecu.listens_to(msg):
+          for delay, frame in ecu.receive(msg):
+            heapq.heappush(self.rx_queue, (now + delay, self.queued, frame))
+            self.queued += 1
+
+  def can_recv(self, wait_for_one: bool = False) -> list[list[CanData]]:
+    now = time.monotonic()
+    if wait_for_one and (not self.rx_queue or self.rx_queue[0][0] > now):
+      time.sleep(min(self.rx_queue[0][0] - now, MAX_RECV_WAIT) if self.rx_queue else MAX_RECV_WAIT)
+      now = time.monotonic()
+
+    msgs = []
+    while self.rx_queue and self.rx_queue[0][0] <= now:
+      msgs.append(heapq.heappop(self.rx_queue)[2])
+    self.received.extend(msgs)
+    return [msgs] if msgs else []
+
+  def reset_traffic(self) -> None:
+    self.sent.clear()
+    self.received.clear()
+
+
+class _VirtualClockSelector:
+  """Selector of a VirtualClockEventLoop, waiting for the next timer advances the clock instead"""
+  def __init__(self, selector, clock: 'VirtualClock'):
+    self.selector = selector
+    self.clock = clock
+
+  def select(self, timeout: float | None = None):
+    # no timer to wait for means nothing will ever wake the loop
+    assert timeout is not None, "event loop waiting without a timer"
+    self.clock.sleep(timeout)
+    return self.selector.select(0)
+
+  def __getattr__(self, name):
+    return getattr(self.selector, name)
+
+
+class VirtualClockEventLoop(asyncio.SelectorEventLoop):
+  def __init__(self, clock: 'VirtualClock'):
+    super().__init__()
+    self.clock = clock
+    self._selector = _VirtualClockSelector(self._selector, clock)
+
+  def time(self) -> float:
+    return self.clock.now
+
+
+class VirtualClock:
+  """Simulated time, which only passes while sleeping or while an event loop waits for its next timer.
+  Within patch(), simulated ECU latencies and query timeouts don't depend on how fast the test runs."""
+  def __init__(self):
+    self.now = 0.
+
+  def monotonic(self) -> float:
+    return self.now
+
+  def sleep(self, secs: float) -> None:
+    self.now += max(secs, 0.)
+
+  @contextlib.contextmanager
+  def patch(self):
+    with patch("time.monotonic", self.monotonic), patch("time.sleep", self.sleep), \
+         patch("asyncio.events.new_event_loop", lambda: VirtualClockEventLoop(self)):
+      yield self
+
+
+def ecus_for_platform(brand: str, platform: str, vin: str | None = None, vin_bus: int = 1, **kwargs) -> list[SimulatedEcu]:
+  """ECUs of a platform answering its brand's FW queries with the first known version, on every bus they're queried on.
+  With vin, the engine ECU also answers the UDS and OBD VIN requests on vin_bus. Extra arguments configure every ECU."""
+  ecus: dict[tuple[int, int | None, int, int], SimulatedEcu] = {}
+
+  def get_ecu(tx_addr: int, sub_addr: int | None, bus: int, rx_offset: int) -> SimulatedEcu:
+    # 29-bit response addresses don't depend on rx_offset
+    key = (tx_addr, sub_addr, bus, uds.get_rx_addr_for_tx_addr(tx_addr, rx_offset))
+    if key not in ecus:
+      ecus[key] = SimulatedEcu(tx_addr, bus, {}, rx_offset=rx_offset, sub_addr=sub_addr, **kwargs)
+    return ecus[key]
+
+  for (ecu_type, tx_addr, sub_addr), versions in VERSIONS[brand][platform].items():
+    for r in FW_QUERY_CONFIGS[brand].requests:
+      if len(r.whitelist_ecus) and ecu_type not in r.whitelist_ecus:
+        continue
+      responses = get_ecu(tx_addr, sub_addr, r.bus, r.rx_offset).responses
+      responses.update(zip(r.request[:-1], r.response[:-1], strict=True))
+      responses[r.request[-1]] = r.response[-1] + versions[0]
+
+  if vin is not None:
+    get_ecu(0x7e0, None, vin_bus, 0x8).responses.update({
+      StdQueries.UDS_VIN_REQUEST: StdQueries.UDS_VIN_RESPONSE + vin.encode(),
+      StdQueries.OBD_VIN_REQUEST: StdQueries.OBD_VIN_RESPONSE + vin.encode(),
+    })
+  return list(ecus.values())
+
+
+class SimulatedPanda:
+  """The panda can_send/can_recv interface uds.UdsClient expects, on a simulated bus"""
+  def __init__(self, can: SimulatedCanBus):
+    self.can = can
+
+  def can_send(self, addr: int, dat: bytes, bus: int, timeout: int = 0) -> None:
+    self.can.can_send([CanData(addr, dat, bus)])
+
+  def can_recv(self) -> list[CanData]:
+    return [msg for packet in self.can.can_recv() for msg in packet]
@@ -1,7 +1,9 @@
+import random
 import unittest
 from opendbc.car.can_definitions import CanData
 from opendbc.car.car_helpers import FRAME_FINGERPRINT, can_fingerprint
-from opendbc.car.fingerprints import _FINGERPRINTS as FINGERPRINTS
+from opendbc.car.fingerprints import _FINGERPRINTS as FINGERPRINTS, all_legacy_fingerprint_cars, all_legacy_fingerprint_cars_mask, \
+                                     eliminate_incompatible_cars, eliminate_incompatible_cars_mask, mask_to_cars
 from opendbc.testing import parameterized
 
 
@@ -54,3 +56,14 @@ class TestCanFingerprint(unittest.TestCase):
         car_fingerprint, _ = can_fingerprint(can_recv)
         assert car_fingerprint == car_model
         assert frames == expected_frames + 2  # TODO: fix extra frames
+
+  def test_eliminate_incompatible_cars_mask(self):
+    addrs = sorted({(addr, length) for fingerprints in FINGERPRINTS.values() for f in fingerprints for addr, length in f.items()})
+    for _ in range(50):
+      cars, mask = all_legacy_fingerprint_cars(), all_legacy_fingerprint_cars_mask()
+      for _ in range(random.randint(1, 10)):
+        addr, length = random.choice(addrs)
+        msg = CanData(addr if random.random() < 0.9 else 0x800 + addr, b'\x00' * (length if random.random() < 0.9 else length + 1), 0)
+        cars = eliminate_incompatible_cars(msg, cars)
+        mask = eliminate_incompatible_cars_mask(msg, mask)
+        assert mask_to_cars(mask) == cars
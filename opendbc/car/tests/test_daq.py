@@ -0,0 +1,171 @@
+import struct
+import unittest
+
+import numpy as np
+
+from opendbc.car import ccp, xcp
+from opendbc.car.daq import DaqList, DaqVariable
+
+TX_ADDR, RX_ADDR = 0x700, 0x701
+VARIABLES = [(0x1000, 4), (0x1004, 4), (0x2000, 2), (0x2002, 1), (0x3000, 2)]
+
+
+class FakeDaqEcu:
+  """Panda with an XCP or CCP slave behind it, sending a DTO per ODT of its DAQ list each event cycle"""
+  def __init__(self, protocol: str, first_pid: int = 0x10, timestamp_size: int = 0, min_daq: int = 0):
+    self.protocol = protocol
+    self.first_pid = first_pid
+    self.timestamp_size = timestamp_size
+    self.min_daq = min_daq
+    self.daq_lists: set[int] = set()
+    self.memory = bytearray(0x4000)
+    self.odts: dict[int, list[tuple[int, int]]] = {}
+    self.ptr = (0, 0)
+    self.running = False
+    self.ticks = 0
+    self.rx: list[tuple[int, bytes, int]] = []
+    self.commands: list[int] = []
+
+  def can_clear(self, bus):
+    pass
+
+  def _respond(self, dat: bytes) -> bytes:
+    cmd = dat[0]
+    self.commands.append(cmd)
+    if self.protocol == "ccp":
+      crm = bytes([0xFF, 0x00, dat[1]])
+      if cmd == ccp.COMMAND_CODE.GET_DAQ_SIZE:
+        return crm + bytes([8, self.first_pid])
+      if cmd == ccp.COMMAND_CODE.SET_DAQ_PTR:
+        self.ptr = (dat[3], dat[4])
+      elif cmd == ccp.COMMAND_CODE.WRITE_DAQ:
+        self.odts.setdefault(self.ptr[0], []).append((struct.unpack(">I", dat[4:8])[0], dat[2]))
+      elif cmd == ccp.COMMAND_CODE.START_STOP_ALL:
+        self.running = dat[2] == 1
+      return crm
+
+    if cmd == xcp.COMMAND_CODE.CONNECT:
+      # little endian, max CTO and DTO of 8 bytes
+      return bytes([0xFF, 0x04, 0x00, 8, 8, 0, 1, 1])
+    if cmd == xcp.COMMAND_CODE.GET_DAQ_RESOLUTION_INFO:
+      # 10us ticks
+      return bytes([0xFF, 1, 7, 1, 7, 0x30 | self.timestamp_size, 10, 0])
+    if cmd == xcp.COMMAND_CODE.GET_DAQ_PROCESSOR_INFO:
+      # dynamic DAQ, 4 lists and 1 event channel
+      return bytes([0xFF, 0x01, 4, 0, 1, 0, self.min_daq, 0])
+    if cmd in (xcp.COMMAND_CODE.ALLOC_ODT, xcp.COMMAND_CODE.ALLOC_ODT_ENTRY, xcp.COMMAND_CODE.SET_DAQ_PTR,
+               xcp.COMMAND_CODE.SET_DAQ_LIST_MODE, xcp.COMMAND_CODE.START_STOP_DAQ_LIST):
+      self.daq_lists.add(struct.unpack("<H", dat[2:4])[0])
+    if cmd == xcp.COMMAND_CODE.SET_DAQ_PTR:
+      self.ptr = (dat[4], 0)
+    elif cmd == xcp.COMMAND_CODE.WRITE_DAQ:
+      self.odts.setdefault(self.ptr[0], []).append((struct.unpack("<I", dat[4:8])[0], dat[2]))
+    elif cmd == xcp.COMMAND_CODE.START_STOP_DAQ_LIST:
+      return bytes([0xFF, self.first_pid])
+    elif cmd == xcp.COMMAND_CODE.START_STOP_SYNCH:
+      self.running = dat[1] == xcp.START_STOP_SYNCH_MODE.START_SELECTED
+    return bytes([0xFF])
+
+  def can_send(self, addr, dat, bus, timeout=0):
+    self.rx.append((RX_ADDR, self._respond(dat).ljust(8, b"\x00"), bus))
+
+  def cycle(self, skip_odt: int | None = None) -> None:
+    for odt_num, entries in sorted(self.odts.items()):
+      dat = b"".join(bytes(self.memory[addr:addr + size]) for addr, size in entries)
+      if odt_num == 0 and self.timestamp_size:
+        dat = self.ticks.to_bytes(self.timestamp_size, "little") + dat
+      if odt_num != skip_odt:
+        self.rx.append((RX_ADDR, bytes([self.first_pid + odt_num]) + dat.ljust(7, b"\x00"), 0))
+    self.ticks = (self.ticks + 1000) % (1 << (8 * self.timestamp_size)) if self.timestamp_size else 0
+
+  def can_recv(self):
+    rx, self.rx = self.rx, []
+    return rx
+
+
+def set_values(ecu: FakeDaqEcu, i: int, byte_order: str) -> tuple:
+  values = (i, 0xdeadbeef - i, 0x1234 + i, i & 0xFF, 0xbeef)
+  for (addr, size), v in zip(VARIABLES, values, strict=True):
+    ecu.memory[addr:addr + size] = v.to_bytes(size, "big" if byte_order == ">" else "little")
+  return values
+
+
+class TestDaq(unittest.TestCase):
+  def test_allocate_odts(self):
+    daq = DaqList(VARIABLES, 7, "<")
+    assert [[e.size for e in odt] for odt in daq.odts] == [[4], [4, 2, 1], [2]]
+    # variables don't span ODTs, or exceed an ODT
+    with self.assertRaises(ValueError):
+      DaqList([(0x1000, 8)], 7, "<")
+    with self.assertRaises(ValueError):
+      DaqList([(0x1000, 3)], 7, "<", entry_sizes=ccp.DAQ_ELEMENT_SIZES)
+
+  def test_ring_buffer(self):
+    daq = DaqList([DaqVariable(0x1000, 2, name="speed")], 7, ">", capacity=4)
+    for i in range(6):
+      daq.decode(0, i.to_bytes(2, "big"), float(i))
+    timestamps, samples = daq.buffer.get()
+    assert len(daq.buffer) == 4 and daq.buffer.count == 6
+    np.testing.assert_array_equal(timestamps, [2, 3, 4, 5])
+    np.testing.assert_array_equal(samples["speed"], [2, 3, 4, 5])
+    np.testing.assert_array_equal(daq.buffer.get(2)[1]["speed"], [4, 5])
+
+  def _run_daq(self, ecu: FakeDaqEcu, client, byte_order: str, **kwargs):
+    daq = client.configure_daq(VARIABLES, capacity=8, **kwargs)
+    assert [ecu.odts[i] for i in sorted(ecu.odts)] == [VARIABLES[:1], VARIABLES[1:4], VARIABLES[4:]]
+    client.start_daq()
+    assert ecu.running
+
+    expected = [set_values(ecu, 0, byte_order)]
+    ecu.cycle()
+    expected.append(set_values(ecu, 1, byte_order))
+    ecu.cycle()
+    # a missed DTO drops its sample
+    set_values(ecu, 2, byte_order)
+    ecu.cycle(skip_odt=1)
+    expected.append(set_values(ecu, 3, byte_order))
+    ecu.cycle()
+    # all DTOs received so far are decoded without a command round-trip
+    num_commands = len(ecu.commands)
+    assert client.poll_daq() == 3
+    assert len(ecu.commands) == num_commands
+    assert daq.buffer.dropped == 1
+
+    timestamps, samples = daq.buffer.get()
+    assert [tuple(int(x) for x in s) for s in samples] == expected
+    client.stop_daq()
+    assert not ecu.running
+    return timestamps
+
+  def test_xcp(self):
+    ecu = FakeDaqEcu("xcp")
+    client = xcp.XcpClient(ecu, TX_ADDR, RX_ADDR)
+    client.connect()
+    self._run_daq(ecu, client, "<")
+    assert ecu.daq_lists == {0}
+
+  def test_xcp_min_daq(self):
+    # the dynamic list comes after the ECU's predefined and static lists
+    ecu = FakeDaqEcu("xcp", min_daq=2)
+    client = xcp.XcpClient(ecu, TX_ADDR, RX_ADDR)
+    client.connect()
+    self._run_daq(ecu, client, "<")
+    assert ecu.daq_lists == {2}
+
+  def test_xcp_ecu_timestamps(self):
+    ecu = FakeDaqEcu("xcp", timestamp_size=2)
+    client = xcp.XcpClient(ecu, TX_ADDR, RX_ADDR)
+    client.connect()
+    ecu.ticks = 0xFFFF - 1500
+    timestamps = self._run_daq(ecu, client, "<", ecu_timestamps=True)
+    # 1000 ticks of 10us per cycle, past the counter wrapping around
+    np.testing.assert_allclose(np.diff(timestamps), [0.01, 0.02])
+
+  def test_ccp(self):
+    ecu = FakeDaqEcu("ccp", first_pid=0x20)
+    client = ccp.CcpClient(ecu, TX_ADDR, RX_ADDR)
+    self._run_daq(ecu, client, ">")
+
+
+if __name__ == "__main__":
+  unittest.main()
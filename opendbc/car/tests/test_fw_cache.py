@@ -0,0 +1,85 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from opendbc.car.fw_cache import FW_CACHE_MAX_AGE, cache_fw_versions, get_cached_fw_versions, load_fw_cache, save_fw_cache
+from opendbc.car.fw_query_definitions import ESSENTIAL_ECUS
+from opendbc.car.fw_versions import get_fw_versions, match_fw_to_car
+from opendbc.car.tests.benchmark_fw_query import DEFAULT_VIN
+from opendbc.car.tests.simulated_ecus import SimulatedCanBus, ecus_for_platform
+from opendbc.car.vin import VIN_UNKNOWN
+
+BRAND, PLATFORM = "toyota", "TOYOTA_AVALON"
+
+
+class TestFwCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.env = patch.dict(os.environ, {"OPENDBC_FW_CACHE_DIR": self.tmpdir.name})
+    self.env.start()
+
+    self.can = SimulatedCanBus(ecus_for_platform(BRAND, PLATFORM))
+    self.car_fw = get_fw_versions(self.can.can_recv, self.can.can_send, lambda obd: None, BRAND)
+    assert match_fw_to_car(self.car_fw, DEFAULT_VIN, log=False)[1] == {PLATFORM}
+    self.can.reset_traffic()
+
+  def tearDown(self):
+    self.env.stop()
+    self.tmpdir.cleanup()
+
+  def get_cached(self, vin: str = DEFAULT_VIN):
+    return get_cached_fw_versions(self.can.can_recv, self.can.can_send, lambda obd: None, vin)
+
+  def test_round_trip(self):
+    cache_fw_versions(DEFAULT_VIN, self.car_fw)
+    cached = load_fw_cache(DEFAULT_VIN)
+    assert [c.car_fw.to_dict() for c in cached] == [fw.to_dict() for fw in self.car_fw]
+
+    # nothing is loaded for a VIN that wasn't cached, or when disabled, which is the default
+    assert self.get_cached("1" * 17) is None
+    with patch.dict(os.environ, {"OPENDBC_FW_CACHE_DIR": ""}):
+      assert load_fw_cache(DEFAULT_VIN) is None
+    with patch.dict(os.environ):
+      del os.environ["OPENDBC_FW_CACHE_DIR"]
+      assert load_fw_cache(DEFAULT_VIN) is None
+
+  def test_unknown_vin(self):
+    # cars without a VIN don't share a cache
+    cache_fw_versions(VIN_UNKNOWN, self.car_fw)
+    assert os.listdir(self.tmpdir.name) == []
+    assert load_fw_cache(VIN_UNKNOWN) is None
+    assert self.get_cached(VIN_UNKNOWN) is None
+
+  def test_revalidate(self):
+    assert self.get_cached() is None
+    cache_fw_versions(DEFAULT_VIN, self.car_fw)
+
+    car_fw = self.get_cached()
+    assert [fw.to_dict() for fw in car_fw] == [fw.to_dict() for fw in self.car_fw]
+    # only essential ECUs are queried, and each just once
+    essential = {(fw.address, fw.subAddress) for fw in self.car_fw if fw.ecu in ESSENTIAL_ECUS}
+    queried = {(m.address, m.dat[0] if m.address == 0x750 else 0) for m in self.can.sent}
+    assert 0 < len(queried) == len(essential) < len(self.car_fw)
+    assert queried == essential
+
+  def test_invalidated(self):
+    cache_fw_versions(DEFAULT_VIN, self.car_fw)
+    essential = next(fw for fw in self.car_fw if fw.ecu in ESSENTIAL_ECUS)
+    for ecu in self.can.ecus:
+      if ecu.tx_addr == essential.address:
+        ecu.responses = {req: resp + b"new" for req, resp in ecu.responses.items()}
+    assert self.get_cached() is None
+
+  def test_expired(self):
+    cache_fw_versions(DEFAULT_VIN, self.car_fw)
+    cached = load_fw_cache(DEFAULT_VIN)
+    # non-essential ECUs aren't revalidated, and force a full query once too old
+    cached[0].timestamp = time.time() - FW_CACHE_MAX_AGE - 1
+    save_fw_cache(DEFAULT_VIN, cached)
+    assert self.get_cached() is None
+
+
+if __name__ == "__main__":
+  unittest.main()
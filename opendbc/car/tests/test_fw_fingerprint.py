@@ -8,8 +8,12 @@ from opendbc.car.can_definitions import CanData
 from opendbc.car.car_helpers import interfaces
 from opendbc.car.structs import CarParams
 from opendbc.car.fingerprints import FW_VERSIONS
-from opendbc.car.fw_versions import FW_QUERY_CONFIGS, FUZZY_EXCLUDE_ECUS, VERSIONS, build_fw_dict, \
-                                    match_fw_to_car, get_brand_ecu_matches, get_fw_versions, get_present_ecus
+from opendbc.car.fw_query_definitions import ESSENTIAL_ECUS
+from opendbc.car.fw_versions import FW_QUERY_CONFIGS, FUZZY_EXCLUDE_ECUS, VERSIONS, build_fw_dict, get_fw_index, \
+                                    match_fw_to_car, match_fw_to_cars, get_brand_ecu_matches, get_fw_versions, \
+                                    get_fw_versions_concurrent, get_present_ecus
+from opendbc.car.tests.benchmark_fw_query import DEFAULT_VIN, benchmark_platform
+from opendbc.car.tests.simulated_ecus import SimulatedCanBus, VirtualClock, ecus_for_platform
 from opendbc.car.vin import get_vin
 from opendbc.testing import parameterized
 
@@ -97,6 +101,66 @@ class TestFwFingerprint(unittest.TestCase):
       elif len(matches):
         self.assertFingerprints(matches, car_model)
 
+  @parameterized("brand", VERSIONS.keys())
+  def test_fw_index(self, brand):
+    # Asserts the index agrees with checking each candidate's ECUs one by one
+    index = get_fw_index(brand)
+    assert set(index.candidates) == set(VERSIONS[brand])
+    config = FW_QUERY_CONFIGS[brand]
+    all_versions = defaultdict(set)
+    for ecus in VERSIONS[brand].values():
+      for ecu, fw_versions in ecus.items():
+        all_versions[ecu[1:]].update(fw_versions)
+
+    for _ in range(100):
+      live_fw_versions = {addr: set(random.sample(sorted(fws), min(len(fws), random.randint(0, 2))))
+                          for addr, fws in all_versions.items() if random.random() < 0.8}
+      expected = set()
+      for car_model, ecus in VERSIONS[brand].items():
+        for (ecu_type, addr, sub_addr), fw_versions in ecus.items():
+          found_versions = live_fw_versions.get((addr, sub_addr), set())
+          if not found_versions:
+            if ecu_type in ESSENTIAL_ECUS and car_model not in config.non_essential_ecus.get(ecu_type, []):
+              break
+          elif ecu_type != Ecu.debug and found_versions.isdisjoint(fw_versions):
+            break
+        else:
+          expected.add(car_model)
+      assert index.to_candidates(index.match_exact(live_fw_versions)) == expected
+
+  def test_match_fw_to_cars(self):
+    cars = []
+    for car_model, ecus in random.Random(0).sample(sorted(FW_VERSIONS.items()), 40):
+      brand = interfaces[car_model].get_non_essential_params(car_model).brand
+      # drop an ECU, some cars will only match fuzzy or not at all
+      dropped = random.choice(list(ecus))
+      fw = [CarFw(ecu=ecu[0], fwVersion=random.choice(fw_versions), brand=brand, address=ecu[1], subAddress=0 if ecu[2] is None else ecu[2])
+            for ecu, fw_versions in ecus.items() if ecu != dropped]
+      cars.append((fw, "1" * 17))
+
+    results = match_fw_to_cars(cars)
+    assert results == match_fw_to_cars(cars, workers=2)
+    for (fw, vin), result in zip(cars, results, strict=True):
+      assert (result.exact, result.candidates) == match_fw_to_car(fw, vin, log=False)
+      if result.exact:
+        assert result.candidates <= result.missing_essential_ecus.keys()
+
+  def test_missing_non_essential_ecus(self):
+    # cars exempt from an essential ECU match without it, and don't report it missing
+    for brand, config in FW_QUERY_CONFIGS.items():
+      for ecu_type, car_models in config.non_essential_ecus.items():
+        for car_model in car_models:
+          ecus = FW_VERSIONS[car_model]
+          dropped = [ecu for ecu in ecus if ecu[0] == ecu_type]
+          if not dropped:
+            continue
+          with self.subTest(car_model=car_model, ecu=ecu_type):
+            fw = [CarFw(ecu=ecu[0], fwVersion=fw_versions[0], brand=brand, address=ecu[1], subAddress=0 if ecu[2] is None else ecu[2])
+                  for ecu, fw_versions in ecus.items() if ecu not in dropped]
+            result = match_fw_to_cars([(fw, "1" * 17)])[0]
+            assert result.exact and car_model in result.candidates
+            assert result.missing_essential_ecus[car_model] == set()
+
   def test_fw_version_lists(self):
     for car_model, ecus in FW_VERSIONS.items():
       with self.subTest(car_model=car_model.value):
@@ -296,6 +360,44 @@ class TestFwFingerprintTiming(unittest.TestCase):
       self._assert_timing(total_time, total_ref_time)
       print(f'all brands, total FW query time={total_time} seconds')
 
+  def test_fw_query_scheduler(self):
+    # same FW versions as the sequential query, switching OBD multiplexing once. The simulated ECUs answer
+    # without latency and frames that are due are received before timing out, so this doesn't depend on wall-clock time
+    def fw_key(f):
+      return f.brand, f.ecu, f.address, f.subAddress, f.fwVersion, tuple(f.request), f.bus, f.logging, f.obdMultiplexing
+
+    results = {}
+    for concurrent in (False, True):
+      switches = []
+
+      def set_obd_multiplexing(obd_multiplexing, switches=switches):
+        if not switches or obd_multiplexing != switches[-1]:
+          switches.append(obd_multiplexing)
+
+      can = SimulatedCanBus(ecus_for_platform('hyundai', 'HYUNDAI_AZERA_6TH_GEN'))
+      if concurrent:
+        car_fw, phases = get_fw_versions_concurrent(can.can_recv, can.can_send, set_obd_multiplexing, 'hyundai')
+        assert [p.obd_multiplexing for p in phases] == [True, False]
+        assert sum(p.queries for p in phases) > len(phases)
+      else:
+        car_fw = get_fw_versions(can.can_recv, can.can_send, set_obd_multiplexing, 'hyundai')
+      results[concurrent] = (sorted(map(fw_key, car_fw)), switches)
+
+    assert len(results[False][0]) > 0
+    assert results[True][0] == results[False][0]
+    assert results[True][1] == [True, False]
+
+  @parameterized("brand, platform", [("hyundai", "HYUNDAI_AZERA_6TH_GEN"), ("toyota", "TOYOTA_AVALON")])
+  def test_simulated_fingerprint(self, brand, platform):
+    # VIN, present ECU and ordered FW queries against slow ECUs of a platform
+    for concurrent in (False, True):
+      with self.subTest(concurrent=concurrent):
+        with VirtualClock().patch():
+          stats, vin, matches = benchmark_platform(brand, platform, concurrent=concurrent, latency=0.005, response_pending=0.02)
+        assert vin == DEFAULT_VIN
+        assert matches == {platform}
+        assert all(s.frames_sent > 0 and s.frames_received > 0 for s in stats)
+
   def test_get_fw_versions(self):
     # some coverage on IsoTpParallelQuery and panda UDS library
     # TODO: replace this with full fingerprint simulation testing
@@ -0,0 +1,141 @@
+import asyncio
+import time
+import unittest
+
+from opendbc.car import uds
+from opendbc.car.fw_query_definitions import StdQueries
+from opendbc.car.isotp_parallel_query import AsyncIsoTpParallelQuery, CanDemux, IsoTpParallelQuery
+from opendbc.car.tests.simulated_ecus import SimulatedCanBus, SimulatedEcu
+
+REQUEST = StdQueries.UDS_VERSION_REQUEST
+RESPONSE = StdQueries.UDS_VERSION_RESPONSE
+
+
+def make_ecus(bus: int = 0) -> list[SimulatedEcu]:
+  return [
+    SimulatedEcu(0x7e0, bus, {REQUEST: RESPONSE + b"short"}),
+    SimulatedEcu(0x7e1, bus, {REQUEST: RESPONSE + b"a much longer multi-frame firmware version"}),
+    SimulatedEcu(0x750, bus, {REQUEST: RESPONSE + b"sub-address 0xf"}, sub_addr=0xf),
+    SimulatedEcu(0x750, bus, {REQUEST: RESPONSE + b"another sub-address"}, sub_addr=0x6d),
+    # negative response
+    SimulatedEcu(0x7e2, bus, {REQUEST: bytes([0x7f, REQUEST[0], 0x11])}),
+    SimulatedEcu(0x18da10f1, bus, {REQUEST: RESPONSE + b"29-bit"}),
+  ]
+
+
+ADDRS = [(0x7e0, None), (0x7e1, None), (0x750, 0xf), (0x750, 0x6d), (0x7e2, None), (0x18da10f1, None), (0x7e3, None)]
+EXPECTED = {
+  (0x7e0, None): b"short",
+  (0x7e1, None): b"a much longer multi-frame firmware version",
+  (0x750, 0xf): b"sub-address 0xf",
+  (0x750, 0x6d): b"another sub-address",
+  (0x18da10f1, None): b"29-bit",
+}
+
+
+class TestIsoTpParallelQuery(unittest.TestCase):
+  def test_simulated_ecus(self):
+    # the harness itself, through the existing query
+    can = SimulatedCanBus(make_ecus())
+    query = IsoTpParallelQuery(can.can_send, can.can_recv, 0, ADDRS, [REQUEST], [RESPONSE])
+    assert query.get_data(0.1) == EXPECTED
+
+  def test_async_query(self):
+    can = SimulatedCanBus(make_ecus())
+
+    async def run():
+      async with CanDemux(can.can_recv) as demux:
+        query = AsyncIsoTpParallelQuery(can.can_send, demux, 0, ADDRS, [REQUEST], [RESPONSE])
+        return await query.get_data(0.1)
+
+    assert asyncio.run(run()) == EXPECTED
+
+  def test_multiple_requests(self):
+    ecus = [SimulatedEcu(0x7e0, 0, {StdQueries.TESTER_PRESENT_REQUEST: StdQueries.TESTER_PRESENT_RESPONSE,
+                                    REQUEST: RESPONSE + b"after tester present"}),
+            # doesn't answer the second request
+            SimulatedEcu(0x7e1, 0, {StdQueries.TESTER_PRESENT_REQUEST: StdQueries.TESTER_PRESENT_RESPONSE})]
+    can = SimulatedCanBus(ecus)
+
+    async def run():
+      async with CanDemux(can.can_recv) as demux:
+        query = AsyncIsoTpParallelQuery(can.can_send, demux, 0, [0x7e0, 0x7e1], [StdQueries.TESTER_PRESENT_REQUEST, REQUEST],
+                                        [StdQueries.TESTER_PRESENT_RESPONSE, RESPONSE])
+        return await query.get_data(0.1)
+
+    assert asyncio.run(run()) == {(0x7e0, None): b"after tester present"}
+
+  def test_functional_addrs(self):
+    vin = b"1HGBH41JXMN109186"
+    ecus = [SimulatedEcu(0x7e0, 0, {StdQueries.UDS_VIN_REQUEST: StdQueries.UDS_VIN_RESPONSE + vin}),
+            SimulatedEcu(0x18da10f1, 0, {StdQueries.UDS_VIN_REQUEST: StdQueries.UDS_VIN_RESPONSE + vin[::-1]})]
+    tx_addrs = [a for a in range(0x700, 0x800) if a != 0x7DF] + list(range(0x18DA00F1, 0x18DB00F1, 0x100))
+    can = SimulatedCanBus(ecus)
+
+    async def run():
+      async with CanDemux(can.can_recv) as demux:
+        query = AsyncIsoTpParallelQuery(can.can_send, demux, 0, tx_addrs, [StdQueries.UDS_VIN_REQUEST], [StdQueries.UDS_VIN_RESPONSE],
+                                        functional_addrs=uds.FUNCTIONAL_ADDRS)
+        return await query.get_data(0.1)
+
+    assert asyncio.run(run()) == {(0x7e0, None): vin, (0x18da10f1, None): vin[::-1]}
+
+  def test_buses_overlap(self):
+    # queries on different buses share one demux and run concurrently
+    can = SimulatedCanBus(make_ecus(0) + make_ecus(1))
+
+    async def run():
+      async with CanDemux(can.can_recv) as demux:
+        queries = [AsyncIsoTpParallelQuery(can.can_send, demux, bus, ADDRS, [REQUEST], [RESPONSE]) for bus in (0, 1)]
+        return await asyncio.gather(*(q.get_data(0.1) for q in queries))
+
+    t = time.monotonic()
+    assert asyncio.run(run()) == [EXPECTED, EXPECTED]
+    # bounded by the one non-responding ECU per bus timing out in parallel
+    assert time.monotonic() - t < 0.19
+
+  def test_response_pending(self):
+    # a slow ECU holds the query open past its timeout with response pending
+    ecus = make_ecus()
+    for ecu in ecus:
+      ecu.latency = 0.01
+    ecus[1].response_pending = 0.15
+    can = SimulatedCanBus(ecus)
+    query = IsoTpParallelQuery(can.can_send, can.can_recv, 0, ADDRS, [REQUEST], [RESPONSE])
+    t = time.monotonic()
+    assert query.get_data(0.1) == EXPECTED
+    assert time.monotonic() - t > 0.15
+
+  def test_flow_control(self):
+    # multi-frame request and response with block size and separation time in both directions
+    request = REQUEST + b"\x00" * 20
+    ecu = SimulatedEcu(0x7e0, 0, {request: RESPONSE + b"x" * 40}, block_size=2, st_min=0xF5)
+    can = SimulatedCanBus([ecu])
+    query = IsoTpParallelQuery(can.can_send, can.can_recv, 0, [0x7e0], [request], [RESPONSE])
+    assert query.get_data(0.1) == {(0x7e0, None): b"x" * 40}
+    # the ECU asks for the request in two blocks
+    assert sum(m.dat[0] >> 4 == uds.ISOTP_FRAME_TYPE.FLOW for m in can.received) == 2
+    # first and 3 consecutive frames of the request, flow control for the response
+    assert len(can.sent) == 4 + 1
+
+  def test_stale_frames(self):
+    # a late answer to an earlier query to the same ECU isn't taken as the response to the next one
+    ecu = SimulatedEcu(0x7e0, 0, {StdQueries.TESTER_PRESENT_REQUEST: StdQueries.TESTER_PRESENT_RESPONSE, REQUEST: RESPONSE + b"short"},
+                       latency=0.02)
+    can = SimulatedCanBus([ecu])
+
+    async def run():
+      async with CanDemux(can.can_recv) as demux:
+        query = AsyncIsoTpParallelQuery(can.can_send, demux, 0, [0x7e0], [StdQueries.TESTER_PRESENT_REQUEST],
+                                        [StdQueries.TESTER_PRESENT_RESPONSE])
+        assert await query.get_data(0.01) == {}
+        # the late answer comes in without the demux getting to route it
+        time.sleep(0.03)
+        query = AsyncIsoTpParallelQuery(can.can_send, demux, 0, [0x7e0], [REQUEST], [RESPONSE])
+        return await query.get_data(0.1)
+
+    assert asyncio.run(run()) == {(0x7e0, None): b"short"}
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,140 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import zstandard as zstd
+
+from opendbc.car import logreader
+from opendbc.car.logreader import INDEX_SUFFIX, CanFrames, LogReader, capnp_log
+
+
+def make_log(n: int, max_jitter: int = 0) -> bytes:
+  rng = random.Random(n)
+  dat = b""
+  for i in range(n):
+    evt = capnp_log.Event.new_message()
+    evt.logMonoTime = i * 10 + rng.randint(0, max_jitter)
+    if i % 4 == 0:
+      evt.frame = None
+    else:
+      can = evt.init("can", i % 3 + 1)
+      for j, c in enumerate(can):
+        c.address = 0x100 + i
+        c.dat = bytes([i % 256]) * (j + 1)
+        c.src = j
+    dat += evt.to_bytes()
+  return dat
+
+
+class TestLogReader(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def write(self, name: str, dat: bytes) -> str:
+    fn = os.path.join(self.tmpdir.name, name)
+    with open(fn, "wb") as f:
+      f.write(dat)
+    return fn
+
+  def test_streaming(self):
+    dat = make_log(500)
+    for fn in (self.write("rlog", dat), self.write("rlog.zst", zstd.compress(dat)), self.write("rlog_zst", zstd.compress(dat))):
+      ref = [e.to_dict() for e in LogReader(fn)]
+      assert len(ref) == 500
+      for chunk_size in (1, 100, 1 << 20):
+        with self.subTest(fn=fn, chunk_size=chunk_size):
+          lr = LogReader(fn, streaming=True)
+          lr._chunk_size = chunk_size
+          assert [e.to_dict() for e in lr] == ref
+
+      lr = LogReader(fn, streaming=True)
+      assert lr.first("can")[0].address == 0x101
+      assert len(list(lr.filter("can"))) == 375
+
+  def test_reorder_window(self):
+    # events are at most 5 positions out of order
+    fn = self.write("rlog", make_log(300, max_jitter=50))
+    ref = [e.logMonoTime for e in LogReader(fn, sort_by_time=True)]
+    assert ref == sorted(ref)
+    assert [e.logMonoTime for e in LogReader(fn, sort_by_time=True, streaming=True, reorder_window=5)] == ref
+    assert [e.logMonoTime for e in LogReader(fn, sort_by_time=True, streaming=True, reorder_window=1)] != ref
+
+  def test_indexed(self):
+    fn = self.write("rlog", make_log(400, max_jitter=50))
+    for sort_by_time in (False, True):
+      ref = LogReader(fn, sort_by_time=sort_by_time)
+      lr = LogReader(fn, sort_by_time=sort_by_time, indexed=True)
+      assert os.path.exists(fn + INDEX_SUFFIX)
+      assert [e.to_dict() for e in lr] == [e.to_dict() for e in ref]
+      assert [c.to_dict() for c in lr.first("can")] == [c.to_dict() for c in ref.first("can")]
+      assert len(list(lr.filter("can"))) == 300
+      assert list(lr.filter("initData")) == []
+
+      for msg_type in (None, "can", "frame"):
+        expected = [e.to_dict() for e in ref.between(1000, 2000, msg_type)]
+        assert len(expected) > 0
+        assert [e.to_dict() for e in lr.between(1000, 2000, msg_type)] == expected
+
+  def test_stale_index(self):
+    fn = self.write("rlog", make_log(20))
+    assert len(list(LogReader(fn, indexed=True))) == 20
+    index = np.load(fn + INDEX_SUFFIX)["index"]
+    assert index["offset"][0] == 0 and index["offset"][-1] + index["size"][-1] == os.path.getsize(fn)
+
+    # rewriting the log invalidates the sidecar
+    fn = self.write("rlog", make_log(30))
+    assert len(list(LogReader(fn, indexed=True))) == 30
+    assert len(np.load(fn + INDEX_SUFFIX)["index"]) == 30
+
+    # as does a truncated one
+    for dat in (b"", b"PK\x03\x04"):
+      with open(fn + INDEX_SUFFIX, "wb") as f:
+        f.write(dat)
+      assert len(list(LogReader(fn, indexed=True))) == 30
+
+    with self.assertRaises(ValueError):
+      LogReader(self.write("rlog.zst", zstd.compress(make_log(5))), indexed=True)
+
+  def test_can_frames(self):
+    lr = LogReader(self.write("rlog", make_log(100)), only_union_types=True)
+    can = [m for m in lr if m.which() == "can"]
+    ref = [(m.logMonoTime, [(c.address, c.dat, c.src) for c in m.can]) for m in can]
+
+    frames = CanFrames.from_events(can)
+    path = os.path.join(self.tmpdir.name, "can.npz")
+    frames.save(path)
+    for f in (frames, CanFrames.load(path)):
+      assert len(f) == 75
+      for (t, msgs), (ref_t, ref_msgs) in zip(f, ref, strict=True):
+        assert t == ref_t
+        assert all(isinstance(m.dat, memoryview) for m in msgs)
+        assert [(m.address, bytes(m.dat), m.src) for m in msgs] == ref_msgs
+
+    assert list(CanFrames.from_events([])) == []
+
+  def test_corrupted(self):
+    dat = make_log(10)
+    fn = self.write("rlog", dat[:-3])
+    for streaming in (False, True):
+      with self.assertWarns(RuntimeWarning):
+        assert len(list(LogReader(fn, streaming=streaming))) == 9
+
+  def test_corrupted_indexed(self):
+    fn = self.write("rlog", make_log(10)[:-3])
+    with self.assertWarns(RuntimeWarning), LogReader(fn, indexed=True) as lr:
+      assert len(list(lr)) == 9
+    assert lr._mm.closed
+
+    # the index of the readable events is kept, not rebuilt on each open
+    with patch.object(logreader, "build_index", wraps=logreader.build_index) as build_index, LogReader(fn, indexed=True) as lr:
+      assert len(list(lr)) == 9
+    build_index.assert_not_called()
+
+
+if __name__ == "__main__":
+  unittest.main()
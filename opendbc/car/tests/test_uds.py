@@ -0,0 +1,86 @@
+import io
+import logging
+import unittest
+from unittest.mock import patch
+
+from opendbc.car import uds
+from opendbc.car.carlog import carlog
+from opendbc.car.tests.simulated_ecus import SimulatedCanBus, SimulatedEcu, SimulatedMemoryEcu, SimulatedPanda
+
+DID = uds.DATA_IDENTIFIER_TYPE.APPLICATION_SOFTWARE_IDENTIFICATION
+REQUEST = bytes([uds.SERVICE_TYPE.READ_DATA_BY_IDENTIFIER]) + DID.to_bytes(2, "big")
+
+
+class TestUds(unittest.TestCase):
+  def read(self, dat: bytes, sub_addr: int | None = None, **kwargs) -> bytes:
+    response = bytes([uds.SERVICE_TYPE.READ_DATA_BY_IDENTIFIER + 0x40]) + REQUEST[1:] + dat
+    panda = SimulatedPanda(SimulatedCanBus([SimulatedEcu(0x7e0, 0, {REQUEST: response}, sub_addr=sub_addr, **kwargs)]))
+    return uds.UdsClient(panda, 0x7e0, sub_addr=sub_addr, timeout=0.1).read_data_by_identifier(DID)
+
+  def test_multi_frame(self):
+    for sub_addr in (None, 0xf):
+      for size in (1, 5, 6, 100, 4000):
+        with self.subTest(sub_addr=sub_addr, size=size):
+          dat = bytes(i % 251 for i in range(size))
+          resp = self.read(dat, sub_addr)
+          assert type(resp) is bytes
+          assert resp == dat
+
+  def test_response_pending(self):
+    assert self.read(b"slow", response_pending=0.01) == b"slow"
+
+  def test_debug_logging(self):
+    level = carlog.level
+    carlog.setLevel(logging.DEBUG)
+    try:
+      with self.assertLogs(carlog, logging.DEBUG) as logs:
+        assert self.read(b"x" * 20, 0xf) == b"x" * 20
+      assert any("consecutive frame" in line for line in logs.output)
+    finally:
+      carlog.setLevel(level)
+
+    # nothing is formatted when debug logging is off
+    carlog.setLevel(logging.INFO)
+    try:
+      with patch.object(carlog, "debug") as debug:
+        assert self.read(b"x" * 20, 0xf) == b"x" * 20
+      debug.assert_not_called()
+    finally:
+      carlog.setLevel(level)
+
+  def memory_client(self, memory: bytes, **kwargs) -> tuple[uds.UdsClient, SimulatedMemoryEcu]:
+    ecu = SimulatedMemoryEcu(0x7e0, 0, {}, memory=bytearray(memory), **kwargs)
+    return uds.UdsClient(SimulatedPanda(SimulatedCanBus([ecu])), 0x7e0, timeout=0.1), ecu
+
+  def test_upload(self):
+    memory = bytes(i % 253 for i in range(20000))
+    # the second block length wraps the block sequence counter
+    for max_block_length, num_blocks in ((0x402, 15), (0x12, 938)):
+      with self.subTest(max_block_length=max_block_length):
+        client, _ = self.memory_client(memory, max_block_length=max_block_length)
+        sink = io.BytesIO()
+        stats = client.upload(0x100, 15000, sink)
+        assert sink.getvalue() == memory[0x100:0x100 + 15000]
+        assert stats.num_bytes == 15000 and stats.num_blocks == num_blocks
+        assert stats.throughput > 0
+
+    with self.assertRaises(uds.NegativeResponseError):
+      client.upload(19000, 2000, io.BytesIO())
+
+  def test_download(self):
+    dat = bytes(i % 241 for i in range(10000))
+    # the ECU asks for the blocks' consecutive frames 8 at a time, 100us apart
+    client, ecu = self.memory_client(bytes(12000), block_size=8, st_min=0xF1)
+    stats = client.download(0x200, io.BytesIO(dat), len(dat))
+    assert ecu.memory[0x200:0x200 + len(dat)] == dat
+    assert ecu.memory[:0x200] == bytes(0x200)
+    assert stats.num_bytes == len(dat) and stats.num_blocks == 10
+    # ~1300 consecutive frames at 100us
+    assert stats.seconds < 1.
+
+    with self.assertRaises(ValueError):
+      client.download(0, io.BytesIO(dat[:100]), 200)
+
+
+if __name__ == "__main__":
+  unittest.main()
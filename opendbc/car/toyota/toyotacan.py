@@ -1,3 +1,5 @@
+import numpy as np
+
 from opendbc.car.structs import CarParams
 
 SteerControlType = CarParams.SteerControlType
@@ -155,12 +157,18 @@ def create_ui_command(packer, steer, chime, left_line, right_line, left_lane_dep
   return packer.make_can_msg("LKAS_HUD", 0, values)
 
 
-def toyota_checksum(address: int, sig, d: bytearray) -> int:
-  s = len(d)
+def _toyota_address_sum(address: int) -> int:
+  s = 0
   addr = address
   while addr:
     s += addr & 0xFF
     addr >>= 8
-  for i in range(len(d) - 1):
-    s += d[i]
-  return s & 0xFF
+  return s
+
+
+def toyota_checksum(address: int, sig, d: bytes | bytearray | memoryview) -> int:
+  return (len(d) + _toyota_address_sum(address) + sum(d[:-1])) & 0xFF
+
+
+def toyota_checksum_batch(address: int, sig, dat: np.ndarray) -> np.ndarray:
+  return (dat.shape[1] + _toyota_address_sum(address) + dat[:, :-1].sum(axis=1, dtype=np.int64)) & 0xFF
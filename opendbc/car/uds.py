@@ -1,7 +1,8 @@
+import logging
 import time
 import struct
 from collections import deque
-from typing import NamedTuple, cast
+from typing import BinaryIO, NamedTuple, cast
 from collections.abc import Callable, Generator
 from enum import IntEnum
 from functools import partial
@@ -172,6 +173,17 @@ class DynamicSourceDefinition(NamedTuple):
   memory_address: int
 
 
+class TransferStats(NamedTuple):
+  num_bytes: int
+  num_blocks: int
+  seconds: float
+
+  @property
+  def throughput(self) -> float:
+    """Bytes per second"""
+    return self.num_bytes / self.seconds if self.seconds > 0 else 0.
+
+
 class DTC_GROUP_TYPE(IntEnum):
   EMISSIONS = 0x000000
   ALL = 0xFFFFFF
@@ -341,7 +353,8 @@ class CanClient:
     self.rx = can_recv
     self.tx_addr = tx_addr
     self.rx_addr = rx_addr
-    self.rx_buff: deque[bytes] = deque()
+    # frames of the rx address, with any sub-address cut off
+    self.rx_buff: deque[bytes | memoryview] = deque()
     self.sub_addr = sub_addr
     self.rx_sub_addr = rx_sub_addr if rx_sub_addr is not None else sub_addr
     self.bus = bus
@@ -364,30 +377,31 @@ class CanClient:
     return bus == self.bus and addr == self.rx_addr
 
   def _recv_buffer(self, drain: bool = False) -> None:
+    debug = carlog.isEnabledFor(logging.DEBUG)
     while True:
       msgs = self.rx()
       if drain:
-        carlog.debug(f"CAN-RX: drain - {len(msgs)}")
+        if debug:
+          carlog.debug(f"CAN-RX: drain - {len(msgs)}")
         self.rx_buff.clear()
       else:
         for rx_addr, rx_data, rx_bus in msgs or []:
           if self._recv_filter(rx_bus, rx_addr) and len(rx_data) > 0:
-            rx_data = bytes(rx_data)  # convert bytearray to bytes
-
-            carlog.debug(f"CAN-RX: {hex(rx_addr)} - 0x{bytes.hex(rx_data)}")
+            if debug:
+              carlog.debug(f"CAN-RX: {hex(rx_addr)} - 0x{bytes(rx_data).hex()}")
 
-            # Cut off sub addr in first byte
+            # Cut off sub addr in first byte, without copying the frame
             if self.rx_sub_addr is not None:
               if rx_data[0] != self.rx_sub_addr:
                 raise InvalidSubAddressError(f"isotp - rx: invalid sub-address: {rx_data[0]}, expected: {self.rx_sub_addr}")
-              rx_data = rx_data[1:]
+              rx_data = memoryview(rx_data)[1:]
 
             self.rx_buff.append(rx_data)
       # break when non-full buffer is processed
       if len(msgs) < 254:
         return
 
-  def recv(self, drain: bool = False) -> Generator[bytes, None, None]:
+  def recv(self, drain: bool = False) -> Generator[bytes | memoryview, None, None]:
     # buffer rx messages in case two response messages are received at once
     # (e.g. response pending and success/failure response)
     self._recv_buffer(drain)
@@ -398,15 +412,18 @@ class CanClient:
       pass  # empty
 
   def send(self, msgs: list[bytes], delay: float = 0) -> None:
+    debug = carlog.isEnabledFor(logging.DEBUG)
     for i, msg in enumerate(msgs):
       if delay and i != 0:
-        carlog.debug(f"CAN-TX: delay - {delay}")
+        if debug:
+          carlog.debug(f"CAN-TX: delay - {delay}")
         time.sleep(delay)
 
       if self.sub_addr is not None:
         msg = bytes([self.sub_addr]) + msg
 
-      carlog.debug(f"CAN-TX: {hex(self.tx_addr)} - 0x{bytes.hex(msg)}")
+      if debug:
+        carlog.debug(f"CAN-TX: {hex(self.tx_addr)} - 0x{bytes.hex(msg)}")
       assert len(msg) <= 8
 
       self.tx(self.tx_addr, msg, self.bus)
@@ -451,21 +468,25 @@ class IsoTpMessage:
     self.rx_len = 0
     self.rx_idx = 0
     self.rx_done = False
+    # multi-frame responses are reassembled in place, sized from the first frame
+    self._rx_buf = bytearray()
+    self._rx_pos = 0
 
-    if not setup_only:
+    if not setup_only and carlog.isEnabledFor(logging.DEBUG):
       carlog.debug(f"ISO-TP: REQUEST - {hex(self._can_client.tx_addr)} 0x{bytes.hex(self.tx_dat)}")
     self._tx_first_frame(setup_only=setup_only)
 
   def _tx_first_frame(self, setup_only: bool = False) -> None:
+    debug = not setup_only and carlog.isEnabledFor(logging.DEBUG)
     if self.tx_len < self.max_len:
       # single frame (send all bytes)
-      if not setup_only:
+      if debug:
         carlog.debug(f"ISO-TP: TX - single frame - {hex(self._can_client.tx_addr)}")
       msg = (bytes([self.tx_len]) + self.tx_dat).ljust(self.max_len, b"\x00")
       self.tx_done = True
     else:
       # first frame (send first 6 bytes)
-      if not setup_only:
+      if debug:
         carlog.debug(f"ISO-TP: TX - first frame - {hex(self._can_client.tx_addr)}")
       msg = (struct.pack("!H", 0x1000 | self.tx_len) + self.tx_dat[:self.max_len - 2]).ljust(self.max_len - 2, b"\x00")
     if not setup_only:
@@ -492,16 +513,21 @@ class IsoTpMessage:
         if time.monotonic() - start_time > timeout:
           raise MessageTimeoutError("timeout waiting for response")
     finally:
-      if self.rx_dat:
+      if self.rx_dat and carlog.isEnabledFor(logging.DEBUG):
         carlog.debug(f"ISO-TP: RESPONSE - {hex(self._can_client.rx_addr)} 0x{bytes.hex(self.rx_dat)}")
 
-  def _isotp_rx_next(self, rx_data: bytes) -> ISOTP_FRAME_TYPE:
+  def _rx_active(self) -> bool:
+    # a first frame was received, but not all of its consecutive frames
+    return self.rx_len > 0 and not self.rx_done
+
+  def _isotp_rx_next(self, rx_data: bytes | memoryview) -> ISOTP_FRAME_TYPE:
     # TODO: Handle CAN frame data optimization, which is allowed with some frame types
     # # ISO 15765-2 specifies an eight byte CAN frame for ISO-TP communication
     # assert len(rx_data) == self.max_len, f"isotp - rx: invalid CAN frame length: {len(rx_data)}"
 
+    debug = carlog.isEnabledFor(logging.DEBUG)
     if rx_data[0] >> 4 == ISOTP_FRAME_TYPE.SINGLE:
-      assert self.rx_dat == b"" or self.rx_done, "isotp - rx: single frame with active frame"
+      assert not self._rx_active(), "isotp - rx: single frame with active frame"
 
       # "if the first byte is 0x00, then it's a CAN-FD SF, and the second byte specifies the size of the data."
       # - https://en.wikipedia.org/wiki/CAN_FD
@@ -516,40 +542,48 @@ class IsoTpMessage:
         offset = 1
         assert self.rx_len < self.max_len, f"isotp - rx: invalid single frame length: {self.rx_len}"
 
-      self.rx_dat = rx_data[offset:offset + self.rx_len]
+      self.rx_dat = bytes(rx_data[offset:offset + self.rx_len])
       self.rx_idx = 0
       self.rx_done = True
-      carlog.debug(f"ISO-TP: RX - single frame - {hex(self._can_client.rx_addr)} idx={self.rx_idx} done={self.rx_done}")
+      if debug:
+        carlog.debug(f"ISO-TP: RX - single frame - {hex(self._can_client.rx_addr)} idx={self.rx_idx} done={self.rx_done}")
       return ISOTP_FRAME_TYPE.SINGLE
 
     elif rx_data[0] >> 4 == ISOTP_FRAME_TYPE.FIRST:
       # TODO: support CAN FD first frames
       # Once a first frame is received, further frames must be consecutive
-      assert self.rx_dat == b"" or self.rx_done, "isotp - rx: first frame with active frame"
+      assert not self._rx_active(), "isotp - rx: first frame with active frame"
       self.rx_len = ((rx_data[0] & 0x0F) << 8) + rx_data[1]
       assert self.rx_len >= self.max_len, f"isotp - rx: invalid first frame length: {self.rx_len}"
       assert len(rx_data) == self.max_len, f"isotp - rx: invalid CAN frame length: {len(rx_data)}"
-      self.rx_dat = rx_data[2:]
+      self._rx_buf = bytearray(self.rx_len)
+      self._rx_pos = self.max_len - 2
+      self._rx_buf[:self._rx_pos] = rx_data[2:]
+      self.rx_dat = b""
       self.rx_idx = 0
       self.rx_done = False
-      carlog.debug(f"ISO-TP: RX - first frame - {hex(self._can_client.rx_addr)} idx={self.rx_idx} done={self.rx_done}")
-      carlog.debug(f"ISO-TP: TX - flow control continue - {hex(self._can_client.tx_addr)}")
+      if debug:
+        carlog.debug(f"ISO-TP: RX - first frame - {hex(self._can_client.rx_addr)} idx={self.rx_idx} done={self.rx_done}")
+        carlog.debug(f"ISO-TP: TX - flow control continue - {hex(self._can_client.tx_addr)}")
       # send flow control message
       self._can_client.send([self.flow_control_msg])
       return ISOTP_FRAME_TYPE.FIRST
 
     elif rx_data[0] >> 4 == ISOTP_FRAME_TYPE.CONSECUTIVE:
-      assert not self.rx_done, "isotp - rx: consecutive frame with no active frame"
+      assert self._rx_active(), "isotp - rx: consecutive frame with no active frame"
       self.rx_idx += 1
       assert self.rx_idx & 0xF == rx_data[0] & 0xF, "isotp - rx: invalid consecutive frame index"
-      rx_size = self.rx_len - len(self.rx_dat)
-      self.rx_dat += rx_data[1:1 + rx_size]
-      if self.rx_len == len(self.rx_dat):
+      rx_size = min(self.rx_len - self._rx_pos, len(rx_data) - 1)
+      self._rx_buf[self._rx_pos:self._rx_pos + rx_size] = rx_data[1:1 + rx_size]
+      self._rx_pos += rx_size
+      if self._rx_pos == self.rx_len:
+        self.rx_dat = bytes(self._rx_buf)
         self.rx_done = True
       elif self.single_frame_mode:
         # notify ECU to send next frame
         self._can_client.send([self.flow_control_msg])
-      carlog.debug(f"ISO-TP: RX - consecutive frame - {hex(self._can_client.rx_addr)} idx={self.rx_idx} done={self.rx_done}")
+      if debug:
+        carlog.debug(f"ISO-TP: RX - consecutive frame - {hex(self._can_client.rx_addr)} idx={self.rx_idx} done={self.rx_done}")
       return ISOTP_FRAME_TYPE.CONSECUTIVE
 
     elif rx_data[0] >> 4 == ISOTP_FRAME_TYPE.FLOW:
@@ -557,17 +591,23 @@ class IsoTpMessage:
       assert rx_data[0] != 0x32, "isotp - rx: flow-control overflow/abort"
       assert rx_data[0] == 0x30 or rx_data[0] == 0x31, "isotp - rx: flow-control transfer state indicator invalid"
       if rx_data[0] == 0x30:
-        carlog.debug(f"ISO-TP: RX - flow control continue - {hex(self._can_client.tx_addr)}")
-        delay_ts = rx_data[2] & 0x7F
-        # scale is 1 milliseconds if first bit == 0, 100 micro seconds if first bit == 1
-        delay_div = 1000. if rx_data[2] & 0x80 == 0 else 10000.
-        delay_sec = delay_ts / delay_div
+        if debug:
+          carlog.debug(f"ISO-TP: RX - flow control continue - {hex(self._can_client.tx_addr)}")
+        # separation time (STmin) is 0 to 127 milliseconds, or 100 to 900 microseconds from 0xF1 to 0xF9.
+        # reserved values mean the longest separation time
+        st_min = rx_data[2]
+        if st_min <= 0x7F:
+          delay_sec = st_min / 1000.
+        elif 0xF1 <= st_min <= 0xF9:
+          delay_sec = (st_min - 0xF0) / 10000.
+        else:
+          delay_sec = 0.127
 
         # first frame = 6 bytes, each consecutive frame = 7 bytes
         num_bytes = self.max_len - 1
         start = self.max_len - 2 + self.tx_idx * num_bytes
         count = rx_data[1]
-        end = start + count * num_bytes if count > 0 else self.tx_len
+        end = min(start + count * num_bytes, self.tx_len) if count > 0 else self.tx_len
         tx_msgs = []
         for i in range(start, end, num_bytes):
           self.tx_idx += 1
@@ -578,10 +618,12 @@ class IsoTpMessage:
         self._can_client.send(tx_msgs, delay=delay_sec)
         if end >= self.tx_len:
           self.tx_done = True
-        carlog.debug(f"ISO-TP: TX - consecutive frame - {hex(self._can_client.tx_addr)} idx={self.tx_idx} done={self.tx_done}")
+        if debug:
+          carlog.debug(f"ISO-TP: TX - consecutive frame - {hex(self._can_client.tx_addr)} idx={self.tx_idx} done={self.tx_done}")
       elif rx_data[0] == 0x31:
         # wait (do nothing until next flow control message)
-        carlog.debug(f"ISO-TP: TX - flow control wait - {hex(self._can_client.tx_addr)}")
+        if debug:
+          carlog.debug(f"ISO-TP: TX - flow control wait - {hex(self._can_client.tx_addr)}")
       return ISOTP_FRAME_TYPE.FLOW
 
     # 4-15 - reserved
@@ -590,6 +632,8 @@ class IsoTpMessage:
 
 
 FUNCTIONAL_ADDRS = [0x7DF, 0x18DB33F1]
+# largest payload of a classic CAN ISO-TP message
+ISOTP_MAX_LEN = 0xFFF
 
 
 def get_rx_addr_for_tx_addr(tx_addr, rx_offset=0x8):
@@ -622,15 +666,22 @@ class UdsClient:
 
   # generic uds request
   def _uds_request(self, service_type: SERVICE_TYPE, subfunction: int | None = None, data: bytes | None = None) -> bytes:
+    # send request, wait for response
+    isotp_msg = self._uds_send(service_type, subfunction, data)
+    return self._uds_response(isotp_msg, service_type, subfunction)
+
+  def _uds_send(self, service_type: SERVICE_TYPE, subfunction: int | None = None, data: bytes | None = None) -> IsoTpMessage:
     req = bytes([service_type])
     if subfunction is not None:
       req += bytes([subfunction])
     if data is not None:
       req += data
 
-    # send request, wait for response
     isotp_msg = IsoTpMessage(self._can_client, timeout=self.timeout)
     isotp_msg.send(req)
+    return isotp_msg
+
+  def _uds_response(self, isotp_msg: IsoTpMessage, service_type: SERVICE_TYPE, subfunction: int | None = None) -> bytes:
     response_pending = False
     while True:
       timeout = self.response_pending_timeout if response_pending else self.timeout
@@ -971,3 +1022,62 @@ class UdsClient:
 
   def request_transfer_exit(self):
     self._uds_request(SERVICE_TYPE.REQUEST_TRANSFER_EXIT, subfunction=None)
+
+  # block transfers
+  def upload(self, memory_address: int, memory_size: int, sink: BinaryIO, memory_address_bytes: int = 4, memory_size_bytes: int = 4,
+             data_format: int = 0x00) -> TransferStats:
+    """Reads memory into sink using as many transfer data requests as the ECU's block length needs.
+    Each block is requested before the previous one is written, so a slow sink overlaps with the ECU."""
+    start_time = time.monotonic()
+    self.request_upload(memory_address, memory_size, memory_address_bytes, memory_size_bytes, data_format)
+
+    num_bytes, num_blocks = 0, 0
+    block = b''
+    while num_bytes < memory_size:
+      block_sequence_count = (num_blocks + 1) & 0xFF
+      isotp_msg = self._uds_send(SERVICE_TYPE.TRANSFER_DATA, data=bytes([block_sequence_count]))
+      sink.write(block)
+
+      resp = self._uds_response(isotp_msg, SERVICE_TYPE.TRANSFER_DATA)
+      resp_id = resp[0] if len(resp) > 0 else None
+      if resp_id != block_sequence_count:
+        raise ValueError(f'invalid block_sequence_count: {resp_id}')
+      block = resp[1:]
+      if len(block) == 0:
+        raise ValueError(f'empty transfer data response after {num_bytes} bytes')
+      num_bytes += len(block)
+      num_blocks += 1
+    sink.write(block)
+
+    self.request_transfer_exit()
+    return TransferStats(num_bytes, num_blocks, time.monotonic() - start_time)
+
+  def download(self, memory_address: int, source: BinaryIO, memory_size: int, memory_address_bytes: int = 4, memory_size_bytes: int = 4,
+               data_format: int = 0x00) -> TransferStats:
+    """Writes memory_size bytes of source to memory in blocks of the negotiated maximum length.
+    The next block is read from source while the ECU handles the current one."""
+    start_time = time.monotonic()
+    max_num_bytes = self.request_download(memory_address, memory_size, memory_address_bytes, memory_size_bytes, data_format)
+    # the maximum length includes the service id and block sequence counter, and is limited by ISO-TP
+    block_len = min(max_num_bytes, ISOTP_MAX_LEN) - 2
+    if block_len < 1:
+      raise ValueError(f'invalid max_num_bytes: {max_num_bytes}')
+
+    num_bytes, num_blocks = 0, 0
+    block = source.read(min(block_len, memory_size))
+    while num_bytes < memory_size:
+      if len(block) == 0:
+        raise ValueError(f'source ended after {num_bytes} bytes')
+      block_sequence_count = (num_blocks + 1) & 0xFF
+      isotp_msg = self._uds_send(SERVICE_TYPE.TRANSFER_DATA, data=bytes([block_sequence_count]) + block)
+      num_bytes += len(block)
+      num_blocks += 1
+      block = source.read(min(block_len, memory_size - num_bytes))
+
+      resp = self._uds_response(isotp_msg, SERVICE_TYPE.TRANSFER_DATA)
+      resp_id = resp[0] if len(resp) > 0 else None
+      if resp_id != block_sequence_count:
+        raise ValueError(f'invalid block_sequence_count: {resp_id}')
+
+    self.request_transfer_exit()
+    return TransferStats(num_bytes, num_blocks, time.monotonic() - start_time)
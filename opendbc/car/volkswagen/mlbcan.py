@@ -1,4 +1,6 @@
-from opendbc.car.volkswagen.mqbcan import (volkswagen_mqb_meb_checksum, xor_checksum,
+import numpy as np
+
+from opendbc.car.volkswagen.mqbcan import (volkswagen_mqb_meb_checksum, volkswagen_mqb_meb_checksum_batch, xor_checksum, xor_checksum_batch,
                                            create_lka_hud_control as mqb_create_lka_hud_control)
 
 # TODO: Parameterize the hca control type (5 vs 7) and consolidate with MQB (and PQ?)
@@ -52,20 +54,29 @@ def create_acc_hud_control(packer, bus, acc_hud_status, set_speed, lead_distance
   values = {}
   return packer.make_can_msg("ACC_02", bus, values)
 
-def volkswagen_mlb_checksum(address: int, sig, d: bytearray) -> int:
-  xor_starting_value = {
-    0x109: 0x08, # ACC_01
-    0x111: 0x10, # TSK_05
-    0x30C: 0x0F, # ACC_02
-    0x324: 0x27, # ACC_04
-    0x10B: 0xA,  # LS_01
-    0x10D: 0x0C, # ACC_05
-    0x10F: 0x0E, # ACC_0x10F
-    0x311: 0x12, # ACC_0x311
-    0x397: 0x94, # LDW_02
-    0x10C: 0x0D, # TSK_02
-  }
-  if address in xor_starting_value:
-    return xor_checksum(address, sig, d, xor_starting_value[address])
+MLB_XOR_STARTING_VALUE = {
+  0x109: 0x08, # ACC_01
+  0x111: 0x10, # TSK_05
+  0x30C: 0x0F, # ACC_02
+  0x324: 0x27, # ACC_04
+  0x10B: 0xA,  # LS_01
+  0x10D: 0x0C, # ACC_05
+  0x10F: 0x0E, # ACC_0x10F
+  0x311: 0x12, # ACC_0x311
+  0x397: 0x94, # LDW_02
+  0x10C: 0x0D, # TSK_02
+}
+
+
+def volkswagen_mlb_checksum(address: int, sig, d: bytes | bytearray | memoryview) -> int:
+  if address in MLB_XOR_STARTING_VALUE:
+    return xor_checksum(address, sig, d, MLB_XOR_STARTING_VALUE[address])
   else:
     return volkswagen_mqb_meb_checksum(address, sig, d)
+
+
+def volkswagen_mlb_checksum_batch(address: int, sig, dat: np.ndarray) -> np.ndarray:
+  if address in MLB_XOR_STARTING_VALUE:
+    return xor_checksum_batch(address, sig, dat, MLB_XOR_STARTING_VALUE[address])
+  else:
+    return volkswagen_mqb_meb_checksum_batch(address, sig, dat)
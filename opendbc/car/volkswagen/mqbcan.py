@@ -1,4 +1,9 @@
-from opendbc.car.crc import CRC8H2F
+import operator
+from functools import reduce
+
+import numpy as np
+
+from opendbc.car.crc import CRC8H2F, crc8_batch
 
 
 def create_steering_control(packer, bus, apply_torque, lkas_enabled):
@@ -172,11 +177,10 @@ def create_aeb_hud(packer, aeb_supported, fcw_active):
   return packer.make_can_msg("ACC_15", 0, values)
 
 
-def volkswagen_mqb_meb_checksum(address: int, sig, d: bytearray) -> int:
+def volkswagen_mqb_meb_checksum(address: int, sig, d: bytes | bytearray | memoryview) -> int:
   crc = 0xFF
-  for i in range(1, len(d)):
-    crc ^= d[i]
-    crc = CRC8H2F[crc]
+  for b in d[1:]:
+    crc = CRC8H2F[crc ^ b]
   counter = d[1] & 0x0F
   const = VOLKSWAGEN_MQB_MEB_CONSTANTS.get(address)
   if const:
@@ -185,12 +189,28 @@ def volkswagen_mqb_meb_checksum(address: int, sig, d: bytearray) -> int:
   return crc ^ 0xFF
 
 
-def xor_checksum(address: int, sig, d: bytearray, initial_value: int = 0) -> int:
-  checksum = initial_value
+def volkswagen_mqb_meb_checksum_batch(address: int, sig, dat: np.ndarray) -> np.ndarray:
+  crc = crc8_batch(CRC8H2F, dat[:, 1:], 0xFF)
+  const = VOLKSWAGEN_MQB_MEB_CONSTANTS.get(address)
+  if const:
+    crc = np.asarray(CRC8H2F, dtype=np.uint8)[crc ^ np.asarray(const, dtype=np.uint8)[dat[:, 1] & 0x0F]]
+  return crc ^ 0xFF
+
+
+def xor_checksum(address: int, sig, d: bytes | bytearray | memoryview, initial_value: int = 0) -> int:
+  checksum = reduce(operator.xor, d, initial_value)
+  checksum_byte = sig.start_bit // 8
+  if checksum_byte < len(d):
+    # XOR-ing it in again removes the checksum byte itself
+    checksum ^= d[checksum_byte]
+  return checksum
+
+
+def xor_checksum_batch(address: int, sig, dat: np.ndarray, initial_value: int = 0) -> np.ndarray:
+  checksum = np.bitwise_xor.reduce(dat, axis=1) ^ initial_value
   checksum_byte = sig.start_bit // 8
-  for i in range(len(d)):
-    if i != checksum_byte:
-      checksum ^= d[i]
+  if checksum_byte < dat.shape[1]:
+    checksum ^= dat[:, checksum_byte]
   return checksum
 
 
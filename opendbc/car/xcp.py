@@ -3,6 +3,8 @@ import time
 import struct
 from enum import IntEnum
 
+from opendbc.car.daq import DaqList, DaqVariable, poll_dtos
+
 
 class COMMAND_CODE(IntEnum):
   CONNECT = 0xFF
@@ -99,6 +101,31 @@ class GET_ID_REQUEST_TYPE(IntEnum):
   # 128-255 user defined
 
 
+class DAQ_LIST_MODE(IntEnum):
+  SELECTED = 0x01
+  DIRECTION_STIM = 0x02
+  TIMESTAMP = 0x10
+  PID_OFF = 0x20
+  RUNNING = 0x40
+  RESUME = 0x80
+
+
+class START_STOP_MODE(IntEnum):
+  STOP = 0x00
+  START = 0x01
+  SELECT = 0x02
+
+
+class START_STOP_SYNCH_MODE(IntEnum):
+  STOP_ALL = 0x00
+  START_SELECTED = 0x01
+  STOP_SELECTED = 0x02
+
+
+# PIDs of responses, errors, events and service requests, the rest are DAQ DTOs
+MIN_CTO_PID = 0xFC
+
+
 class CommandTimeoutError(Exception):
   pass
 
@@ -129,6 +156,7 @@ class XcpClient:
     self._max_cto = 8
     self._max_dto = 8
     self.pad = pad
+    self._daq: DaqList | None = None
 
   def _send_cto(self, cmd: int, dat: bytes = b"") -> None:
     tx_data = (bytes([cmd]) + dat)
@@ -160,6 +188,9 @@ class XcpClient:
             print(f"CAN-RX: {hex(rx_addr)} - 0x{bytes.hex(rx_data)}")
 
           pid = rx_data[0]
+          if pid < MIN_CTO_PID and self._daq is not None:
+            self._daq.decode(pid, rx_data[1:], time.monotonic())
+            continue
           if pid == 0xFE:
             err = rx_data[1]
             err_desc = ERROR_CODES.get(err, "unknown error")
@@ -264,3 +295,139 @@ class XcpClient:
 
     self._send_cto(COMMAND_CODE.DOWNLOAD, bytes([size]) + data)
     return self._recv_dto(self.timeout)[:size]
+
+  def get_daq_resolution_info(self) -> dict:
+    self._send_cto(COMMAND_CODE.GET_DAQ_RESOLUTION_INFO)
+    resp = self._recv_dto(self.timeout)
+    timestamp_mode = resp[4]
+    return {
+      "granularity_odt_entry_size_daq": resp[0],
+      "max_odt_entry_size_daq": resp[1],
+      "granularity_odt_entry_size_stim": resp[2],
+      "max_odt_entry_size_stim": resp[3],
+      "timestamp_size": timestamp_mode & 0x07,
+      "timestamp_fixed": timestamp_mode & 0x08 != 0,
+      # seconds per timestamp tick, the unit is a power of ten starting at 1ns
+      "timestamp_resolution": struct.unpack(f"{self._byte_order}H", resp[5:7])[0] * 10.**((timestamp_mode >> 4) - 9),
+    }
+
+  def get_daq_processor_info(self) -> dict:
+    self._send_cto(COMMAND_CODE.GET_DAQ_PROCESSOR_INFO)
+    resp = self._recv_dto(self.timeout)
+    return {
+      "daq_properties": resp[0],
+      "max_daq": struct.unpack(f"{self._byte_order}H", resp[1:3])[0],
+      "max_event_channel": struct.unpack(f"{self._byte_order}H", resp[3:5])[0],
+      # predefined and static lists come first, dynamic lists are numbered from here
+      "min_daq": resp[5],
+      "daq_key_byte": resp[6],
+    }
+
+  def free_daq(self) -> None:
+    self._send_cto(COMMAND_CODE.FREE_DAQ)
+    self._recv_dto(self.timeout)
+
+  def alloc_daq(self, daq_count: int) -> None:
+    if daq_count > 65535:
+      raise ValueError("DAQ count must be less than 65536")
+    self._send_cto(COMMAND_CODE.ALLOC_DAQ, b"\x00" + struct.pack(f"{self._byte_order}H", daq_count))
+    self._recv_dto(self.timeout)
+
+  def alloc_odt(self, daq_list: int, odt_count: int) -> None:
+    if odt_count > 255:
+      raise ValueError("ODT count must be less than 256")
+    self._send_cto(COMMAND_CODE.ALLOC_ODT, b"\x00" + struct.pack(f"{self._byte_order}H", daq_list) + bytes([odt_count]))
+    self._recv_dto(self.timeout)
+
+  def alloc_odt_entry(self, daq_list: int, odt: int, entry_count: int) -> None:
+    if odt > 255:
+      raise ValueError("ODT number must be less than 256")
+    if entry_count > 255:
+      raise ValueError("ODT entry count must be less than 256")
+    self._send_cto(COMMAND_CODE.ALLOC_ODT_ENTRY, b"\x00" + struct.pack(f"{self._byte_order}H", daq_list) + bytes([odt, entry_count]))
+    self._recv_dto(self.timeout)
+
+  def set_daq_ptr(self, daq_list: int, odt: int, entry: int) -> None:
+    if odt > 255:
+      raise ValueError("ODT number must be less than 256")
+    if entry > 255:
+      raise ValueError("ODT entry number must be less than 256")
+    self._send_cto(COMMAND_CODE.SET_DAQ_PTR, b"\x00" + struct.pack(f"{self._byte_order}H", daq_list) + bytes([odt, entry]))
+    self._recv_dto(self.timeout)
+
+  def write_daq(self, size: int, addr_ext: int, addr: int) -> None:
+    if size > 255:
+      raise ValueError("size must be less than 256")
+    if addr_ext > 255:
+      raise ValueError("address extension must be less than 256")
+    # bit offset 0xFF means the whole element
+    self._send_cto(COMMAND_CODE.WRITE_DAQ, bytes([0xFF, size, addr_ext]) + struct.pack(f"{self._byte_order}I", addr))
+    self._recv_dto(self.timeout)
+
+  def set_daq_list_mode(self, mode: int, daq_list: int, event_channel: int, prescaler: int = 1, priority: int = 0) -> None:
+    if prescaler < 1 or prescaler > 255:
+      raise ValueError("prescaler must be between 1 and 255")
+    self._send_cto(COMMAND_CODE.SET_DAQ_LIST_MODE, bytes([mode]) + struct.pack(f"{self._byte_order}HH", daq_list, event_channel) +
+                   bytes([prescaler, priority]))
+    self._recv_dto(self.timeout)
+
+  def start_stop_daq_list(self, mode: START_STOP_MODE, daq_list: int) -> int:
+    self._send_cto(COMMAND_CODE.START_STOP_DAQ_LIST, bytes([mode]) + struct.pack(f"{self._byte_order}H", daq_list))
+    # PID of the list's first ODT
+    return self._recv_dto(self.timeout)[0]
+
+  def start_stop_synch(self, mode: START_STOP_SYNCH_MODE) -> None:
+    self._send_cto(COMMAND_CODE.START_STOP_SYNCH, bytes([mode]))
+    self._recv_dto(self.timeout)
+
+  # DAQ acquisition
+  def configure_daq(self, variables: list[DaqVariable] | list[tuple[int, int]], event_channel: int = 0, prescaler: int = 1,
+                    priority: int = 0, capacity: int = 1024, ecu_timestamps: bool = False) -> DaqList:
+    """Sets up a single dynamic DAQ list sampling (address, size) variables on an event channel. Variables are packed
+    into as few ODTs as fit, which the ECU sends each event cycle without being polled. Call after connect.
+    With ecu_timestamps, samples are timestamped by the ECU instead of on reception."""
+    timestamp_size, timestamp_resolution = 0, 0.
+    if ecu_timestamps:
+      info = self.get_daq_resolution_info()
+      timestamp_size, timestamp_resolution = info["timestamp_size"], info["timestamp_resolution"]
+      if not timestamp_size:
+        raise ValueError("ECU doesn't support DAQ timestamps")
+
+    # absolute ODT numbers, the PID takes the first byte of each DTO
+    daq = DaqList(variables, self._max_dto - 1, self._byte_order, capacity,
+                  timestamp_size=timestamp_size, timestamp_resolution=timestamp_resolution)
+
+    self._daq = None
+    daq_list = self.get_daq_processor_info()["min_daq"]
+    self.free_daq()
+    self.alloc_daq(1)
+    self.alloc_odt(daq_list, len(daq.odts))
+    for odt_num, odt in enumerate(daq.odts):
+      self.alloc_odt_entry(daq_list, odt_num, len(odt))
+    for odt_num, odt in enumerate(daq.odts):
+      self.set_daq_ptr(daq_list, odt_num, 0)
+      for entry in odt:
+        # the pointer moves to the next entry after each write
+        self.write_daq(entry.size, entry.addr_ext, entry.address)
+
+    mode = DAQ_LIST_MODE.TIMESTAMP if ecu_timestamps else 0
+    self.set_daq_list_mode(mode, daq_list, event_channel, prescaler, priority)
+    daq.first_pid = self.start_stop_daq_list(START_STOP_MODE.SELECT, daq_list)
+    self._daq = daq
+    return daq
+
+  def start_daq(self) -> None:
+    """Starts synchronized transmission of the configured DAQ list"""
+    if self._daq is None:
+      raise ValueError("DAQ is not configured")
+    self.start_stop_synch(START_STOP_SYNCH_MODE.START_SELECTED)
+
+  def stop_daq(self) -> None:
+    self.start_stop_synch(START_STOP_SYNCH_MODE.STOP_ALL)
+
+  def poll_daq(self, timeout: float = 0.) -> int:
+    """Decodes the DTOs received so far into the DAQ list's ring buffer, waiting up to timeout for more.
+    Returns the number of new samples."""
+    if self._daq is None:
+      raise ValueError("DAQ is not configured")
+    return poll_dtos(self._panda, self.can_bus, self.rx_addr, self._daq, lambda pid: pid < MIN_CTO_PID, timeout)
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
+import hashlib
 import importlib
 import os
 import re
+from functools import cache
 from pathlib import Path
 
 generator_path = os.path.dirname(os.path.realpath(__file__))
@@ -31,6 +33,19 @@ def _create_dbc_content(src_dir: str, filename: str, extra_files: dict[str, str]
   return ''.join(parts)
 
 
+def _generator_scripts(src_dir: Path) -> list[Path]:
+  return sorted(p for p in src_dir.glob("*.py") if not p.name.startswith("test_") and p.name != "generator.py")
+
+
+def _run_script(py_file: Path) -> dict[str, str]:
+  """Import and call generate() from a sub-generator script. Returns {filename: content}."""
+  module_name = f"opendbc.dbc.generator.{py_file.parent.name}.{py_file.stem}"
+  mod = importlib.import_module(module_name)
+  if hasattr(mod, 'generate'):
+    return mod.generate()
+  return {}
+
+
 def _collect_script_outputs() -> dict[str, dict[str, str]]:
   """Import and call generate() from each sub-generator script.
   Returns {dir_name: {filename: content}}."""
@@ -40,15 +55,48 @@ def _collect_script_outputs() -> dict[str, dict[str, str]]:
     if py_file.name.startswith("test_") or py_file.name == "generator.py":
       continue
 
-    dir_name = py_file.parent.name
-    module_name = f"opendbc.dbc.generator.{dir_name}.{py_file.stem}"
-    mod = importlib.import_module(module_name)
-    if hasattr(mod, 'generate'):
-      outputs.setdefault(dir_name, {}).update(mod.generate())
+    outputs.setdefault(py_file.parent.name, {}).update(_run_script(py_file))
 
   return outputs
 
 
+def generate_dbc(name: str) -> str | None:
+  """Generate a single DBC in memory, e.g. "toyota_new_mc_pt_generated". Returns None if it doesn't exist.
+  Only the template's own generator script runs, named after the DBC it outputs, plus the directory's
+  other scripts if the template imports a *_generated.dbc or a file that isn't on disk."""
+  if not name.endswith("_generated") or name.startswith("_"):
+    return None
+  filename = name.removesuffix("_generated") + ".dbc"
+
+  for src_dir in sorted(p for p in Path(generator_path).iterdir() if p.is_dir()):
+    extra: dict[str, str] = {}
+    script = src_dir / (name.removesuffix("_generated") + ".py")
+    if script.is_file():
+      extra.update(_run_script(script))
+    elif not (src_dir / filename).is_file():
+      continue
+
+    includes = include_pattern.findall(_read_dbc(str(src_dir), filename, extra))
+    if any(f.endswith("_generated.dbc") or not (src_dir / f).is_file() for f in includes):
+      for py_file in _generator_scripts(src_dir):
+        if py_file != script:
+          extra.update(_run_script(py_file))
+
+    return _create_dbc_content(str(src_dir), filename, extra)
+  return None
+
+
+@cache
+def generator_inputs_hash() -> str:
+  """Hash of every template and generator script, changes whenever any generated DBC could."""
+  h = hashlib.sha256()
+  for path in sorted(Path(generator_path).rglob("*")):
+    if path.suffix in (".dbc", ".py") and path.is_file():
+      h.update(str(path.relative_to(generator_path)).encode())
+      h.update(path.read_bytes())
+  return h.hexdigest()
+
+
 def generate_all() -> dict[str, str]:
   """Generate all DBC content in memory. Returns {name: content} where name has no .dbc extension."""
   script_outputs = _collect_script_outputs()
@@ -203,6 +203,20 @@ typedef struct {
   bool disable_forwarding;
 } safety_config;
 
+// address lookup of rx checks or tx msgs, sorted by key for binary search
+#define SAFETY_LOOKUP_MAX 64U
+
+typedef struct {
+  uint64_t key;       // address, bus and length, see safety_lookup_key
+  uint16_t index;     // into rx_checks or tx_msgs
+  uint8_t msg_index;  // into the msgs of an rx check
+} SafetyLookupEntry;
+
+typedef struct {
+  SafetyLookupEntry entries[SAFETY_LOOKUP_MAX];
+  int len;
+} SafetyLookup;
+
 typedef uint32_t (*get_checksum_t)(const CANPacket_t *msg);
 typedef uint32_t (*compute_checksum_t)(const CANPacket_t *msg);
 typedef uint8_t (*get_counter_t)(const CANPacket_t *msg);
@@ -103,31 +103,86 @@ static bool is_msg_valid(RxCheck addr_list[], int index) {
   return valid;
 }
 
-static int get_addr_check_index(const CANPacket_t *msg, RxCheck addr_list[], const int len) {
-  int addr = msg->addr;
-  int length = GET_LEN(msg);
+// built by set_safety_hooks, so finding the rx check or tx msg of a packet doesn't scan all of them
+static SafetyLookup rx_checks_lookup;
+static SafetyLookup tx_msgs_lookup;
+
+static uint64_t safety_lookup_key(int addr, unsigned int bus, int len) {
+  return ((uint64_t)(uint32_t)addr << 16U) | ((uint64_t)bus << 8U) | (uint64_t)(uint32_t)len;
+}
+
+// index of the first entry with a key not less than key
+static int safety_lookup_find(const SafetyLookup *lookup, uint64_t key) {
+  int lo = 0;
+  int hi = lookup->len;
+  // each step at least halves the range, so len steps always finish and the loop has a fixed bound
+  for (unsigned int step = 0U; (step < (unsigned int)lookup->len) && (lo < hi); step++) {
+    int mid = lo + ((hi - lo) / 2);
+    if (lookup->entries[mid].key < key) {
+      lo = mid + 1;
+    } else {
+      hi = mid;
+    }
+  }
+  return lo;
+}
+
+// insertion sort keeps entries with equal keys in the order they're added
+static bool safety_lookup_add(SafetyLookup *lookup, uint64_t key, int index, uint8_t msg_index) {
+  bool added = lookup->len < (int)SAFETY_LOOKUP_MAX;
+  if (added) {
+    int i = lookup->len;
+    while ((i > 0) && (lookup->entries[i - 1].key > key)) {
+      lookup->entries[i] = lookup->entries[i - 1];
+      i--;
+    }
+    lookup->entries[i] = (SafetyLookupEntry){.key = key, .index = (uint16_t)index, .msg_index = msg_index};
+    lookup->len++;
+  }
+  return added;
+}
+
+// returns false if the config doesn't fit, leaving both lookups empty
+static bool safety_lookup_build(const safety_config *cfg) {
+  bool ok = true;
+  rx_checks_lookup.len = 0;
+  for (int i = 0; ok && (i < cfg->rx_checks_len); i++) {
+    for (uint8_t j = 0U; ok && (j < MAX_ADDR_CHECK_MSGS); j++) {
+      const CanMsgCheck *m = &cfg->rx_checks[i].msg[j];
+      // unused msgs are all zeros
+      if (m->addr != 0) {
+        ok = safety_lookup_add(&rx_checks_lookup, safety_lookup_key(m->addr, m->bus, m->len), i, j);
+      }
+    }
+  }
+
+  tx_msgs_lookup.len = 0;
+  for (int i = 0; ok && (i < cfg->tx_msgs_len); i++) {
+    const CanMsg *m = &cfg->tx_msgs[i];
+    ok = safety_lookup_add(&tx_msgs_lookup, safety_lookup_key(m->addr, m->bus, m->len), i, 0U);
+  }
+
+  rx_checks_lookup.len = ok ? rx_checks_lookup.len : 0;
+  tx_msgs_lookup.len = ok ? tx_msgs_lookup.len : 0;
+  return ok;
+}
+
+static int get_addr_check_index(const CANPacket_t *msg, RxCheck addr_list[]) {
+  const uint64_t key = safety_lookup_key(msg->addr, msg->bus, GET_LEN(msg));
 
   int index = -1;
-  for (int i = 0; i < len; i++) {
+  // rx check msgs matching the address, bus and length, in rx check order
+  for (int k = safety_lookup_find(&rx_checks_lookup, key); (k < rx_checks_lookup.len) && (rx_checks_lookup.entries[k].key == key); k++) {
+    const SafetyLookupEntry *e = &rx_checks_lookup.entries[k];
     // if multiple msgs are allowed, determine which one is present on the bus
-    if (!addr_list[i].status.msg_seen) {
-      for (uint8_t j = 0U; (j < MAX_ADDR_CHECK_MSGS) && (addr_list[i].msg[j].addr != 0); j++) {
-        if ((addr == addr_list[i].msg[j].addr) && (msg->bus == addr_list[i].msg[j].bus) &&
-              (length == addr_list[i].msg[j].len)) {
-          addr_list[i].status.index = j;
-          addr_list[i].status.msg_seen = true;
-          break;
-        }
-      }
+    if (!addr_list[e->index].status.msg_seen) {
+      addr_list[e->index].status.index = (int)e->msg_index;
+      addr_list[e->index].status.msg_seen = true;
     }
 
-    if (addr_list[i].status.msg_seen) {
-      int idx = addr_list[i].status.index;
-      if ((addr == addr_list[i].msg[idx].addr) && (msg->bus == addr_list[i].msg[idx].bus) &&
-          (length == addr_list[i].msg[idx].len)) {
-        index = i;
-        break;
-      }
+    if (addr_list[e->index].status.index == (int)e->msg_index) {
+      index = e->index;
+      break;
     }
   }
   return index;
@@ -153,7 +208,7 @@ static bool rx_msg_safety_check(const CANPacket_t *msg,
                                 const safety_config *cfg,
                                 const safety_hooks *safety_hooks) {
 
-  int index = get_addr_check_index(msg, cfg->rx_checks, cfg->rx_checks_len);
+  int index = get_addr_check_index(msg, cfg->rx_checks);
   update_addr_timestamp(cfg->rx_checks, index);
 
   if (index != -1) {
@@ -188,7 +243,7 @@ bool safety_rx_hook(const CANPacket_t *msg) {
   bool controls_allowed_prev = controls_allowed;
 
   bool valid = rx_msg_safety_check(msg, &current_safety_config, current_hooks);
-  bool whitelisted = get_addr_check_index(msg, current_safety_config.rx_checks, current_safety_config.rx_checks_len) != -1;
+  bool whitelisted = get_addr_check_index(msg, current_safety_config.rx_checks) != -1;
   if (valid && whitelisted) {
     current_hooks->rx(msg);
   }
@@ -199,12 +254,10 @@ bool safety_rx_hook(const CANPacket_t *msg) {
   // the relay malfunction hook runs on all incoming rx messages.
   // check all applicable tx msgs for liveness on sending bus.
   // used to detect a relay malfunction or control messages from disabled ECUs like the radar
-  const int addr = msg->addr;
-  for (int i = 0; i < current_safety_config.tx_msgs_len; i++) {
-    const CanMsg *m = &current_safety_config.tx_msgs[i];
-    if (m->check_relay) {
-      stock_ecu_check((m->addr == addr) && (m->bus == msg->bus));
-    }
+  const uint64_t key = safety_lookup_key(msg->addr, msg->bus, 0);
+  for (int k = safety_lookup_find(&tx_msgs_lookup, key); (k < tx_msgs_lookup.len) && ((tx_msgs_lookup.entries[k].key >> 8U) == (key >> 8U)); k++) {
+    const CanMsg *m = &current_safety_config.tx_msgs[tx_msgs_lookup.entries[k].index];
+    stock_ecu_check(m->check_relay);
   }
 
   // reset mismatches on rising edge of controls_allowed to avoid rare race condition
@@ -215,22 +268,14 @@ bool safety_rx_hook(const CANPacket_t *msg) {
   return valid;
 }
 
-static bool tx_msg_safety_check(const CANPacket_t *msg, const CanMsg msg_list[], int len) {
-  int addr = msg->addr;
-  int length = GET_LEN(msg);
-
-  bool whitelisted = false;
-  for (int i = 0; i < len; i++) {
-    if ((addr == msg_list[i].addr) && (msg->bus == msg_list[i].bus) && (length == msg_list[i].len)) {
-      whitelisted = true;
-      break;
-    }
-  }
-  return whitelisted;
+static bool tx_msg_safety_check(const CANPacket_t *msg) {
+  const uint64_t key = safety_lookup_key(msg->addr, msg->bus, GET_LEN(msg));
+  int k = safety_lookup_find(&tx_msgs_lookup, key);
+  return (k < tx_msgs_lookup.len) && (tx_msgs_lookup.entries[k].key == key);
 }
 
 bool safety_tx_hook(CANPacket_t *msg) {
-  bool whitelisted = tx_msg_safety_check(msg, current_safety_config.tx_msgs, current_safety_config.tx_msgs_len);
+  bool whitelisted = tx_msg_safety_check(msg);
   if ((current_safety_mode == SAFETY_ALLOUTPUT) || (current_safety_mode == SAFETY_ELM327)) {
     whitelisted = true;
   }
@@ -261,10 +306,11 @@ int safety_fwd_hook(int bus_num, int addr) {
   // Block messages that are being checked for relay malfunctions. Safety modes can opt out of this
   // in the case of selective AEB forwarding
   const int destination_bus = get_fwd_bus(bus_num);
-  if (!blocked) {
-    for (int i = 0; i < current_safety_config.tx_msgs_len; i++) {
-      const CanMsg *m = &current_safety_config.tx_msgs[i];
-      if (m->check_relay && !m->disable_static_blocking && (m->addr == addr) && (m->bus == (unsigned int)destination_bus)) {
+  if (!blocked && (destination_bus != -1)) {
+    const uint64_t key = safety_lookup_key(addr, (unsigned int)destination_bus, 0);
+    for (int k = safety_lookup_find(&tx_msgs_lookup, key); (k < tx_msgs_lookup.len) && ((tx_msgs_lookup.entries[k].key >> 8U) == (key >> 8U)); k++) {
+      const CanMsg *m = &current_safety_config.tx_msgs[tx_msgs_lookup.entries[k].index];
+      if (m->check_relay && !m->disable_static_blocking) {
         blocked = true;
         break;
       }
@@ -477,6 +523,8 @@ int set_safety_hooks(uint16_t mode, uint16_t param) {
       current_safety_config.rx_checks[j].status = (RxStatus){0};
     }
   }
+  // lookups of the config's addresses, a config that doesn't fit can't be used
+  set_status = safety_lookup_build(&current_safety_config) ? set_status : -1;
   return set_status;
 }
 
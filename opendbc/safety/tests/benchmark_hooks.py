@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+import numpy as np
+
+from opendbc.car.structs import CarParams
+from opendbc.safety.tests.libsafety import libsafety_py
+
+
+def make_packets(msg_type: int, lens: tuple[int, ...] = (8, 32)) -> np.ndarray:
+  """Every 11-bit address on buses 0 to 2 at each length, which includes the rx checks and tx msgs of most modes"""
+  addrs, buses, msg_lens = np.meshgrid(np.arange(0x800), np.arange(3), np.array(lens), indexing="ij")
+  records = np.zeros(addrs.size, dtype=libsafety_py.REPLAY_MSG_DTYPE)
+  records['addr'] = addrs.ravel()
+  records['src'] = buses.ravel()
+  records['len'] = msg_lens.ravel()
+  records['type'] = msg_type
+  records['timer'] = np.arange(len(records)) * 10
+  return records
+
+
+def benchmark_mode(safety, mode: int, param: int, packets: np.ndarray, repeat: int) -> float | None:
+  """Seconds per packet through the hooks, or None if the mode doesn't exist"""
+  if safety.set_safety_hooks(mode, param) != 0:
+    return None
+  best = float('inf')
+  for _ in range(repeat):
+    t = time.perf_counter()
+    libsafety_py.replay(safety, packets)
+    best = min(best, time.perf_counter() - t)
+  return best / len(packets)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark the libsafety rx (with fwd) and tx hook cost per packet of each safety mode")
+  parser.add_argument("--param", type=int, default=0, help="Safety param of every mode")
+  parser.add_argument("--repeat", type=int, default=5, help="Runs per mode, the fastest is reported")
+  args = parser.parse_args()
+
+  safety = libsafety_py.libsafety
+  rx_packets, tx_packets = make_packets(libsafety_py.REPLAY_RX), make_packets(libsafety_py.REPLAY_TX)
+
+  totals = []
+  print(f"{'mode':<20} {'rx ns/pkt':>10} {'tx ns/pkt':>10}")
+  for name, mode in CarParams.SafetyModel.schema.enumerants.items():
+    rx = benchmark_mode(safety, mode, args.param, rx_packets, args.repeat)
+    tx = benchmark_mode(safety, mode, args.param, tx_packets, args.repeat)
+    if rx is None or tx is None:
+      continue
+    totals.append((rx, tx))
+    print(f"{name:<20} {rx * 1e9:10.1f} {tx * 1e9:10.1f}")
+
+  rx_mean, tx_mean = (sum(t) / len(totals) for t in zip(*totals, strict=True))
+  print(f"{'mean':<20} {rx_mean * 1e9:10.1f} {tx_mean * 1e9:10.1f}")
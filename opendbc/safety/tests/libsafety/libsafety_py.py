@@ -3,6 +3,7 @@ import subprocess
 import tempfile
 from pathlib import Path
 
+import numpy as np
 from cffi import FFI
 
 from opendbc.safety import LEN_TO_DLC
@@ -100,6 +101,7 @@ void safety_tick_current_safety_config();
 bool safety_config_valid();
 
 void init_tests(void);
+int set_lookup_test_config(int tx_msgs_len);
 
 void set_honda_fwd_brake(bool c);
 bool get_honda_fwd_brake(void);
@@ -109,22 +111,81 @@ int get_honda_hw(void);
 
 void mutation_set_active_mutant(int id);
 int mutation_get_active_mutant(void);
+int mutation_pop_reached_sites(int *ids, int max_ids);
 """)
 
+ffi.cdef("""
+typedef struct {
+  uint32_t timer;
+  uint32_t addr;
+  uint8_t type;
+  uint8_t src;
+  uint8_t tick;
+  uint8_t len;
+  uint8_t data[64];
+} SafetyReplayMsg;
+
+typedef struct {
+  uint32_t rx_total;
+  uint32_t rx_invalid;
+  uint32_t tx_total;
+  uint32_t tx_blocked;
+  uint32_t tx_controls;
+  uint32_t tx_controls_blocked;
+  uint32_t safety_tick_rx_invalid;
+} SafetyReplayCounters;
+
+void safety_replay(const SafetyReplayMsg *msgs, int len, uint8_t *verdicts, SafetyReplayCounters *counters);
+""")
+
+# SafetyReplayMsg types and verdict flags
+REPLAY_RX, REPLAY_TX, REPLAY_NONE = 0, 1, 2
+REPLAY_VERDICT_OK, REPLAY_VERDICT_CONTROLS_ALLOWED = 1, 2
+
+# SafetyReplayMsg records, packed from Python without crossing into libsafety per msg
+REPLAY_MSG_DTYPE = np.dtype([
+  ('timer', np.uint32),
+  ('addr', np.uint32),
+  ('type', np.uint8),
+  ('src', np.uint8),
+  ('tick', np.uint8),
+  ('len', np.uint8),
+  ('data', np.uint8, 64),
+])
+assert REPLAY_MSG_DTYPE.itemsize == ffi.sizeof('SafetyReplayMsg')
+
 class LibSafety:
   pass
 libsafety: LibSafety
 
+_libsafety_so: str | None = None
+
+def build() -> str:
+  """Path of libsafety.so, compiled once per process so its coverage data stays consistent."""
+  global _libsafety_so
+  if _libsafety_so is None:
+    _libsafety_so = _build_libsafety()
+  return _libsafety_so
+
 def load(path):
   global libsafety
   libsafety = ffi.dlopen(str(path))
 
 def __getattr__(name):
   if name == "libsafety":
-    load(_build_libsafety())
+    load(build())
     return libsafety
   raise AttributeError(name)
 
+def replay(safety, msgs: np.ndarray):
+  """Runs packed REPLAY_MSG_DTYPE records through the safety hooks in a single call.
+  Returns the verdict flags of each record and the aggregate SafetyReplayCounters as a dict."""
+  msgs = np.ascontiguousarray(msgs, dtype=REPLAY_MSG_DTYPE)
+  verdicts = np.zeros(len(msgs), dtype=np.uint8)
+  counters = ffi.new('SafetyReplayCounters *')
+  safety.safety_replay(ffi.cast('SafetyReplayMsg *', ffi.from_buffer(msgs)), len(msgs), ffi.from_buffer('uint8_t[]', verdicts), counters)
+  return verdicts, {name: getattr(counters, name) for name, _ in ffi.typeof('SafetyReplayCounters').fields}
+
 def make_CANPacket(addr: int, bus: int, dat):
   ret = ffi.new('CANPacket_t *')
   ret[0].extended = 1 if addr >= 0x800 else 0
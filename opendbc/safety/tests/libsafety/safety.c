@@ -202,3 +202,112 @@ void init_tests(void){
   // assumes autopark on safety mode init to avoid a fault. get rid of that for testing
   tesla_autopark = false;
 }
+
+// ***** address lookup *****
+
+// a config no safety mode has, to test the rx check and tx msg lookups at their edges
+static RxCheck lookup_test_rx_checks[] = {
+  // 0x100 on either bus, the second check only gets 0x100 on bus 1 once the first is on bus 0
+  {.msg = {{0x100, 0, 8, 10U, .ignore_checksum = true, .ignore_counter = true, .ignore_quality_flag = true},
+           {0x100, 1, 8, 10U, .ignore_checksum = true, .ignore_counter = true, .ignore_quality_flag = true}, { 0 }}},
+  {.msg = {{0x100, 1, 8, 10U, .ignore_checksum = true, .ignore_counter = true, .ignore_quality_flag = true}, { 0 }, { 0 }}},
+};
+// the first two share an address and bus, and only the second checks the relay. the rest fill up the lookup
+static const CanMsg lookup_test_tx_msgs[SAFETY_LOOKUP_MAX + 1U] = {{0x200, 0, 6, .check_relay = false}, {0x200, 0, 8, .check_relay = true}};
+
+// swaps in the test config with tx_msgs_len tx msgs, -1 if it doesn't fit like set_safety_hooks
+int set_lookup_test_config(int tx_msgs_len){
+  current_safety_config.rx_checks = lookup_test_rx_checks;
+  current_safety_config.rx_checks_len = sizeof(lookup_test_rx_checks) / sizeof(lookup_test_rx_checks[0]);
+  current_safety_config.tx_msgs = lookup_test_tx_msgs;
+  current_safety_config.tx_msgs_len = tx_msgs_len;
+  current_safety_config.disable_forwarding = false;
+  lookup_test_rx_checks[0].status = (RxStatus){0};
+  lookup_test_rx_checks[1].status = (RxStatus){0};
+  return safety_lookup_build(&current_safety_config) ? 0 : -1;
+}
+
+// ***** bulk replay *****
+
+#define REPLAY_RX 0U
+#define REPLAY_TX 1U
+#define REPLAY_NONE 2U  // only advances the timer, for safety ticks between messages
+
+#define REPLAY_VERDICT_OK 1U  // rx msg valid or tx msg allowed
+#define REPLAY_VERDICT_CONTROLS_ALLOWED 2U
+
+typedef struct {
+  uint32_t timer;
+  uint32_t addr;
+  uint8_t type;
+  uint8_t src;
+  uint8_t tick;  // run the safety tick before the msg
+  uint8_t len;
+  uint8_t data[CANPACKET_DATA_SIZE_MAX];
+} SafetyReplayMsg;
+
+typedef struct {
+  uint32_t rx_total;
+  uint32_t rx_invalid;
+  uint32_t tx_total;
+  uint32_t tx_blocked;
+  uint32_t tx_controls;
+  uint32_t tx_controls_blocked;
+  uint32_t safety_tick_rx_invalid;
+} SafetyReplayCounters;
+
+static void replay_make_packet(const SafetyReplayMsg *m, CANPacket_t *pkt) {
+  pkt->fd = 0U;
+  pkt->rejected = 0U;
+  pkt->returned = 0U;
+  pkt->checksum = 0U;
+  pkt->extended = (m->addr >= 0x800U) ? 1U : 0U;
+  pkt->addr = m->addr;
+  pkt->bus = m->src % 4U;
+  pkt->data_len_code = 0U;
+  for (uint8_t dlc = 0U; dlc < sizeof(dlc_to_len); dlc++) {
+    if (dlc_to_len[dlc] == m->len) {
+      pkt->data_len_code = dlc;
+      break;
+    }
+  }
+  for (uint8_t i = 0U; i < m->len; i++) {
+    pkt->data[i] = m->data[i];
+  }
+}
+
+// runs the timer, tick and hook sequence of replay_drive over len msgs, writing a verdict per msg
+void safety_replay(const SafetyReplayMsg *msgs, int len, uint8_t *verdicts, SafetyReplayCounters *counters) {
+  CANPacket_t pkt;
+  for (int i = 0; i < len; i++) {
+    const SafetyReplayMsg *m = &msgs[i];
+    set_timer(m->timer);
+    if (m->tick != 0U) {
+      safety_tick_current_safety_config();
+      counters->safety_tick_rx_invalid |= safety_config_valid() ? 0U : 1U;
+    }
+
+    uint8_t verdict = 0U;
+    if (m->type == REPLAY_TX) {
+      replay_make_packet(m, &pkt);
+      bool sent = safety_tx_hook(&pkt);
+      if (!sent) {
+        counters->tx_blocked++;
+        counters->tx_controls_blocked += controls_allowed ? 1U : 0U;
+      }
+      counters->tx_controls += controls_allowed ? 1U : 0U;
+      counters->tx_total++;
+      verdict = (sent ? REPLAY_VERDICT_OK : 0U) | (controls_allowed ? REPLAY_VERDICT_CONTROLS_ALLOWED : 0U);
+    } else if (m->type == REPLAY_RX) {
+      safety_fwd_hook(m->src, m->addr);
+      replay_make_packet(m, &pkt);
+      bool recv = safety_rx_hook(&pkt);
+      if (!recv) {
+        counters->rx_invalid++;
+      }
+      counters->rx_total++;
+      verdict = (recv ? REPLAY_VERDICT_OK : 0U) | (controls_allowed ? REPLAY_VERDICT_CONTROLS_ALLOWED : 0U);
+    }
+    verdicts[i] = verdict;
+  }
+}
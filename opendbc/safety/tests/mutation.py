@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 import argparse
+import bisect
+import hashlib
 import io
+import json
 import os
+import pickle
 import re
+import select
+import signal
 import subprocess
 import sys
 import tempfile
@@ -21,6 +27,9 @@ ROOT = Path(__file__).resolve().parents[3]
 SAFETY_DIR = ROOT / "opendbc" / "safety"
 SAFETY_TESTS_DIR = ROOT / "opendbc" / "safety" / "tests"
 SAFETY_C_REL = Path("opendbc/safety/tests/libsafety/safety.c")
+CACHE_FILE = ROOT / ".mutation_cache.json"
+# a mutant still running its tests after this long is taken to hang, which kills it
+MUTANT_TIMEOUT = 60.
 
 ANSI_RESET = "\033[0m"
 ANSI_BOLD = "\033[1m"
@@ -50,6 +59,8 @@ MUTATOR_FAMILIES = {
 }
 
 
+LINE_MARKER_RE = re.compile(r'^\s*#\s+\d+\s+"[^\n]*\n?', re.MULTILINE)
+
 _RawSite = namedtuple('_RawSite', 'expr_start expr_end op_start op_end line original_op mutated_op mutator')
 
 
@@ -66,6 +77,10 @@ class MutationSite:
   mutator: str
   origin_file: Path
   origin_line: int
+  # enclosing top-level definition, as byte offsets in the preprocessed source and lines of origin_file
+  scope_start: int
+  scope_end: int
+  scope_lines: tuple[int, int]
 
 
 @dataclass(frozen=True)
@@ -73,7 +88,7 @@ class MutantResult:
   site: MutationSite
   outcome: str  # killed | survived | infra_error
   test_sec: float
-  details: str
+  details: str  # test that killed it, or the error
 
 
 def colorize(text, color):
@@ -233,6 +248,10 @@ def enumerate_sites(input_source, preprocessed_file):
 
     stack.extend(node.children)
 
+  # top-level definitions, to find the one enclosing each site
+  scopes = [(n.start_byte, n.end_byte, n.start_point[0] + 1, n.end_point[0] + 1) for n in tree.root_node.children]
+  scope_starts = [scope[0] for scope in scopes]
+
   sites = sorted(deduped.values(), key=lambda s: (s.op_start, s.mutator))
   out = []
   build_incompatible_site_ids = set()
@@ -243,12 +262,19 @@ def enumerate_sites(input_source, preprocessed_file):
     origin_file, origin_line = mapped
     if SAFETY_DIR not in origin_file.parents and origin_file != SAFETY_DIR:
       continue
+    scope_start, scope_end, scope_first, scope_last = scopes[bisect.bisect_right(scope_starts, s.expr_start) - 1]
+    first, last = line_map.get(scope_first), line_map.get(scope_last)
+    if first is not None and last is not None and first[0] == origin_file == last[0]:
+      scope_lines = (first[1], last[1])
+    else:
+      scope_lines = (origin_line, origin_line)
     site_id = len(out)
     site = MutationSite(
       site_id=site_id, expr_start=s.expr_start, expr_end=s.expr_end,
       op_start=s.op_start, op_end=s.op_end, line=s.line,
       original_op=s.original_op, mutated_op=s.mutated_op, mutator=s.mutator,
       origin_file=origin_file, origin_line=origin_line,
+      scope_start=scope_start, scope_end=scope_end, scope_lines=scope_lines,
     )
     if _site_key(s) in build_incompatible_keys:
       build_incompatible_site_ids.add(site_id)
@@ -263,6 +289,7 @@ def _build_core_tests(catalog):
   One test per unique method name from evenly-spaced modules,
   ordered by how widely each method is shared. Methods inherited by many
   classes exercise the most fundamental safety logic and run first.
+  All of test_defaults.py follows, since the default modes are handled in the core files.
   """
   MAX_PER_METHOD = 5
   method_freq = {}
@@ -294,6 +321,7 @@ def _build_core_tests(catalog):
       ids = method_ids.get(m, [])
       if round_idx < len(ids):
         ordered.append(ids[round_idx])
+  ordered += [t for t in catalog.get("test_defaults.py", []) if t not in ordered]
   return ordered
 
 
@@ -367,13 +395,74 @@ def print_live_status(text, *, final=False):
 def _discover_test_catalog():
   loader = unittest.TestLoader()
   catalog = {}
-  for test_file in sorted(SAFETY_TESTS_DIR.glob("test_*.py")):
+  # the replay tests are the only ones running the bulk replay loop in safety.c
+  test_files = [*SAFETY_TESTS_DIR.glob("test_*.py"), *(SAFETY_TESTS_DIR / "safety_replay").glob("test_*.py")]
+  for test_file in sorted(test_files):
     module_name = ".".join(test_file.relative_to(ROOT).with_suffix("").parts)
     suite = loader.loadTestsFromName(module_name)
-    catalog[test_file.name] = [t.id() for group in suite for t in group]
+    catalog[str(test_file.relative_to(SAFETY_TESTS_DIR))] = [t.id() for group in suite for t in group]
   return catalog
 
 
+def test_catalog_hash(catalog):
+  """Hash of the test IDs and the test sources, which cached outcomes are only valid for"""
+  h = hashlib.sha256(json.dumps(catalog, sort_keys=True).encode())
+  for path in sorted([*SAFETY_TESTS_DIR.glob("*.py"), *(SAFETY_TESTS_DIR / "libsafety").glob("*.py"), *(SAFETY_TESTS_DIR / "safety_replay").glob("*.py")]):
+    h.update(path.read_bytes())
+  return h.hexdigest()
+
+
+def site_cache_key(site, source):
+  """Identifies a mutant by the text of its enclosing definition, so editing that definition invalidates it.
+  Line markers are dropped, so moving the definition around keeps the key."""
+  scope_text = LINE_MARKER_RE.sub("", source[site.scope_start:site.scope_end])
+  op_offset = len(LINE_MARKER_RE.sub("", source[site.scope_start:site.op_start]))
+  scope_hash = hashlib.sha256(scope_text.encode()).hexdigest()[:16]
+  return f"{site.origin_file.relative_to(ROOT)}:{scope_hash}:{op_offset}:{site.mutator}:{site.mutated_op}"
+
+
+def load_cache(path):
+  """Mutant outcomes valid for the test catalog with catalog_hash, and kills and runs per test across all runs"""
+  if not path.exists():
+    return {}
+  return json.loads(path.read_text())
+
+
+def save_cache(path, catalog_hash, outcomes, test_kills):
+  path.write_text(json.dumps({"catalog_hash": catalog_hash, "outcomes": outcomes, "test_kills": test_kills}, indent=1, sort_keys=True))
+
+
+def git_changed_lines(since):
+  """Lines of the safety sources added or modified since a git ref, including uncommitted and untracked files"""
+  diff = subprocess.run(["git", "diff", "-U0", "--no-color", "--no-ext-diff", since, "--", "opendbc/safety"],
+                        cwd=ROOT, capture_output=True, text=True, check=True).stdout
+  changed = {}
+  path = None
+  for line in diff.splitlines():
+    if line.startswith("+++ "):
+      path = None if line == "+++ /dev/null" else (ROOT / line[len("+++ b/"):]).resolve()
+    elif line.startswith("@@") and path is not None:
+      m = re.match(r"@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@", line)
+      start, count = int(m.group(1)), int(m.group(2) or 1)
+      # a pure deletion is attributed to the line before it
+      lines = range(start, start + count) if count > 0 else [max(start, 1)]
+      changed.setdefault(path, set()).update(lines)
+
+  untracked = subprocess.run(["git", "ls-files", "--others", "--exclude-standard", "opendbc/safety"],
+                             cwd=ROOT, capture_output=True, text=True, check=True).stdout.split()
+  for fn in untracked:
+    path = (ROOT / fn).resolve()
+    if path.suffix not in (".c", ".h"):
+      continue
+    changed[path] = set(range(1, len(path.read_text().splitlines()) + 1))
+  return changed
+
+
+def is_site_changed(site, changed_lines):
+  first, last = site.scope_lines
+  return any(first <= ln <= last for ln in changed_lines.get(site.origin_file, ()))
+
+
 def run_unittest(targets, lib_path, mutant_id, verbose):
   from opendbc.safety.tests.libsafety import libsafety_py
   libsafety_py.load(lib_path)
@@ -397,6 +486,90 @@ def run_unittest(targets, lib_path, mutant_id, verbose):
   return None
 
 
+class _ReachedSitesResult(unittest.TestResult):
+  """Pops the mutation sites reached after each test, which includes its class's setUpClass for the first test"""
+  def __init__(self, lib, ffi, num_sites):
+    super().__init__()
+    self.lib = lib
+    self.ids = ffi.new("int[]", num_sites)
+    self.num_sites = num_sites
+    self.reached = {}
+
+  def stopTest(self, test):
+    super().stopTest(test)
+    n = self.lib.mutation_pop_reached_sites(self.ids, self.num_sites)
+    self.reached[test.id()] = list(self.ids[0:n])
+
+
+def collect_reached_sites(test_ids, lib_path, num_sites):
+  """Runs tests without an active mutant, returning the mutation sites each one evaluates"""
+  from opendbc.safety.tests.libsafety import libsafety_py
+  libsafety_py.load(lib_path)
+  lib = libsafety_py.libsafety
+  lib.mutation_set_active_mutant(-1)
+
+  result = _ReachedSitesResult(lib, libsafety_py.ffi, num_sites)
+  lib.mutation_pop_reached_sites(result.ids, num_sites)
+  loader = unittest.TestLoader()
+  suite = unittest.TestSuite(loader.loadTestsFromName(t) for t in test_ids)
+  suite.run(result)
+  return result.reached
+
+
+def build_coverage_map(pool, test_ids, lib_path, num_sites):
+  """Tests reaching each mutation site, from one run of every test sharded by class.
+  Tests of a class that crashed its worker have no coverage, and are returned as unknown."""
+  by_class = {}
+  for test_id in test_ids:
+    by_class.setdefault(test_id.rsplit(".", 1)[0], []).append(test_id)
+
+  reaching = {}
+  unknown = set()
+  future_map = {pool.submit(collect_reached_sites, ids, lib_path, num_sites): ids for ids in by_class.values()}
+  for fut in as_completed(future_map):
+    try:
+      reached = fut.result()
+    except Exception:
+      unknown.update(future_map[fut])
+      continue
+    for test_id, site_ids in reached.items():
+      for site_id in site_ids:
+        reaching.setdefault(site_id, set()).add(test_id)
+  return reaching, unknown
+
+
+def kill_rate(test_kills, test_id):
+  """Historical kills per run of a test, smoothed so tests without history start in the middle"""
+  kills, runs = test_kills.get(test_id, (0, 0))
+  return (kills + 1) / (runs + 2)
+
+
+def select_tests(targets, reaching_tests, unknown_tests, test_kills):
+  """Targets that reach a site, most likely to kill first. Falls back to all targets if none reached it,
+  since tests with random inputs may not reach the same sites every run."""
+  selected = [t for t in targets if t in reaching_tests or t in unknown_tests]
+  if not selected:
+    return targets
+  return sorted(selected, key=lambda t: -kill_rate(test_kills, t))
+
+
+def update_test_kills(test_kills, results, site_targets):
+  """Counts runs and kills of each test, up to the first kill of each mutant"""
+  for res in results:
+    targets = site_targets[res.site.site_id]
+    if res.outcome == "survived":
+      ran = targets
+    elif res.outcome == "killed" and res.details in targets:
+      ran = targets[:targets.index(res.details) + 1]
+      kills, runs = test_kills.get(res.details, (0, 0))
+      test_kills[res.details] = (kills + 1, runs)
+    else:
+      continue
+    for test_id in ran:
+      kills, runs = test_kills.get(test_id, (0, 0))
+      test_kills[test_id] = (kills, runs + 1)
+
+
 def _instrument_source(source, sites):
   # Sort by start ascending, end descending (outermost first when same start)
   sorted_sites = sorted(sites, key=lambda s: (s.expr_start, -s.expr_end))
@@ -443,7 +616,7 @@ def _instrument_source(source, sites):
       f"Operator mismatch (site_id={site.site_id}): expected {site.original_op!r} at offset {op_rel}"
     )
     mutated_expr = f"{expr_text[:op_rel]}{site.mutated_op}{expr_text[op_rel + op_len :]}"
-    return f"((__mutation_active_id == {site.site_id}) ? ({mutated_expr}) : ({expr_text}))"
+    return f"((__mutation_reached[{site.site_id}] = 1U), ((__mutation_active_id == {site.site_id}) ? ({mutated_expr}) : ({expr_text})))"
 
   result_parts = []
   pos = 0
@@ -458,13 +631,26 @@ def _instrument_source(source, sites):
 def compile_mutated_library(preprocessed_source, sites, output_so):
   instrumented = _instrument_source(preprocessed_source, sites)
 
-  prelude = """
+  num_sites = max(s.site_id for s in sites) + 1
+  prelude = f"""
     static int __mutation_active_id = -1;
-    void mutation_set_active_mutant(int id) { __mutation_active_id = id; }
-    int mutation_get_active_mutant(void) { return __mutation_active_id; }
+    void mutation_set_active_mutant(int id) {{ __mutation_active_id = id; }}
+    int mutation_get_active_mutant(void) {{ return __mutation_active_id; }}
+
+    // sites evaluated since the last pop, for coverage-guided test selection
+    static unsigned char __mutation_reached[{num_sites}];
+    int mutation_pop_reached_sites(int *ids, int max_ids) {{
+      int n = 0;
+      for (int i = 0; i < {num_sites}; i++) {{
+        if (__mutation_reached[i] && (n < max_ids)) {{
+          ids[n++] = i;
+        }}
+        __mutation_reached[i] = 0U;
+      }}
+      return n;
+    }}
   """
-  marker_re = re.compile(r'^\s*#\s+\d+\s+"[^\n]*\n?', re.MULTILINE)
-  instrumented = prelude + marker_re.sub("", instrumented)
+  instrumented = prelude + LINE_MARKER_RE.sub("", instrumented)
 
   mutation_source = output_so.with_suffix(".c")
   mutation_source.write_text(instrumented)
@@ -476,16 +662,101 @@ def compile_mutated_library(preprocessed_source, sites, output_so):
   ], cwd=ROOT, check=True)
 
 
-def eval_mutant(site, targets, lib_path, verbose):
+def run_forked(timeout, fn, *args):
+  """Runs fn in a forked child, so a mutant that hangs or crashes takes down neither the worker nor the pool.
+  Raises TimeoutError if it runs past timeout seconds, and ChildProcessError if it dies without a result."""
+  r, w = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    # the child must never return into the worker's loop
+    try:
+      os.close(r)
+      try:
+        ret = (True, fn(*args))
+      except Exception as exc:
+        ret = (False, str(exc))
+      with os.fdopen(w, "wb") as f:
+        pickle.dump(ret, f)
+    finally:
+      sys.stdout.flush()
+      os._exit(0)
+
+  os.close(w)
+  with os.fdopen(r, "rb") as f:
+    ready, _, _ = select.select([f], [], [], timeout)
+    if not ready:
+      os.kill(pid, signal.SIGKILL)
+      os.waitpid(pid, 0)
+      raise TimeoutError(f"timed out after {timeout:g}s")
+    payload = f.read()
+  _, status = os.waitpid(pid, 0)
+  if not payload:
+    raise ChildProcessError(f"mutant process died with status {status}")
+  ok, ret = pickle.loads(payload)
+  if not ok:
+    raise RuntimeError(ret)
+  return ret
+
+
+def eval_mutant(site, targets, lib_path, verbose, timeout):
+  t0 = time.perf_counter()
   try:
-    t0 = time.perf_counter()
-    failed_test = run_unittest(targets, lib_path, mutant_id=site.site_id, verbose=verbose)
-    duration = time.perf_counter() - t0
-    if failed_test is not None:
-      return MutantResult(site, "killed", duration, "")
-    return MutantResult(site, "survived", duration, "")
+    failed_test = run_forked(timeout, run_unittest, targets, lib_path, site.site_id, verbose)
+  except (TimeoutError, ChildProcessError) as exc:
+    # a hang or crash is a behavior change too
+    return MutantResult(site, "killed", time.perf_counter() - t0, str(exc))
   except Exception as exc:
     return MutantResult(site, "infra_error", 0.0, str(exc))
+  duration = time.perf_counter() - t0
+  if failed_test is not None:
+    return MutantResult(site, "killed", duration, failed_test)
+  return MutantResult(site, "survived", duration, "")
+
+
+def run_mutants(sites, catalog, mutation_lib, test_kills, jobs, verbose, start, timeout):
+  # Pre-compute test targets per mutation site
+  core_tests = _build_core_tests(catalog)
+  site_targets = {site.site_id: build_priority_tests(site, catalog, core_tests) for site in sites}
+
+  results = []
+  counts = Counter()
+
+  with ProcessPoolExecutor(max_workers=jobs) as pool:
+    # Narrow the targets down to the tests that reach each site
+    test_ids = sorted({t for targets in site_targets.values() for t in targets})
+    print(f"Collecting coverage of {len(test_ids)} tests", flush=True)
+    t0 = time.perf_counter()
+    reaching, unknown = build_coverage_map(pool, test_ids, mutation_lib, max(s.site_id for s in sites) + 1)
+    print(f"Collected coverage in {time.perf_counter() - t0:.1f}s" + (f", {len(unknown)} tests crashed" if unknown else ""), flush=True)
+    site_targets = {site_id: select_tests(targets, reaching.get(site_id, set()), unknown, test_kills) for site_id, targets in site_targets.items()}
+
+    future_map = {
+      pool.submit(eval_mutant, site, site_targets[site.site_id], mutation_lib, verbose, timeout): site for site in sites
+    }
+    print_live_status(render_progress(0, len(sites), 0, 0, 0, 0.0))
+    try:
+      for fut in as_completed(future_map):
+        try:
+          res = fut.result()
+        except Exception:
+          site = future_map[fut]
+          res = MutantResult(site, "killed", 0.0, "worker process crashed")
+        results.append(res)
+        counts[res.outcome] += 1
+        elapsed_now = time.perf_counter() - start
+        done = len(results) == len(sites)
+        print_live_status(render_progress(len(results), len(sites), counts["killed"], counts["survived"],
+                                          counts["infra_error"], elapsed_now), final=done)
+    except Exception:
+      # Pool broken — mark all unfinished mutants as killed (crash = behavioral change detected)
+      completed_ids = {r.site.site_id for r in results}
+      for site in sites:
+        if site.site_id not in completed_ids:
+          results.append(MutantResult(site, "killed", 0.0, "pool broken"))
+          counts["killed"] += 1
+      elapsed_now = time.perf_counter() - start
+      print_live_status(render_progress(len(results), len(sites), counts["killed"], counts["survived"], counts["infra_error"], elapsed_now), final=True)
+  return results, site_targets
 
 
 def main():
@@ -493,6 +764,9 @@ def main():
   parser.add_argument("-j", type=int, default=max((os.cpu_count() or 1) - 1, 1), help="parallel mutants to run")
   parser.add_argument("--max-mutants", type=int, default=0, help="optional limit for debugging (0 means all)")
   parser.add_argument("--list-only", action="store_true", help="list discovered candidates and exit")
+  parser.add_argument("--timeout", type=float, default=MUTANT_TIMEOUT, help="seconds a mutant's tests may run before it counts as killed")
+  parser.add_argument("--since", help="only mutate definitions changed since this git ref, e.g. origin/master")
+  parser.add_argument("--cache", action="store_true", help=f"reuse and update mutant outcomes cached in {CACHE_FILE.name}")
   parser.add_argument("--verbose", action="store_true", help="print extra debug output")
   args = parser.parse_args()
 
@@ -508,13 +782,20 @@ def main():
 
     mutator_summary = ", ".join(f"{name} ({c})" for name in MUTATOR_FAMILIES if (c := mutator_counts.get(name, 0)) > 0)
     print(f"Found {len(sites)} unique candidates: {mutator_summary}", flush=True)
+
+    if args.since is not None:
+      changed_lines = git_changed_lines(args.since)
+      sites = [s for s in sites if is_site_changed(s, changed_lines)]
+      print(f"Selected {len(sites)} candidates in definitions changed since {args.since}", flush=True)
+
     if args.list_only:
       for site in sites:
         mutation = format_mutation(site.original_op, site.mutated_op)
         print(f"  #{site.site_id:03d} {site.origin_file.relative_to(ROOT)}:{site.origin_line} [{site.mutator}] {mutation}")
       return 0
-
-    print(f"Running {len(sites)} mutants with {args.j} workers", flush=True)
+    if not sites:
+      print("No mutation candidates to run", flush=True)
+      return 0
 
     discovered_count = len(sites)
     selected_site_ids = {s.site_id for s in sites}
@@ -527,55 +808,46 @@ def main():
       print("Failed to build mutation library: all sites were pruned as build-incompatible", flush=True)
       return 2
 
-    mutation_lib = Path(run_tmp_dir) / "libsafety_mutation.so"
-    compile_mutated_library(preprocessed_source, sites, mutation_lib)
-
     # Discover all tests by importing modules in the main process.
     # Forked workers inherit these imports, eliminating per-worker import cost.
     catalog = _discover_test_catalog()
 
-    # Baseline smoke check
-    baseline_ids = catalog.get("test_defaults.py", [])[:5]
-    baseline_failed = run_unittest(baseline_ids, mutation_lib, mutant_id=-1, verbose=args.verbose)
-    if baseline_failed is not None:
-      print("Baseline smoke failed with mutant_id=-1; aborting to avoid false kill signals.", flush=True)
-      print(f"  failed_test: {baseline_failed}", flush=True)
-      return 2
-
-    # Pre-compute test targets per mutation site
-    core_tests = _build_core_tests(catalog)
-    site_targets = {site.site_id: build_priority_tests(site, catalog, core_tests) for site in sites}
-
-    results = []
-    counts = Counter()
-
-    with ProcessPoolExecutor(max_workers=args.j) as pool:
-      future_map = {
-        pool.submit(eval_mutant, site, site_targets[site.site_id], mutation_lib, args.verbose): site for site in sites
-      }
-      print_live_status(render_progress(0, len(sites), 0, 0, 0, 0.0))
-      try:
-        for fut in as_completed(future_map):
-          try:
-            res = fut.result()
-          except Exception:
-            site = future_map[fut]
-            res = MutantResult(site, "killed", 0.0, "worker process crashed")
-          results.append(res)
-          counts[res.outcome] += 1
-          elapsed_now = time.perf_counter() - start
-          done = len(results) == len(sites)
-          print_live_status(render_progress(len(results), len(sites), counts["killed"], counts["survived"],
-                                            counts["infra_error"], elapsed_now), final=done)
-      except Exception:
-        # Pool broken — mark all unfinished mutants as killed (crash = behavioral change detected)
-        completed_ids = {r.site.site_id for r in results}
-        for site in sites:
-          if site.site_id not in completed_ids:
-            results.append(MutantResult(site, "killed", 0.0, "pool broken"))
-            counts["killed"] += 1
-        elapsed_now = time.perf_counter() - start
-        print_live_status(render_progress(len(results), len(sites), counts["killed"], counts["survived"], counts["infra_error"], elapsed_now), final=True)
+    # Mutants whose definition and tests are unchanged since they last ran keep their outcome
+    catalog_hash = test_catalog_hash(catalog)
+    cache = load_cache(CACHE_FILE) if args.cache else {}
+    cached_outcomes = cache.get("outcomes", {}) if cache.get("catalog_hash") == catalog_hash else {}
+    test_kills = {test_id: tuple(stats) for test_id, stats in cache.get("test_kills", {}).items()}
+    site_keys = {s.site_id: site_cache_key(s, preprocessed_source) for s in sites}
+    cached_results = [MutantResult(s, cached_outcomes[site_keys[s.site_id]], 0.0, "cached") for s in sites if site_keys[s.site_id] in cached_outcomes]
+    sites_to_run = [s for s in sites if site_keys[s.site_id] not in cached_outcomes]
+    if args.cache:
+      print(f"Reusing {len(cached_results)} cached outcomes", flush=True)
+
+    run_results, site_targets = [], {}
+    if sites_to_run:
+      print(f"Running {len(sites_to_run)} mutants with {args.j} workers", flush=True)
+      mutation_lib = Path(run_tmp_dir) / "libsafety_mutation.so"
+      compile_mutated_library(preprocessed_source, sites_to_run, mutation_lib)
+
+      # Baseline smoke check
+      baseline_ids = catalog.get("test_defaults.py", [])[:5]
+      baseline_failed = run_unittest(baseline_ids, mutation_lib, mutant_id=-1, verbose=args.verbose)
+      if baseline_failed is not None:
+        print("Baseline smoke failed with mutant_id=-1; aborting to avoid false kill signals.", flush=True)
+        print(f"  failed_test: {baseline_failed}", flush=True)
+        return 2
+
+      run_results, site_targets = run_mutants(sites_to_run, catalog, mutation_lib, test_kills, args.j, args.verbose, start, args.timeout)
+
+    if args.cache:
+      # infra errors and mutants a broken pool didn't get to aren't outcomes
+      cached_outcomes.update({site_keys[r.site.site_id]: r.outcome for r in run_results
+                              if r.outcome != "infra_error" and r.details != "pool broken"})
+      update_test_kills(test_kills, run_results, site_targets)
+      save_cache(CACHE_FILE, catalog_hash, cached_outcomes, test_kills)
+
+    results = cached_results + run_results
+    counts = Counter(r.outcome for r in results)
 
     survivors = sorted((r for r in results if r.outcome == "survived"), key=lambda r: r.site.site_id)
     if survivors:
@@ -597,7 +869,7 @@ def main():
         print(f"- #{res.site.site_id} {loc}: {detail}", flush=True)
 
     elapsed = time.perf_counter() - start
-    total_test_sec = sum(r.test_sec for r in results)
+    total_test_sec = sum(r.test_sec for r in run_results)
     print("", flush=True)
     print(colorize("Mutation summary", ANSI_BOLD), flush=True)
     print(f"  discovered: {discovered_count}", flush=True)
@@ -606,9 +878,11 @@ def main():
     print(f"  killed: {colorize(str(counts['killed']), ANSI_GREEN)}", flush=True)
     print(f"  survived: {colorize(str(counts['survived']), ANSI_RED)}", flush=True)
     print(f"  infra_error: {colorize(str(counts['infra_error']), ANSI_YELLOW)}", flush=True)
+    print(f"  cached: {len(cached_results)}", flush=True)
     print(f"  test_time_sum: {total_test_sec:.2f}s", flush=True)
-    print(f"  avg_test_per_mutant: {total_test_sec / len(results):.3f}s", flush=True)
-    print(f"  mutants_per_second: {len(sites) / elapsed:.2f}", flush=True)
+    print(f"  avg_test_per_mutant: {total_test_sec / max(len(run_results), 1):.3f}s", flush=True)
+    print(f"  avg_tests_selected_per_mutant: {sum(len(t) for t in site_targets.values()) / max(len(site_targets), 1):.1f}", flush=True)
+    print(f"  mutants_per_second: {len(sites_to_run) / elapsed:.2f}", flush=True)
     print(f"  elapsed: {elapsed:.2f}s", flush=True)
 
     if counts["infra_error"] > 0:
@@ -621,6 +895,19 @@ def main():
       ("opendbc/safety/lateral.h", 195, "boundary"),
       ("opendbc/safety/lateral.h", 239, "boundary"),
       ("opendbc/safety/lateral.h", 337, "arithmetic"),
+      # equivalent in every safety mode: checksum hooks are NULL in pairs, no msg has a max_counter of 1,
+      # the other hooks are set wherever a msg checks them, and every mode has an init hook
+      ("opendbc/safety/safety.h", 216, "boundary"),
+      ("opendbc/safety/safety.h", 225, "boundary"),
+      ("opendbc/safety/safety.h", 233, "boundary"),
+      ("opendbc/safety/safety.h", 514, "boundary"),
+      # the rx check status after the msgs is zeroed before building the lookups, so it reads as an unused msg
+      ("opendbc/safety/safety.h", 150, "boundary"),
+      # only the panda counts heartbeat_engaged_mismatches
+      ("opendbc/safety/safety.h", 264, "remove_negation"),
+      # replayed packets set the extended flag like make_CANPacket, but no hook reads it
+      ("opendbc/safety/tests/libsafety/safety.c", 264, "comparison"),
+      ("opendbc/safety/tests/libsafety/safety.c", 264, "boundary"),
     }
     survivors = [r for r in survivors if (str(r.site.origin_file.relative_to(ROOT)), r.site.origin_line, r.site.mutator) not in known_survivors]
 
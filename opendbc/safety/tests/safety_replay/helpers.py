@@ -1,3 +1,5 @@
+import numpy as np
+
 from opendbc.car.ford.values import FordSafetyFlags
 from opendbc.car.hyundai.values import HyundaiSafetyFlags
 from opendbc.car.toyota.values import ToyotaSafetyFlags
@@ -107,3 +109,46 @@ def init_segment(safety, msgs, mode, param):
     safety.set_desired_angle_last(angle)
     safety.set_angle_meas(angle, angle)
   assert safety.safety_tx_hook(msg), "failed to initialize safety for segment"
+
+
+def pack_replay_msgs(can_msgs) -> tuple[np.ndarray, np.ndarray]:
+  """Packs the CAN msgs of sorted can and sendcan events into libsafety replay records, along with the logMonoTime of each.
+  Msgs we sent are skipped, and the safety tick runs with each event except during the first and last second of the route."""
+  start_t, end_t = can_msgs[0].logMonoTime, can_msgs[-1].logMonoTime
+  timers, addrs, types, srcs, ticks, lens, mono_times = [], [], [], [], [], [], []
+  data = bytearray()
+
+  def add(msg, tick, msg_type, addr=0, src=0, dat=b""):
+    timers.append((msg.logMonoTime // 1000) % 0xFFFFFFFF)
+    mono_times.append(msg.logMonoTime)
+    addrs.append(addr)
+    types.append(msg_type)
+    srcs.append(src)
+    ticks.append(tick)
+    lens.append(len(dat))
+    data.extend(dat.ljust(64, b"\x00"))
+
+  for msg in can_msgs:
+    # skip start and end of route, warm up/down period
+    tick = msg.logMonoTime - start_t > 1e9 and end_t - msg.logMonoTime > 1e9
+    if msg.which() == 'sendcan':
+      canmsgs, msg_type = msg.sendcan, libsafety_py.REPLAY_TX
+    else:
+      # ignore msgs we sent
+      canmsgs, msg_type = [m for m in msg.can if m.src < 128], libsafety_py.REPLAY_RX
+
+    for canmsg in canmsgs:
+      add(msg, tick, msg_type, canmsg.address, canmsg.src, canmsg.dat)
+      tick = False
+    if tick:
+      add(msg, tick, libsafety_py.REPLAY_NONE)
+
+  records = np.zeros(len(timers), dtype=libsafety_py.REPLAY_MSG_DTYPE)
+  records['timer'] = timers
+  records['addr'] = addrs
+  records['type'] = types
+  records['src'] = srcs
+  records['tick'] = ticks
+  records['len'] = lens
+  records['data'] = np.frombuffer(data, dtype=np.uint8).reshape(-1, 64)
+  return records, np.array(mono_times, dtype=np.uint64)
@@ -1,15 +1,34 @@
 #!/usr/bin/env python3
 import argparse
 from collections import Counter
-from tqdm import tqdm
+from dataclasses import dataclass, field
+
+import numpy as np
 
 from opendbc.car.carlog import carlog
 from opendbc.safety.tests.libsafety import libsafety_py
-from opendbc.safety.tests.safety_replay.helpers import package_can_msg, init_segment
+from opendbc.safety.tests.safety_replay.helpers import init_segment, pack_replay_msgs
 
 
-# replay a drive to check for safety violations
-def replay_drive(msgs, safety_mode, param, alternative_experience):
+@dataclass
+class ReplayStats:
+  rx_total: int
+  rx_invalid: int
+  tx_total: int
+  tx_blocked: int
+  tx_controls: int
+  tx_controls_blocked: int
+  safety_tick_rx_invalid: bool
+  blocked_addrs: Counter = field(default_factory=Counter)
+  invalid_addrs: set = field(default_factory=set)
+
+  @property
+  def ok(self) -> bool:
+    return self.tx_controls_blocked == 0 and self.rx_invalid == 0 and not self.safety_tick_rx_invalid
+
+
+def replay_msgs(msgs, safety_mode, param, alternative_experience) -> ReplayStats:
+  """Replays the CAN msgs of a drive through a safety mode, set_safety_hooks resets the state of any previous replay"""
   safety = libsafety_py.libsafety
   msgs.sort(key=lambda m: m.logMonoTime)
 
@@ -19,58 +38,48 @@ def replay_drive(msgs, safety_mode, param, alternative_experience):
 
   init_segment(safety, msgs, safety_mode, param)
 
-  rx_tot, rx_invalid, tx_tot, tx_blocked, tx_controls, tx_controls_blocked = 0, 0, 0, 0, 0, 0
-  safety_tick_rx_invalid = False
-  blocked_addrs = Counter()
-  invalid_addrs = set()
-
   can_msgs = [m for m in msgs if m.which() in ('can', 'sendcan')]
+  records, mono_times = pack_replay_msgs(can_msgs)
+  verdicts, counters = libsafety_py.replay(safety, records)
+
+  failed = (verdicts & libsafety_py.REPLAY_VERDICT_OK) == 0
+  blocked = failed & (records['type'] == libsafety_py.REPLAY_TX)
+  invalid = failed & (records['type'] == libsafety_py.REPLAY_RX)
+
   start_t = can_msgs[0].logMonoTime
-  end_t = can_msgs[-1].logMonoTime
-  for msg in tqdm(can_msgs):
-    safety.set_timer((msg.logMonoTime // 1000) % 0xFFFFFFFF)
-
-    # skip start and end of route, warm up/down period
-    if msg.logMonoTime - start_t > 1e9 and end_t - msg.logMonoTime > 1e9:
-      safety.safety_tick_current_safety_config()
-      safety_tick_rx_invalid |= not safety.safety_config_valid() or safety_tick_rx_invalid
-
-    if msg.which() == 'sendcan':
-      for canmsg in msg.sendcan:
-        _msg = package_can_msg(canmsg)
-        sent = safety.safety_tx_hook(_msg)
-        if not sent:
-          tx_blocked += 1
-          tx_controls_blocked += safety.get_controls_allowed()
-          blocked_addrs[canmsg.address] += 1
-
-          carlog.debug("blocked bus %d msg %d at %f" % (canmsg.src, canmsg.address, (msg.logMonoTime - start_t) / 1e9))
-        tx_controls += safety.get_controls_allowed()
-        tx_tot += 1
-    elif msg.which() == 'can':
-      # ignore msgs we sent
-      for canmsg in filter(lambda m: m.src < 128, msg.can):
-        safety.safety_fwd_hook(canmsg.src, canmsg.address)
-        _msg = package_can_msg(canmsg)
-        recv = safety.safety_rx_hook(_msg)
-        if not recv:
-          rx_invalid += 1
-          invalid_addrs.add(canmsg.address)
-        rx_tot += 1
+  for i in np.flatnonzero(blocked):
+    carlog.debug("blocked bus %d msg %d at %f" % (records['src'][i], records['addr'][i], (int(mono_times[i]) - start_t) / 1e9))
+
+  return ReplayStats(
+    rx_total=counters['rx_total'],
+    rx_invalid=counters['rx_invalid'],
+    tx_total=counters['tx_total'],
+    tx_blocked=counters['tx_blocked'],
+    tx_controls=counters['tx_controls'],
+    tx_controls_blocked=counters['tx_controls_blocked'],
+    safety_tick_rx_invalid=bool(counters['safety_tick_rx_invalid']),
+    blocked_addrs=Counter(records['addr'][blocked].tolist()),
+    invalid_addrs=set(records['addr'][invalid].tolist()),
+  )
+
+
+# replay a drive to check for safety violations
+def replay_drive(msgs, safety_mode, param, alternative_experience):
+  stats = replay_msgs(msgs, safety_mode, param, alternative_experience)
 
   print("\nRX")
-  print("total rx msgs:", rx_tot)
-  print("invalid rx msgs:", rx_invalid)
-  print("safety tick rx invalid:", safety_tick_rx_invalid)
-  print("invalid addrs:", invalid_addrs)
+  print("total rx msgs:", stats.rx_total)
+  print("invalid rx msgs:", stats.rx_invalid)
+  print("safety tick rx invalid:", stats.safety_tick_rx_invalid)
+  print("invalid addrs:", stats.invalid_addrs)
   print("\nTX")
-  print("total openpilot msgs:", tx_tot)
-  print("total msgs with controls allowed:", tx_controls)
-  print("blocked msgs:", tx_blocked)
-  print("blocked with controls allowed:", tx_controls_blocked)
-  print("blocked addrs:", blocked_addrs)
+  print("total openpilot msgs:", stats.tx_total)
+  print("total msgs with controls allowed:", stats.tx_controls)
+  print("blocked msgs:", stats.tx_blocked)
+  print("blocked with controls allowed:", stats.tx_controls_blocked)
+  print("blocked addrs:", stats.blocked_addrs)
 
-  return tx_controls_blocked == 0 and rx_invalid == 0 and not safety_tick_rx_invalid
+  return stats.ok
 
 
 if __name__ == "__main__":
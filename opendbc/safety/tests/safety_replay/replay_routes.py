@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+
+from opendbc.car.logreader import LogReader
+from opendbc.safety.tests.libsafety import libsafety_py
+from opendbc.safety.tests.safety_replay.replay_drive import replay_msgs
+
+# uncompressed or zstd compressed, as LogReader reads them
+RLOG_SUFFIXES = ('rlog', 'rlog.zst')
+COUNTERS = ('rx_total', 'rx_invalid', 'tx_total', 'tx_blocked', 'tx_controls', 'tx_controls_blocked')
+
+
+def find_routes(log_dir: str) -> list[str]:
+  """rlogs under a directory, compressed or not, relative to it"""
+  routes = []
+  for root, _, files in os.walk(log_dir):
+    for fn in files:
+      if fn.endswith(RLOG_SUFFIXES):
+        routes.append(os.path.relpath(os.path.join(root, fn), log_dir))
+  return sorted(routes)
+
+
+def _init_worker(libsafety_path: str) -> None:
+  libsafety_py.load(libsafety_path)
+
+
+def replay_route(log_dir: str, route: str, safety_mode: int, param: int, alternative_experience: int) -> dict:
+  """Replays one rlog in a worker, returning its result as JSON"""
+  result: dict = {'route': route, 'ok': False, 'load_time': 0., 'replay_time': 0., 'error': None}
+  try:
+    t = time.monotonic()
+    msgs = [m for m in LogReader(os.path.join(log_dir, route), only_union_types=True) if m.which() in ('can', 'sendcan')]
+    result['load_time'] = time.monotonic() - t
+
+    t = time.monotonic()
+    stats = replay_msgs(msgs, safety_mode, param, alternative_experience)
+    result['replay_time'] = time.monotonic() - t
+  except Exception:
+    result['error'] = traceback.format_exc()
+    return result
+
+  result.update(asdict(stats))
+  result['ok'] = stats.ok
+  result['blocked_addrs'] = {hex(addr): cnt for addr, cnt in sorted(stats.blocked_addrs.items())}
+  result['invalid_addrs'] = [hex(addr) for addr in sorted(stats.invalid_addrs)]
+  return result
+
+
+def merge_results(results: list[dict]) -> dict:
+  """Sums the counters and merges the blocked and invalid addresses of every replayed route"""
+  replayed = [r for r in results if r['error'] is None]
+  blocked_addrs: Counter = Counter()
+  invalid_addrs: set[str] = set()
+  for r in replayed:
+    blocked_addrs.update(r['blocked_addrs'])
+    invalid_addrs.update(r['invalid_addrs'])
+
+  totals = {c: sum(r[c] for r in replayed) for c in COUNTERS}
+  totals['safety_tick_rx_invalid'] = sum(r['safety_tick_rx_invalid'] for r in replayed)
+  totals['blocked_addrs'] = dict(sorted(blocked_addrs.items(), key=lambda kv: int(kv[0], 16)))
+  totals['invalid_addrs'] = sorted(invalid_addrs, key=lambda a: int(a, 16))
+  return {
+    'ok': all(r['ok'] for r in results),
+    'failed_routes': [r['route'] for r in results if not r['ok']],
+    'totals': totals,
+    'routes': results,
+  }
+
+
+def replay_routes(log_dir: str, safety_mode: int, param: int, alternative_experience: int = 0, workers: int | None = None) -> dict:
+  """Replays every rlog under log_dir through a safety mode, sharded across a process pool with one libsafety per worker"""
+  routes = find_routes(log_dir)
+  # built once, since workers would race compiling to the same object file
+  libsafety_path = libsafety_py.build()
+
+  t = time.monotonic()
+  with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(libsafety_path,)) as executor:
+    futures = [executor.submit(replay_route, log_dir, route, safety_mode, param, alternative_experience) for route in routes]
+    results = [f.result() for f in futures]
+
+  report = merge_results(results)
+  report['wall_time'] = time.monotonic() - t
+  return report
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Replay every rlog in a directory through a safety mode in parallel, and report the results as JSON",
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument("log_dir")
+  parser.add_argument("--mode", type=int, required=True, help="Safety mode to replay with")
+  parser.add_argument("--param", type=int, default=0, help="Safety param to replay with")
+  parser.add_argument("--alternative-experience", type=int, default=0)
+  parser.add_argument("--workers", type=int, help="Worker processes, defaults to the CPU count")
+  parser.add_argument("--output", help="Write the report here instead of stdout")
+  args = parser.parse_args()
+
+  report = replay_routes(args.log_dir, args.mode, args.param, args.alternative_experience, args.workers)
+  if args.output is None:
+    print(json.dumps(report, indent=2))
+  else:
+    with open(args.output, "w") as f:
+      json.dump(report, f, indent=2)
+  print(f"replayed {len(report['routes'])} routes in {report['wall_time']:.1f}s, {len(report['failed_routes'])} failed", file=sys.stderr)
+  sys.exit(0 if report['ok'] else 1)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import contextlib
+import io
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+from dataclasses import dataclass, field
+import zstandard as zstd
+
+from opendbc.can import CANPacker
+from opendbc.car.logreader import capnp_log
+from opendbc.car.structs import CarParams
+from opendbc.safety.tests.libsafety import libsafety_py
+from opendbc.safety.tests.safety_replay.helpers import init_segment, pack_replay_msgs, package_can_msg
+from opendbc.safety.tests.safety_replay.replay_drive import replay_drive, replay_msgs
+from opendbc.safety.tests.safety_replay.replay_routes import replay_routes
+
+
+@dataclass
+class CanMsg:
+  address: int
+  src: int
+  dat: bytes
+
+
+@dataclass
+class Event:
+  logMonoTime: int
+  event_type: str
+  can: list[CanMsg] = field(default_factory=list)
+  sendcan: list[CanMsg] = field(default_factory=list)
+
+  def which(self):
+    return self.event_type
+
+
+def make_route(seconds: int = 4, seed: int = 0) -> list[Event]:
+  """Toyota pt CAN at 100Hz with openpilot steering and some garbled msgs, engaging after two seconds"""
+  rnd = random.Random(seed)
+  packer = CANPacker("toyota_nodsu_pt_generated")
+  events = []
+  for frame in range(seconds * 100):
+    t = int(1e9) + frame * int(1e7)
+    engaged = frame > 200
+    can = [
+      packer.make_can_msg("PCM_CRUISE", 0, {"CRUISE_ACTIVE": engaged, "GAS_RELEASED": 1}),
+      packer.make_can_msg("STEER_TORQUE_SENSOR", 0, {"STEER_TORQUE_EPS": rnd.randint(-50, 50)}),
+      packer.make_can_msg("WHEEL_SPEEDS", 0, {f"WHEEL_SPEED_{n}": 30. for n in ("FR", "FL", "RR", "RL")}),
+      packer.make_can_msg("BRAKE_MODULE", 0, {"BRAKE_PRESSED": 0}),
+      packer.make_can_msg("PCM_CRUISE_2", 0, {}),
+      (rnd.randint(0, 0x7FF), bytes(rnd.randbytes(8)), rnd.randint(0, 2)),
+    ]
+    if frame % 50 == 0:
+      # bad checksum
+      addr, dat, bus = can[1]
+      can[1] = (addr, dat[:-1] + bytes([dat[-1] ^ 0xFF]), bus)
+    elif frame % 50 == 25:
+      # bad checksum on the camera bus, which isn't rx checked
+      addr, dat, _ = can[1]
+      can.append((addr, dat[:-1] + bytes([dat[-1] ^ 0xFF]), 2))
+    events.append(Event(t, 'can', can=[CanMsg(addr, bus, dat) for addr, dat, bus in can] + [CanMsg(0x2E4, 128, bytes(5))]))
+
+    torque = rnd.randint(-1600, 1600) if frame % 30 == 15 else 0
+    sendcan = [packer.make_can_msg("STEERING_LKA", 0, {"STEER_TORQUE_CMD": torque, "STEER_REQUEST": int(engaged)})]
+    events.append(Event(t + int(5e6), 'sendcan', sendcan=[CanMsg(addr, bus, dat) for addr, dat, bus in sendcan]))
+  events.append(Event(events[-1].logMonoTime + 1, 'sendcan'))
+  return events
+
+
+def write_rlog(fn: str, events: list[Event]) -> None:
+  dat = b""
+  for e in events:
+    evt = capnp_log.Event.new_message()
+    evt.logMonoTime = e.logMonoTime
+    canmsgs = evt.init(e.event_type, len(getattr(e, e.event_type)))
+    for c, msg in zip(canmsgs, getattr(e, e.event_type), strict=True):
+      c.address, c.src, c.dat = msg.address, msg.src, msg.dat
+    dat += evt.to_bytes()
+  with open(fn, "wb") as f:
+    f.write(zstd.compress(dat) if fn.endswith(".zst") else dat)
+
+
+def replay_reference(msgs, safety_mode, param):
+  """The hook sequence of replay_drive, one libsafety call at a time"""
+  safety = libsafety_py.libsafety
+  assert safety.set_safety_hooks(safety_mode, param) == 0
+  init_segment(safety, msgs, safety_mode, param)
+
+  rx_tot, rx_invalid, tx_tot, tx_blocked, tx_controls, tx_controls_blocked = 0, 0, 0, 0, 0, 0
+  safety_tick_rx_invalid = False
+  blocked_addrs = Counter()
+  invalid_addrs = set()
+
+  start_t, end_t = msgs[0].logMonoTime, msgs[-1].logMonoTime
+  for msg in msgs:
+    safety.set_timer((msg.logMonoTime // 1000) % 0xFFFFFFFF)
+    if msg.logMonoTime - start_t > 1e9 and end_t - msg.logMonoTime > 1e9:
+      safety.safety_tick_current_safety_config()
+      safety_tick_rx_invalid |= not safety.safety_config_valid()
+
+    if msg.which() == 'sendcan':
+      for canmsg in msg.sendcan:
+        if not safety.safety_tx_hook(package_can_msg(canmsg)):
+          tx_blocked += 1
+          tx_controls_blocked += safety.get_controls_allowed()
+          blocked_addrs[canmsg.address] += 1
+        tx_controls += safety.get_controls_allowed()
+        tx_tot += 1
+    else:
+      for canmsg in filter(lambda m: m.src < 128, msg.can):
+        safety.safety_fwd_hook(canmsg.src, canmsg.address)
+        if not safety.safety_rx_hook(package_can_msg(canmsg)):
+          rx_invalid += 1
+          invalid_addrs.add(canmsg.address)
+        rx_tot += 1
+
+  counters = {'rx_total': rx_tot, 'rx_invalid': rx_invalid, 'tx_total': tx_tot, 'tx_blocked': tx_blocked,
+              'tx_controls': tx_controls, 'tx_controls_blocked': tx_controls_blocked, 'safety_tick_rx_invalid': int(safety_tick_rx_invalid)}
+  return counters, blocked_addrs, invalid_addrs
+
+
+class TestSafetyReplay(unittest.TestCase):
+  def test_matches_per_msg_hooks(self):
+    route = make_route()
+    safety = libsafety_py.libsafety
+    for mode, param in ((CarParams.SafetyModel.toyota, 73), (CarParams.SafetyModel.noOutput, 0), (CarParams.SafetyModel.allOutput, 0)):
+      with self.subTest(mode=mode):
+        counters, blocked_addrs, invalid_addrs = replay_reference(route, mode, param)
+
+        assert safety.set_safety_hooks(mode, param) == 0
+        init_segment(safety, route, mode, param)
+        records, _ = pack_replay_msgs(route)
+        verdicts, batch_counters = libsafety_py.replay(safety, records)
+        assert batch_counters == counters
+        assert len(verdicts) == len(records)
+
+        failed = (verdicts & libsafety_py.REPLAY_VERDICT_OK) == 0
+        assert Counter(records['addr'][failed & (records['type'] == libsafety_py.REPLAY_TX)].tolist()) == blocked_addrs
+        assert set(records['addr'][failed & (records['type'] == libsafety_py.REPLAY_RX)].tolist()) == invalid_addrs
+
+        if mode == CarParams.SafetyModel.toyota:
+          # the route exercises both verdicts
+          assert 0 < counters['tx_blocked'] < counters['tx_total'] and 0 < counters['rx_invalid'] < counters['rx_total']
+
+  def test_replay_drive(self):
+    route = make_route()
+    counters, _, _ = replay_reference(route, CarParams.SafetyModel.toyota, 73)
+    expected = counters['tx_controls_blocked'] == 0 and counters['rx_invalid'] == 0 and not counters['safety_tick_rx_invalid']
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+      assert replay_drive(list(route), CarParams.SafetyModel.toyota, 73, 0) == expected
+    assert f"total rx msgs: {counters['rx_total']}\n" in out.getvalue()
+    assert f"blocked msgs: {counters['tx_blocked']}\n" in out.getvalue()
+
+  def test_replay_routes(self):
+    with tempfile.TemporaryDirectory() as log_dir:
+      routes = {f"route{i}/{fn}": make_route(seed=i) for i, fn in enumerate(("rlog", "rlog", "rlog.zst"))}
+      for route, events in routes.items():
+        os.makedirs(os.path.join(log_dir, os.path.dirname(route)))
+        write_rlog(os.path.join(log_dir, route), events)
+      # not rlogs, even if named after them
+      for fn in ("notes.txt", "rlog_report.json", "route0/rlog.idx.npz"):
+        open(os.path.join(log_dir, fn), "w").close()
+
+      report = replay_routes(log_dir, CarParams.SafetyModel.toyota, 73, workers=2)
+
+    assert [r['route'] for r in report['routes']] == list(routes)
+    assert all(r['error'] is None and r['replay_time'] > 0 for r in report['routes'])
+    expected = [replay_msgs(list(events), CarParams.SafetyModel.toyota, 73, 0) for events in routes.values()]
+    for r, stats in zip(report['routes'], expected, strict=True):
+      assert r['rx_total'] == stats.rx_total and r['tx_blocked'] == stats.tx_blocked
+      assert r['blocked_addrs'] == {hex(a): c for a, c in stats.blocked_addrs.items()}
+    assert report['totals']['rx_invalid'] == sum(s.rx_invalid for s in expected)
+    assert set(report['totals']['invalid_addrs']) == {hex(a) for s in expected for a in s.invalid_addrs}
+    assert report['ok'] == all(s.ok for s in expected)
+    assert report['failed_routes'] == [r for r, s in zip(routes, expected, strict=True) if not s.ok]
+
+
+if __name__ == "__main__":
+  unittest.main()
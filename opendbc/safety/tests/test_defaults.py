@@ -70,5 +70,49 @@ class TestAllOutputPassthrough(TestAllOutput):
     self.safety.init_tests()
 
 
+class TestSafetyLookup(common.SafetyTestBase):
+  # not a safety mode, so no tx msgs to check the others against
+  TX_MSGS = None
+  SAFETY_LOOKUP_MAX = 64  # declarations.h
+
+  def setUp(self):
+    self.safety = libsafety_py.libsafety
+    self.safety.set_safety_hooks(CarParams.SafetyModel.noOutput, 0)
+    self.safety.init_tests()
+    self.assertEqual(0, self.safety.set_lookup_test_config(2))
+
+  def test_max_entries(self):
+    self.assertEqual(0, self.safety.set_lookup_test_config(self.SAFETY_LOOKUP_MAX))
+    self.assertEqual(-1, self.safety.set_lookup_test_config(self.SAFETY_LOOKUP_MAX + 1))
+
+  def test_duplicate_keys(self):
+    # 0x100 on bus 1 is also the first check's second msg, but that check is on bus 0 by then, so it goes to the second check
+    self.assertTrue(self._rx(common.make_msg(0, 0x100)))
+    self.assertTrue(self._rx(common.make_msg(1, 0x100)))
+    self.assertTrue(self.safety.safety_config_valid())
+
+    # setting the config again resets what was seen
+    self.assertEqual(0, self.safety.set_lookup_test_config(2))
+    self.assertFalse(self.safety.safety_config_valid())
+
+  def test_first_msg_seen(self):
+    # the first check takes 0x100 on bus 1, and then only checks that one
+    self.assertTrue(self._rx(common.make_msg(1, 0x100)))
+    self.assertTrue(self._rx(common.make_msg(0, 0x100)))
+    self.assertFalse(self.safety.safety_config_valid())
+
+  def test_fwd_blocked(self):
+    # any tx msg to the address and bus that checks the relay blocks forwarding to it
+    self.assertEqual(-1, self.safety.safety_fwd_hook(2, 0x200))
+    self.assertEqual(0, self.safety.safety_fwd_hook(2, 0x201))
+
+  def test_unused_rx_check_msgs(self):
+    # the unused msgs of a check are all zeros, which an empty msg to 0x0 must not be taken for
+    self.assertTrue(self._rx(common.make_msg(0, 0x0, 0)))
+    self.assertTrue(self._rx(common.make_msg(0, 0x100)))
+    self.assertTrue(self._rx(common.make_msg(1, 0x100)))
+    self.assertTrue(self.safety.safety_config_valid())
+
+
 if __name__ == "__main__":
   unittest.main()